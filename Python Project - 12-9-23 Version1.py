@@ -1,42 +1,4492 @@
+import time
+
+STARTUP_STARTED = time.perf_counter()  # Taken before the other imports so the startup report covers them
+
+import abc
+import argparse
+import array
+import atexit
+import bisect
+import collections
+import contextlib
+import csv
+import heapq
+import itertools
+import json
+import mmap
+import operator
+import os
+import queue
+import re
+import shutil
+import struct
+import threading
+import zlib
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
+# Only needed by some paths, so imported where they are used to keep startup short:
+# concurrent.futures and multiprocessing (bulk import), sqlite3 (the SQLite backend),
+# tkinter.filedialog (import/export dialogs) and platform, random, statistics, subprocess
+# and tempfile (--benchmark)
 
 DATA_FILE = 'video.txt'
 CUSTOMER_DATA_FILE = 'customer.txt'
+RENTAL_LEDGER_FILE = 'rentals.ledger'
+RENTAL_PERIOD_DAYS = 3  # A rental is due back this many days after checkout
+# The overdue scheduler wakes at the next due time, and at least this often (after a clock
+# change or a suspended machine the next due time may have moved)
+OVERDUE_MAX_WAIT_MS = 60000
+ANALYTICS_FILE = 'rental_analytics.json'
+
+# Only materialize the rows in (and just around) the visible part of the video Treeview
+VIRTUALIZE_TREEVIEW = True
+VIRTUAL_OVERSCAN = 10  # Extra rows kept materialized above and below the viewport
+
+# Re-run the video search while typing, once the keystrokes pause for this long
+SEARCH_AS_YOU_TYPE = True
+SEARCH_DEBOUNCE_MS = 120
+
+# Append one journal record per change instead of rewriting the data files, and fold the
+# journal back into a fresh snapshot in the background once it grows past the threshold
+JOURNAL_MODE = True
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+
+# Several clerks can run against the same journaled text files; each one checks the journals
+# for the others' changes this often
+SHARED_WATCH_MS = 1000
+# A snapshot owed after a bulk change is retried on every check while another clerk is
+# writing one; on exit it is waited for this long before giving up
+SHARED_CLOSE_WAIT_SECONDS = 10
+
+# Rent/return of several videos at once: at most this many failed items are listed
+BATCH_REPORT_LINES = 15
+
+# --headless serves the catalog as HTTP/JSON instead of opening a window. Changes queue up
+# for a single writer, which applies everything queued and then saves once; reads are
+# answered straight from the in-memory indexes.
+API_HOST = '127.0.0.1'
+API_PORT = 8080
+API_PAGE_SIZE = 100  # Rows per page of a listing unless ?limit= says otherwise
+API_MAX_PAGE = 1000
+API_MAX_BODY = 1024 * 1024
+API_QUEUE_SIZE = 10000  # Changes waiting for the writer; more make clients wait
+
+# All writes go through one background thread; a full queue makes the UI wait for it
+PERSIST_QUEUE_SIZE = 10000
+PERSIST_POLL_MS = 100  # How often the UI picks up completed writes and errors
+
+# Where the catalog lives: 'text' (DATA_FILE/CUSTOMER_DATA_FILE), 'sqlite' (SQLITE_DATABASE) or
+# 'mmap' (videos in the fixed-width MAPPED_VIDEO_FILE, customers as text). The database or
+# record file is created from the text files the first time it is opened.
+STORAGE_BACKEND = 'text'
+SQLITE_DATABASE = 'video_store.db'
+MAPPED_VIDEO_FILE = 'video.dat'
+MAPPED_VIDEO_WIDTHS = {'ID': 16, 'Name': 200, 'Director': 100, 'Genre': 32, 'Status': 16}  # Bytes of UTF-8
+
+# Startup loading is streamed into the tabs in batches, one time slice per Tk callback
+LOAD_BATCH_ROWS = 2000
+LOAD_SLICE_MS = 15
+
+# Matches listed under the type-ahead customer/video pickers of the rent dialog
+PICKER_MATCHES = 20
+PREFIX_MERGE_THRESHOLD = 200  # More terms added than this since the last lookup are merged in one pass
+
+# Filter bar/FilterEngine conditions are evaluated as masks over whole columns, with NumPy
+# when it is installed. Catalogs of at least FILTER_PARALLEL_ROWS rows can be split across
+# FILTER_PROCESSES worker processes (0 evaluates every filter in this process).
+FILTER_USE_NUMPY = True
+FILTER_PROCESSES = 0
+FILTER_PARALLEL_ROWS = 2000000
+
+# Facet panel of the video tab: how many values of each facet it lists, most common first
+FACET_LIMIT = 15
+
+# Analytics tab: rows in each top list, days of daily volume shown, and how often the
+# aggregates are saved while they change
+ANALYTICS_TOP = 20
+ANALYTICS_DAYS = 30
+ANALYTICS_SAVE_MS = 30000
+
+# Bulk imports are parsed and validated in a separate process; the UI checks on it this often
+IMPORT_POLL_MS = 100
+
+# Timings of the hot paths and of the Tk event loop's lag, written to METRICS_FILE now and then
+METRICS_ENABLED = True
+METRICS_FILE = 'metrics.json'
+METRICS_EXPORT_MS = 10000
+LAG_PROBE_MS = 100  # How often the event-loop lag probe asks to run
+LAG_STALL_MS = 250  # A probe this late counts as a stall (the window felt frozen)
+
+# --benchmark: catalog sizes (the large ones take minutes and several GB, so only with
+# --large), repetitions of the quick operations, and how much slower than the baseline a
+# measurement may get before it counts as a regression
+BENCHMARK_SIZES = (1000, 10000)
+BENCHMARK_LARGE_SIZES = (100000, 1000000)
+BENCHMARK_REPEAT = 5
+BENCHMARK_BASELINE = 'benchmark_baseline.json'
+BENCHMARK_TOLERANCE = 0.25
+
+VIDEO_COLUMNS = ['ID', 'Name', 'Year', 'Director', 'Rating', 'Genre', 'Status']
+VIDEO_COLUMN_TYPES = {'Year': int, 'Rating': float}  # Columns not listed hold text
+VIDEO_CATEGORICAL_COLUMNS = ('Director', 'Genre', 'Status')  # Few distinct values, stored as codes
+VIDEO_STATUSES = ('Available', 'Rented')
+CUSTOMER_COLUMNS = ['ID', 'First Name', 'Last Name', 'Address', 'Phone Number', 'Email Address']
+# Older column orders of the text data files: the first version's video.txt has Genre before
+# Rating. Rows that only load in an older order are read in it, and the file is rewritten.
+LEGACY_LAYOUTS = {tuple(VIDEO_COLUMNS): (['ID', 'Name', 'Year', 'Director', 'Genre', 'Rating', 'Status'],)}
+
+
+class DuplicateKeyError(ValueError):
+    pass
+
+
+class ObjectColumn(list):
+    # Column holding one Python object per row, for unique text like ID and Name (the
+    # hash indexes keep those strings alive anyway, so encoding them would save nothing)
+    def take(self, positions):
+        return ObjectColumn(self[position] for position in positions)
+
+    def part(self, start, stop):
+        return ObjectColumn(self[start:stop])
+
+    def snapshot(self):
+        return list(self)
+
+
+class NumberColumn:
+    # Column of ints or floats packed into a typed array, 8 bytes per row instead of a
+    # pointer plus a boxed number. Holes are stored as 0; the ID column tells them apart.
+    def __init__(self, column_type, values=()):
+        self.column_type = column_type
+        self.data = array.array('q' if column_type is int else 'd', values)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __getitem__(self, position):
+        return self.data[position]
+
+    def __setitem__(self, position, value):
+        self.data[position] = 0 if value is None else value
+
+    def append(self, value):
+        self.data.append(0 if value is None else value)
+
+    def clear(self):
+        del self.data[:]
+
+    def take(self, positions):
+        data = self.data
+        return NumberColumn(self.column_type, (data[position] for position in positions))
+
+    def part(self, start, stop):
+        column = NumberColumn(self.column_type)
+        column.data = self.data[start:stop]
+        return column
+
+    def snapshot(self):
+        return NumberColumn(self.column_type, self.data)
+
+
+class DictionaryColumn:
+    # Dictionary-encoded column: each distinct value is stored once and every row holds its
+    # code in a typed array, 1-4 bytes per row. Code 0 is the hole left by a delete. The
+    # array widens itself when the dictionary outgrows the current code size.
+    def __init__(self, values=()):
+        self.dictionary = [None]  # Code -> value
+        self.codes_by_value = {}
+        self.codes = array.array('B')
+        for value in values:
+            self.append(value)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        dictionary = self.dictionary
+        return (dictionary[code] for code in self.codes)
+
+    def __getitem__(self, position):
+        return self.dictionary[self.codes[position]]
+
+    def __setitem__(self, position, value):
+        code = self.encode(value)  # May replace self.codes with a wider array
+        self.codes[position] = code
+
+    def append(self, value):
+        code = self.encode(value)
+        self.codes.append(code)
+
+    def encode(self, value):
+        if value is None:
+            return 0
+        code = self.codes_by_value.get(value)
+        if code is None:
+            code = len(self.dictionary)
+            self.dictionary.append(value)
+            self.codes_by_value[value] = code
+            if code > 255 and self.codes.typecode == 'B':
+                self.codes = array.array('H', self.codes)
+            elif code > 65535 and self.codes.typecode == 'H':
+                self.codes = array.array('I', self.codes)
+        return code
+
+    def clear(self):
+        self.dictionary = [None]
+        self.codes_by_value = {}
+        self.codes = array.array('B')
+
+    def take(self, positions):
+        # Re-encoding also drops the values no row uses any more
+        return DictionaryColumn(self[position] for position in positions)
+
+    def part(self, start, stop):
+        # Rows start..stop for reading only, sharing the dictionary
+        column = DictionaryColumn()
+        column.dictionary = self.dictionary
+        column.codes = self.codes[start:stop]
+        return column
+
+    def snapshot(self):
+        # Codes are never reassigned, so a copy of both lists is a consistent picture
+        column = DictionaryColumn()
+        column.dictionary = list(self.dictionary)
+        column.codes = array.array(self.codes.typecode, self.codes)
+        return column
+
+
+def make_column(column_type=None, categorical=False):
+    if column_type in (int, float):
+        return NumberColumn(column_type)
+    if categorical:
+        return DictionaryColumn()
+    return ObjectColumn()
+
+
+class RowView:
+    # Read-only view of one stored record that reads values straight from the columns,
+    # so iterating a large store creates no per-row lists or dicts. A view stays valid
+    # until the store is next compacted.
+    __slots__ = ('store', 'position')
+
+    def __init__(self, store, position):
+        self.store = store
+        self.position = position
+
+    def __getitem__(self, column):
+        return self.store.columns[column][self.position]
+
+    def get(self, column, default=None):
+        if column not in self.store.columns:
+            return default
+        return self.store.columns[column][self.position]
+
+    def keys(self):
+        return self.store.keys()
+
+    def values(self):
+        return [self.store.columns[name][self.position] for name in self.store.column_names]
+
+
+class RecordStore:
+    # Column-oriented table of records (one list per column, like the old dict of parallel
+    # lists) with a hash index on the primary key and on each unique secondary key, so
+    # lookups by ID or Name are O(1). Deleted rows are left as holes and the columns are
+    # compacted once the holes make up half of the table, which keeps deletes O(1) amortized
+    # and preserves the catalog order. Typed columns live in typed arrays and the
+    # `categorical` columns are dictionary-encoded (see make_column).
+    COMPACT_MIN_HOLES = 1024
+
+    def __init__(self, columns, primary_key='ID', unique_keys=(), types=None, categorical=()):
+        self.column_names = list(columns)
+        self.primary_key = primary_key
+        self.types = dict(types or {})  # Column -> int/float; values are converted on the way in
+        self.categorical = tuple(categorical)
+        self.unique_keys = [primary_key] + [key for key in unique_keys if key != primary_key]
+        self.columns = {name: make_column(self.types.get(name), name in self.categorical)
+                        for name in self.column_names}
+        self.indexes = {key: {} for key in self.unique_keys}  # Key value -> row position
+        self.holes = 0
+        self.listeners = []
+        self.checks = []  # check(record) raising ValueError, run before a record is added or changed
+
+    def subscribe(self, callback):
+        # callback(event, record_id, old_record, new_record) with event in add/update/delete/clear
+        self.listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        self.listeners.remove(callback)
+
+    def notify(self, event, record_id, old_record, new_record):
+        for callback in self.listeners:
+            callback(event, record_id, old_record, new_record)
+
+    def keys(self):
+        return list(self.column_names)
+
+    def __len__(self):
+        return len(self.columns[self.primary_key]) - self.holes
+
+    def __contains__(self, record_id):
+        return record_id in self.indexes[self.primary_key]
+
+    def __iter__(self):
+        return iter(self.ids())
+
+    def ids(self):
+        # Record IDs in catalog order
+        return [record_id for record_id in self.columns[self.primary_key] if record_id is not None]
+
+    def rows(self):
+        # Value lists in catalog order, skipping deleted rows
+        columns = [self.columns[name] for name in self.column_names]
+        for position, record_id in enumerate(self.columns[self.primary_key]):
+            if record_id is not None:
+                yield [column[position] for column in columns]
+
+    def views(self):
+        # RowView of every record in catalog order
+        for position, record_id in enumerate(self.columns[self.primary_key]):
+            if record_id is not None:
+                yield RowView(self, position)
+
+    def view(self, record_id):
+        return RowView(self, self.indexes[self.primary_key][record_id])
+
+    def snapshot(self):
+        # Independent copies of the columns (holes included), cheap for the encoded ones,
+        # for handing the current contents to another thread
+        return [self.columns[name].snapshot() for name in self.column_names]
+
+    def scan(self, column):
+        # (record ID, value) pairs of one column in catalog order
+        for record_id, value in zip(self.columns[self.primary_key], self.columns[column]):
+            if record_id is not None:
+                yield record_id, value
+
+    def values(self, record_id):
+        position = self.indexes[self.primary_key][record_id]
+        return [self.columns[name][position] for name in self.column_names]
+
+    def get(self, record_id):
+        if record_id not in self:
+            return None
+        return dict(zip(self.column_names, self.values(record_id)))
+
+    def value(self, record_id, column):
+        return self.columns[column][self.indexes[self.primary_key][record_id]]
+
+    def find(self, column, value):
+        # Record ID of the row whose unique `column` equals `value`, or None
+        position = self.indexes[column].get(value)
+        if position is None:
+            return None
+        return self.columns[self.primary_key][position]
+
+    def convert(self, record):
+        # Parse the typed columns of a record (in place), e.g. '1994' -> 1994 for Year
+        for name, column_type in self.types.items():
+            value = record.get(name)
+            if isinstance(value, column_type) and not isinstance(value, bool):
+                continue
+            try:
+                record[name] = column_type(value)
+                if column_type is int and not -2 ** 63 <= record[name] < 2 ** 63:
+                    raise ValueError
+            except (TypeError, ValueError):
+                kind = 'a whole number' if column_type is int else 'a number'
+                raise ValueError(f"{name} must be {kind}, not '{value}'.")
+        return record
+
+    def check_unique(self, record, ignore_id=None):
+        for key in self.unique_keys:
+            position = self.indexes[key].get(record[key])
+            if position is not None and self.columns[self.primary_key][position] != ignore_id:
+                raise DuplicateKeyError(f"A record with {key} '{record[key]}' already exists.")
+
+    def add(self, values):
+        # Append a record given as a list in column order (or a dict); returns its ID
+        record = dict(values) if isinstance(values, dict) else dict(zip(self.column_names, values))
+        if not record.get(self.primary_key):
+            raise ValueError(f"{self.primary_key} must not be empty.")
+        self.convert(record)
+        self.check_unique(record)
+        for check in self.checks:
+            check(record)
+        position = len(self.columns[self.primary_key])
+        for name in self.column_names:
+            self.columns[name].append(record.get(name, ''))
+        for key in self.unique_keys:
+            self.indexes[key][record[key]] = position
+        if self.listeners:
+            self.notify('add', record[self.primary_key], None, self.get(record[self.primary_key]))
+        return record[self.primary_key]
+
+    def update(self, record_id, changes):
+        # Apply a dict of column -> value to one record; returns its (possibly new) ID
+        position = self.indexes[self.primary_key][record_id]
+        old_record = dict(zip(self.column_names, self.values(record_id)))
+        record = dict(old_record)
+        record.update(changes)
+        if not record.get(self.primary_key):
+            raise ValueError(f"{self.primary_key} must not be empty.")
+        self.convert(record)
+        self.check_unique(record, ignore_id=record_id)
+        for check in self.checks:
+            check(record)
+        for key in self.unique_keys:
+            old_value = self.columns[key][position]
+            if record[key] != old_value:
+                del self.indexes[key][old_value]
+                self.indexes[key][record[key]] = position
+        for name in changes:
+            self.columns[name][position] = record[name]
+        if self.listeners:
+            self.notify('update', record_id, old_record, record)
+        return record[self.primary_key]
+
+    def set_value(self, record_id, column, value):
+        return self.update(record_id, {column: value})
+
+    def delete(self, record_id):
+        position = self.indexes[self.primary_key][record_id]
+        old_record = self.get(record_id) if self.listeners else None
+        for key in self.unique_keys:
+            del self.indexes[key][self.columns[key][position]]
+        for name in self.column_names:
+            self.columns[name][position] = None
+        self.holes += 1
+        if self.holes >= self.COMPACT_MIN_HOLES and self.holes * 2 >= len(self.columns[self.primary_key]):
+            self.compact()
+        if self.listeners:
+            self.notify('delete', record_id, old_record, None)
+
+    def compact(self):
+        # Drop the holes left by deletes and renumber the indexes
+        keep = [position for position, record_id in enumerate(self.columns[self.primary_key])
+                if record_id is not None]
+        for name in self.column_names:
+            self.columns[name] = self.columns[name].take(keep)
+        for key in self.unique_keys:
+            self.indexes[key] = {value: position for position, value in enumerate(self.columns[key])}
+        self.holes = 0
+
+    def clear(self):
+        for name in self.column_names:
+            self.columns[name].clear()
+        for key in self.unique_keys:
+            self.indexes[key].clear()
+        self.holes = 0
+        if self.listeners:
+            self.notify('clear', None, None, None)
+
+
+class NgramIndex:
+    # Inverted index from character trigrams to the records whose (lowercased) field text
+    # contains them. A substring query intersects the posting sets of its own trigrams,
+    # starting from the smallest, so the cost follows the number of candidates rather than
+    # the size of the catalog. Records are numbered in the order they are added, which is
+    # the catalog order, so results can be returned in that order.
+    def __init__(self, fields, n=3):
+        self.fields = list(fields)
+        self.n = n
+        self.postings = {field: {} for field in self.fields}  # Field -> gram -> set of doc numbers
+        self.texts = {field: {} for field in self.fields}  # Field -> doc number -> lowercased text
+        self.docs = {}  # Record ID -> doc number
+        self.record_ids = {}  # Doc number -> record ID
+        self.next_doc = 0
+
+    def grams(self, text):
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def on_change(self, event, record_id, old_record, new_record):
+        # RecordStore listener: keep the index in step with every add, edit and delete
+        if event == 'add':
+            self.add(record_id, new_record)
+        elif event == 'update':
+            self.update(record_id, new_record)
+        elif event == 'delete':
+            self.remove(record_id)
+        elif event == 'clear':
+            self.clear()
+
+    def add(self, record_id, record):
+        doc = self.next_doc
+        self.next_doc += 1
+        self.docs[record_id] = doc
+        self.record_ids[doc] = record_id
+        for field in self.fields:
+            self.index_field(field, doc, str(record.get(field, '')).lower())
+
+    def update(self, record_id, record):
+        # Only fields whose text changed are reindexed; the record keeps its doc number
+        doc = self.docs.pop(record_id)
+        new_id = record.get('ID', record_id)
+        self.docs[new_id] = doc
+        self.record_ids[doc] = new_id
+        for field in self.fields:
+            text = str(record.get(field, '')).lower()
+            if text != self.texts[field][doc]:
+                self.unindex_field(field, doc)
+                self.index_field(field, doc, text)
+
+    def remove(self, record_id):
+        doc = self.docs.pop(record_id, None)
+        if doc is None:
+            return
+        del self.record_ids[doc]
+        for field in self.fields:
+            self.unindex_field(field, doc)
+
+    def clear(self):
+        for field in self.fields:
+            self.postings[field].clear()
+            self.texts[field].clear()
+        self.docs.clear()
+        self.record_ids.clear()
+        self.next_doc = 0
+
+    def index_field(self, field, doc, text):
+        self.texts[field][doc] = text
+        postings = self.postings[field]
+        for gram in self.grams(text):
+            docs = postings.get(gram)
+            if docs is None:
+                postings[gram] = {doc}
+            else:
+                docs.add(doc)
+
+    def unindex_field(self, field, doc):
+        text = self.texts[field].pop(doc)
+        postings = self.postings[field]
+        for gram in self.grams(text):
+            docs = postings[gram]
+            docs.discard(doc)
+            if not docs:
+                del postings[gram]
+
+    def search(self, query, fields=None):
+        # Record IDs, in catalog order, whose text in any of `fields` contains `query`
+        query = query.lower()
+        matches = set()
+        for field in fields or self.fields:
+            matches |= self.search_field(field, query)
+        return [self.record_ids[doc] for doc in sorted(matches)]
+
+    def matches(self, record_id, query, fields=None):
+        # Whether search(query) would return this record, without searching the others
+        doc = self.docs.get(record_id)
+        query = query.lower()
+        return doc is not None and any(query in self.texts[field][doc] for field in fields or self.fields)
+
+    def search_field(self, field, query):
+        texts = self.texts[field]
+        if len(query) < self.n:
+            # Too short to have a trigram of its own; fall back to checking every text
+            return {doc for doc, text in texts.items() if query in text}
+        postings = self.postings[field]
+        candidate_sets = sorted((postings.get(gram, set()) for gram in self.grams(query)), key=len)
+        if not candidate_sets[0]:
+            return set()
+        candidates = candidate_sets[0].intersection(*candidate_sets[1:])
+        if len(query) == self.n:
+            return candidates  # The posting set of a single trigram is already exact
+        return {doc for doc in candidates if query in texts[doc]}
+
+
+def natural_key(value):
+    # Sort key for IDs: numeric IDs in numeric order, then any other IDs as text
+    text = str(value)
+    return (0, int(text), '') if text.isdigit() else (1, 0, text)
+
+
+class SortIndex:
+    # Cached sort permutations of a RecordStore, one per column that has been sorted on.
+    # Each permutation is a sorted list of (typed key, catalog sequence, record ID) that is
+    # kept up to date from the store's change events with a bisect insert/remove, so a
+    # re-sort or an ascending/descending toggle is an O(n) walk instead of a full sort.
+    # Ties keep catalog order in both directions, which makes multi-column sorts stable.
+    def __init__(self, store, key_functions=None):
+        self.store = store
+        self.key_functions = dict(key_functions or {})  # Column -> function making its sort key
+        self.permutations = {}
+        self.seq = {}  # Record ID -> catalog sequence number, the tie breaker
+        self.next_seq = 0
+        for record_id in store.ids():
+            self.assign_seq(record_id)
+        store.subscribe(self.on_change)
+
+    def assign_seq(self, record_id):
+        self.seq[record_id] = self.next_seq
+        self.next_seq += 1
+
+    def sort_key(self, column, value):
+        key_function = self.key_functions.get(column)
+        return key_function(value) if key_function else value
+
+    def on_change(self, event, record_id, old_record, new_record):
+        if event == 'add':
+            self.assign_seq(record_id)
+            for column, permutation in self.permutations.items():
+                bisect.insort(permutation, (self.sort_key(column, new_record[column]), self.seq[record_id], record_id))
+        elif event == 'update':
+            new_id = new_record[self.store.primary_key]
+            seq = self.seq.pop(record_id)
+            self.seq[new_id] = seq
+            for column, permutation in self.permutations.items():
+                if new_id == record_id and old_record[column] == new_record[column]:
+                    continue
+                self.remove_entry(permutation, (self.sort_key(column, old_record[column]), seq, record_id))
+                bisect.insort(permutation, (self.sort_key(column, new_record[column]), seq, new_id))
+        elif event == 'delete':
+            seq = self.seq.pop(record_id)
+            for column, permutation in self.permutations.items():
+                self.remove_entry(permutation, (self.sort_key(column, old_record[column]), seq, record_id))
+        elif event == 'clear':
+            self.permutations.clear()
+            self.seq.clear()
+            self.next_seq = 0
+
+    @staticmethod
+    def remove_entry(permutation, entry):
+        position = bisect.bisect_left(permutation, entry)
+        if position < len(permutation) and permutation[position] == entry:
+            del permutation[position]
+
+    def permutation(self, column):
+        # Built on first use, then maintained incrementally
+        permutation = self.permutations.get(column)
+        if permutation is None:
+            permutation = sorted((self.sort_key(column, value), self.seq[record_id], record_id)
+                                 for record_id, value in self.store.scan(column))
+            self.permutations[column] = permutation
+        return permutation
+
+    def ordered_ids(self, column, ascending=True):
+        permutation = self.permutation(column)
+        if ascending:
+            return [entry[2] for entry in permutation]
+        # Descending by key, but equal keys stay in catalog order
+        ids = []
+        end = len(permutation)
+        while end:
+            start = end - 1
+            key = permutation[start][0]
+            while start and permutation[start - 1][0] == key:
+                start -= 1
+            ids.extend(entry[2] for entry in permutation[start:end])
+            end = start
+        return ids
+
+    def sorted_ids(self, sort_keys, subset=None):
+        # sort_keys is a list of (column, ascending), most significant first. Without a
+        # subset the whole catalog is returned; otherwise only the given IDs.
+        column, ascending = sort_keys[-1]
+        if subset is None:
+            ids = self.ordered_ids(column, ascending)
+        elif len(subset) * max(1, len(subset).bit_length()) < len(self.store):
+            # Few rows: sorting them directly beats walking the whole permutation
+            ids = sorted(subset, key=self.seq.__getitem__)
+            ids.sort(key=lambda record_id: self.sort_key(column, self.store.value(record_id, column)),
+                     reverse=not ascending)
+        else:
+            members = set(subset)
+            ids = [record_id for record_id in self.ordered_ids(column, ascending) if record_id in members]
+        # More significant columns are applied as stable sorts on top
+        for column, ascending in reversed(sort_keys[:-1]):
+            ids.sort(key=lambda record_id: self.sort_key(column, self.store.value(record_id, column)),
+                     reverse=not ascending)
+        return ids
+
+
+NON_DIGITS = re.compile(r'\D+')
+PHONE_LIKE = re.compile(r'[\d\s().+-]*\d[\d\s().+-]*$')
+
+
+def digits_only(text):
+    return NON_DIGITS.sub('', text)
+
+
+# What a record can be picked by in the rent dialog: the columns handed to the terms function
+CUSTOMER_SEARCH_COLUMNS = ('ID', 'First Name', 'Last Name', 'Email Address', 'Phone Number')
+VIDEO_SEARCH_COLUMNS = ('ID', 'Name')
+
+
+def customer_search_terms(customer_id, first, last, email, phone):
+    # Full name either way round, so also by first or last name alone
+    return customer_id, f"{first} {last}", f"{last} {first}", email, digits_only(phone)
+
+
+def video_search_terms(video_id, name):
+    return video_id, name
+
+
+class PrefixIndex:
+    # Sorted lowercased terms (a few per record) with the record ID of each in a parallel
+    # list, for type-ahead pickers. A prefix lookup is a bisect to the first matching term
+    # followed by a walk that stops after `limit` distinct records, so each keystroke costs
+    # O(log n + limit) however large the catalog is. Like SortIndex it is built on first use
+    # (nothing to maintain while a catalog loads) and then kept up to date from the store's
+    # change events; added terms wait in `pending` until the next lookup, so a bulk import
+    # is merged in one pass instead of one list insert per term.
+    def __init__(self, store, columns, terms):
+        self.store = store
+        self.columns = list(columns)
+        self.terms = terms  # Function from the values of `columns` to the strings a record is found by
+        self.keys = None  # Sorted terms
+        self.record_ids = None  # Record ID of each term
+        self.pending = []  # (term, record ID) added since the last lookup
+        store.subscribe(self.on_change)
+
+    def record_terms(self, record):
+        return self.term_set([record[column] for column in self.columns])
+
+    def term_set(self, values):
+        return {term.lower() for term in self.terms(*values) if term}
+
+    def on_change(self, event, record_id, old_record, new_record):
+        if event == 'clear':
+            self.keys = self.record_ids = None
+            self.pending = []
+        elif self.keys is None:
+            return
+        elif event == 'add':
+            for term in self.record_terms(new_record):
+                self.insert(term, record_id)
+        elif event == 'update':
+            old_terms = self.record_terms(old_record)
+            new_id = new_record[self.store.primary_key]
+            new_terms = self.record_terms(new_record)
+            for term in old_terms if new_id != record_id else old_terms - new_terms:
+                self.remove(term, record_id)
+            for term in new_terms if new_id != record_id else new_terms - old_terms:
+                self.insert(term, new_id)
+        elif event == 'delete':
+            for term in self.record_terms(old_record):
+                self.remove(term, record_id)
+
+    def insert(self, term, record_id):
+        self.pending.append((term, record_id))
+
+    def remove(self, term, record_id):
+        position = bisect.bisect_left(self.keys, term)
+        while position < len(self.keys) and self.keys[position] == term:
+            if self.record_ids[position] == record_id:
+                del self.keys[position]
+                del self.record_ids[position]
+                return
+            position += 1
+        self.pending.remove((term, record_id))
+
+    def merge_pending(self):
+        if len(self.pending) < PREFIX_MERGE_THRESHOLD:
+            for term, record_id in self.pending:
+                position = bisect.bisect_right(self.keys, term)
+                self.keys.insert(position, term)
+                self.record_ids.insert(position, record_id)
+        else:
+            # Two sorted runs, which the sort merges in linear time
+            self.pending.sort(key=lambda entry: entry[0])
+            keys = self.keys + [term for term, _ in self.pending]
+            record_ids = self.record_ids + [record_id for _, record_id in self.pending]
+            self.sort(keys, record_ids)
+        self.pending = []
+
+    def sort(self, keys, record_ids):
+        # Sorting positions by term alone is much cheaper than sorting (term, ID) pairs
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = list(map(keys.__getitem__, order))
+        self.record_ids = list(map(record_ids.__getitem__, order))
+
+    def build(self):
+        keys = []
+        record_ids = []
+        # Straight from the columns; going through RowViews would double the build time
+        columns = [self.store.columns[column] for column in self.columns]
+        for record_id, *values in zip(self.store.columns[self.store.primary_key], *columns):
+            if record_id is None:
+                continue
+            terms = self.term_set(values)
+            keys.extend(terms)
+            record_ids.extend([record_id] * len(terms))
+        self.sort(keys, record_ids)
+        self.pending = []
+
+    def search(self, text, limit=PICKER_MATCHES):
+        # Up to `limit` record IDs with a term starting with `text`, in term order
+        if self.keys is None:
+            self.build()
+        elif self.pending:
+            self.merge_pending()
+        prefixes = [text.strip().lower()]
+        if PHONE_LIKE.match(prefixes[0]):
+            prefixes.append(digits_only(prefixes[0]))  # "555-01" finds phone 5550123
+        matches = {}
+        for prefix in filter(None, prefixes):
+            position = bisect.bisect_left(self.keys, prefix)
+            while position < len(self.keys) and len(matches) < limit:
+                if not self.keys[position].startswith(prefix):
+                    break
+                matches.setdefault(self.record_ids[position], None)
+                position += 1
+        return list(matches)
+
+
+class Histogram:
+    # Fixed log-spaced buckets (milliseconds), so recording is O(1) and the memory is constant
+    BOUNDS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, milliseconds):
+        self.buckets[bisect.bisect_left(self.BOUNDS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.last = milliseconds
+        if milliseconds > self.max:
+            self.max = milliseconds
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of the samples
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS, self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count, 'mean_ms': self.total / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.5), 'p95_ms': self.percentile(0.95), 'max_ms': self.max,
+            'last_ms': self.last,
+            'buckets': {f"<={bound}": count for bound, count in zip(self.BOUNDS, self.buckets) if count},
+            'over_max_bound': self.buckets[-1],
+        }
+
+
+class Metrics:
+    # Counters and timing histograms for the hot paths. timed() works both as a context
+    # manager and as a method decorator; the worker thread records too, hence the lock.
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, milliseconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(milliseconds)
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def histogram(self, name):
+        return self.histograms.get(name) or Histogram()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'written': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'counters': dict(self.counters),
+                'timings': {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            }
+
+    def export(self, path=METRICS_FILE):
+        # Replace the file atomically so a reader never sees half of it
+        temp_path = path + '.tmp'
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(self.snapshot(), file, indent=2)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+
+METRICS = Metrics()
+
+
+class LagProbe:
+    # Asks Tk to run a callback every LAG_PROBE_MS and records how late it actually runs.
+    # Anything that blocks the event loop (a slow handler, a full persistence queue) shows
+    # up as lag, which is exactly what a user experiences as a frozen window.
+    def __init__(self, root, metrics=METRICS, interval_ms=LAG_PROBE_MS):
+        self.root = root
+        self.metrics = metrics
+        self.interval_ms = interval_ms
+        self.expected = None
+
+    def start(self):
+        self.expected = time.perf_counter() + self.interval_ms / 1000
+        self.root.after(self.interval_ms, self.fire)
+
+    def fire(self):
+        lag_ms = max(0.0, (time.perf_counter() - self.expected) * 1000)
+        self.metrics.observe('tk.lag', lag_ms)
+        if lag_ms >= LAG_STALL_MS:
+            self.metrics.count('tk.stalls')
+        self.start()
+
+
+class StartupTimer:
+    # Milestones of one start in milliseconds since the process began importing this file,
+    # each recorded once; they also go to METRICS as startup.<name> for the metrics file
+    def __init__(self, started=STARTUP_STARTED):
+        self.started = started
+        self.marks = {}
+        self.print_at = None  # Milestone after which report() is printed, if any
+
+    def mark(self, name):
+        if name in self.marks:
+            return
+        milliseconds = (time.perf_counter() - self.started) * 1000
+        self.marks[name] = milliseconds
+        METRICS.observe(f"startup.{name}", milliseconds)
+        if name == self.print_at:
+            print(self.report())
+
+    def report(self):
+        return '\n'.join(f"{name:<28} {milliseconds:9.1f} ms" for name, milliseconds in self.marks.items())
+
+
+STARTUP = StartupTimer()
+
+
+class DebugOverlay:
+    # Small always-on-top readout in the corner of the notebook; F12 shows or hides it
+    NAMES = ('load.videos', 'video.search', 'video.sort', 'video.populate', 'view.render', 'video.save')
+
+    def __init__(self, root, parent, metrics=METRICS, visible=False):
+        self.root = root
+        self.metrics = metrics
+        self.label = tk.Label(parent, justify='left', anchor='nw', font=('TkFixedFont', 8),
+                              background='#fffbe6', relief='solid', borderwidth=1)
+        self.visible = False
+        root.bind_all('<F12>', lambda event: self.toggle())
+        if visible:
+            self.toggle()
+
+    def toggle(self):
+        self.visible = not self.visible
+        if self.visible:
+            self.label.place(relx=1.0, rely=0.0, anchor='ne')
+            self.label.lift()
+            self.update()
+        else:
+            self.label.place_forget()
+
+    def update(self):
+        if not self.visible:
+            return
+        lag = self.metrics.histogram('tk.lag')
+        lines = [f"lag p95 {lag.percentile(0.95):6.1f} ms  max {lag.max:7.1f} ms  "
+                 f"stalls {self.metrics.counters.get('tk.stalls', 0)}",
+                 f"write queue {PERSISTENCE.queue.qsize()}"]
+        for name in self.NAMES:
+            histogram = self.metrics.histogram(name)
+            if histogram.count:
+                lines.append(f"{name:<15} last {histogram.last:7.1f} ms  p95 {histogram.percentile(0.95):7.1f} ms")
+        self.label.configure(text='\n'.join(lines))
+        self.root.after(1000, self.update)
+
+
+class PersistenceWorker:
+    # Single background thread that performs every file and database write, so slow disks
+    # never stall the Tk event thread. Writes are queued as (key, payload, writer) items on a
+    # bounded queue; the thread drains whatever has piled up and hands each run of
+    # consecutive items with the same key to its writer in one call, which turns a burst of
+    # changes into one write. Completions and errors are queued back and delivered on the
+    # UI thread by poll(), which TabbedApp runs from root.after.
+    def __init__(self, max_queue=PERSIST_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.results = queue.SimpleQueue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.on_error = lambda error: print(f"Error saving data: {error}")
+
+    def submit(self, key, payload, writer, on_done=None):
+        # writer(payloads) runs on the worker thread; on_done(error) runs in poll()
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='persistence-worker', daemon=True)
+                self.thread.start()
+        self.queue.put((key, payload, writer, on_done))  # Blocks while the queue is full
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.queue.maxsize:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            start = 0
+            while start < len(batch):
+                end = start + 1
+                while end < len(batch) and batch[end][0] == batch[start][0]:
+                    end += 1
+                run = batch[start:end]
+                start = end
+                if run[0][0] is None:  # Sentinel from close()
+                    stop = True
+                    continue
+                error = None
+                try:
+                    with METRICS.timed(f"persist.{run[0][0][0]}"):
+                        run[0][2]([payload for _, payload, _, _ in run])
+                except Exception as e:
+                    error = e
+                    METRICS.count('persist.errors')
+                callbacks = [on_done for _, _, _, on_done in run if on_done is not None]
+                if error is not None or callbacks:
+                    self.results.put((callbacks, error))
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def poll(self):
+        # UI thread: deliver completions and report errors
+        while True:
+            try:
+                callbacks, error = self.results.get_nowait()
+            except queue.Empty:
+                return
+            for callback in callbacks:
+                callback(error)
+            if error is not None:
+                self.on_error(error)
+
+    def flush(self):
+        # Block until everything submitted so far has been written
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put((None, None, None, None))
+            self.thread.join()
+        self.poll()
+
+
+PERSISTENCE = PersistenceWorker()
+atexit.register(PERSISTENCE.close)
+
+
+class FileLock:
+    # Advisory lock on a small side file, shared by every clerk's process that opens the same
+    # data files: fcntl.flock on POSIX, msvcrt.locking on Windows. The operating system drops
+    # it when the process dies, so a crash never leaves the files locked.
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self, blocking=True):
+        if self.file is None:
+            self.file = open(self.path, 'a+b')
+        try:
+            import fcntl
+        except ImportError:
+            import msvcrt
+            self.file.seek(0)
+            try:
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            except OSError:
+                if blocking:
+                    raise
+                return False
+            return True
+        try:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def release(self):
+        try:
+            import fcntl
+        except ImportError:
+            import msvcrt
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def same_file(file, path):
+    # Whether an open file is still the one at path (and not renamed away or replaced)
+    try:
+        return os.path.samestat(os.fstat(file.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+class Journal:
+    # Write-ahead journal for one data file. Every RecordStore change is serialized as a JSON
+    # line ({"op": "put" | "delete", ...}) and handed to the persistence worker, which writes
+    # each burst of records with one write and one fsync. Loading replays the journal over
+    # the last snapshot. Compaction renames the journal aside, starts a fresh one and writes
+    # the new snapshot on a background thread, swapping it in with an atomic rename before
+    # the old journal is removed, so a crash at any point leaves a snapshot and journal(s)
+    # that replay to the latest state.
+    #
+    # Several clerks' processes can share the files. The journal is their change log: the
+    # worker appends only while holding the clerks' FileLock, after reading what the others
+    # appended since it last looked, and each line carries the version it creates plus the
+    # versions of the records it was based on. A change based on a version another clerk
+    # has since replaced is not written; the records it touched are put back the way the
+    # files have them and on_conflict says so. Other clerks' lines reach the store, record
+    # by record, through apply_changes(), which the ChangeWatcher calls.
+    SYNC = 'sync'  # Payload asking the worker only to read what other clerks wrote
+    UNKNOWN = object()  # The record is as in the snapshot; no journal line touched it
+
+    def __init__(self, snapshot_path, store, compact_bytes=JOURNAL_COMPACT_BYTES, kept_rows=()):
+        self.snapshot_path = snapshot_path
+        self.path = snapshot_path + '.journal'
+        self.compacting_path = snapshot_path + '.journal.compacting'
+        self.store = store
+        self.key_position = store.keys().index(store.primary_key)
+        self.compact_bytes = compact_bytes
+        self.kept_rows = kept_rows  # Snapshot rows the store rejected; every snapshot keeps them
+        self.lock = FileLock(snapshot_path + '.lock')
+        self.compaction_lock = FileLock(snapshot_path + '.compact.lock')  # Held while a snapshot is written
+        self.file = None  # Only used on the persistence worker thread
+        self.size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.paused = False
+        self.compacting = False
+        self.snapshot_owed = False  # A bulk change is only in the store until a snapshot has it
+        self.compactor = None
+        # Versions are "<clerk>.<n>", unique to the process that made the change
+        self.clerk = os.urandom(4).hex()
+        self.next_version = 0
+        self.versions = {}  # UI thread: record ID -> version this clerk last saw or made
+        self.applied_batches = 0  # UI thread: other clerks' changes applied to the store so far
+        self.following = False
+        self.last_seen = None  # Journal file identity and size at the last read request
+        self.on_conflict = print
+        # Worker thread: reading the lines other clerks append
+        self.reader = None
+        self.partial = b''  # The start of a line that is still being written
+        self.file_versions = {}  # Record ID -> version of the latest journal line touching it
+        self.file_records = {}  # Record ID -> its values as of that line (None once deleted)
+        self.remote_batches = 0
+        self.incoming = queue.SimpleQueue()  # ('changes', batch, entries) and ('conflict', entry, state)
+        store.subscribe(self.on_change)
+        atexit.register(self.close)
+
+    @contextlib.contextmanager
+    def pause(self):
+        # Changes made while loading come from the files themselves and must not be journaled
+        self.paused = True
+        try:
+            yield
+        finally:
+            self.paused = False
+
+    def on_change(self, event, record_id, old_record, new_record):
+        if self.paused or event == 'clear':
+            return
+        touched = [record_id]
+        if event != 'delete' and new_record[self.store.primary_key] != record_id:
+            touched.append(new_record[self.store.primary_key])  # Renamed: the new ID must still be free
+        self.next_version += 1
+        version = f"{self.clerk}.{self.next_version}"
+        entry = {'op': 'delete' if event == 'delete' else 'put', 'id': record_id, 'v': version,
+                 'base': {key: self.versions.get(key) for key in touched}}
+        if event != 'delete':
+            entry['record'] = [new_record[name] for name in self.store.keys()]
+        for key in touched:
+            self.versions[key] = version
+        self.append(entry)
+
+    def version(self, record_id):
+        return self.versions.get(record_id)
+
+    def append(self, entry):
+        PERSISTENCE.submit(('journal', self.path), entry, self.write)
+
+    def write(self, payloads):
+        # Worker thread, holding the clerks' lock: catch up on what the others wrote, then
+        # append this clerk's lines that still apply, with compaction requests in between
+        with self.lock:
+            self.follow()
+            lines = []
+            for payload in payloads:
+                if isinstance(payload, dict):
+                    line = self.check(payload)
+                    if line is not None:
+                        lines.append(line)
+                elif payload != self.SYNC:
+                    self.write_lines(lines)
+                    lines = []
+                    self.rotate(*payload)
+            self.write_lines(lines)
+
+    def write_lines(self, lines):
+        if not lines:
+            return
+        if self.file is not None and not same_file(self.file, self.path):
+            self.file.close()  # Another clerk rotated the journal
+            self.file = None
+        if self.file is None:
+            self.file = open(self.path, 'a')
+        if self.partial:
+            lines.insert(0, '\n')  # End the line a crashed clerk left half written
+            self.partial = b''
+        self.file.write(''.join(lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())  # One fsync for the whole burst
+        self.size = self.file.tell()
+        # This clerk's own lines are no news to it
+        if self.reader is None or not same_file(self.reader, self.path):
+            if self.reader is not None:
+                self.reader.close()
+            self.reader = open(self.path, 'rb')
+        self.reader.seek(self.size)
+
+    def check(self, entry):
+        # Worker thread: the line to write, or None if another clerk changed a record first
+        bases = entry.pop('base')
+        if any(self.file_versions.get(key) != version for key, version in bases.items()):
+            state = {key: (self.file_versions.get(key), self.file_records.get(key, self.UNKNOWN)) for key in bases}
+            self.incoming.put(('conflict', entry, state))
+            return None
+        self.note(entry, self.file_versions, self.file_records)
+        return json.dumps(entry) + '\n'
+
+    def note(self, entry, versions, records=None):
+        # Remember the version (and values) a journal line leaves each record it touches with
+        version = entry.get('v')
+        versions[entry['id']] = version
+        if entry['op'] == 'delete':
+            if records is not None:
+                records[entry['id']] = None
+            return
+        new_id = entry['record'][self.key_position]
+        versions[new_id] = version
+        if records is not None:
+            if new_id != entry['id']:
+                records[entry['id']] = None
+            records[new_id] = entry['record']
+
+    def follow(self):
+        # Worker thread, under the lock: read the lines other clerks appended, including the
+        # rest of a journal that one of them has just rotated away
+        entries = []
+        while True:
+            if self.reader is not None:
+                entries.extend(self.read_entries())
+                if same_file(self.reader, self.path):
+                    break
+                self.reader.close()
+                self.reader = None
+                self.partial = b''
+            if not os.path.exists(self.path):
+                break
+            self.reader = open(self.path, 'rb')  # A journal started since; read it from the top
+        if entries:
+            self.remote_batches += 1
+            self.incoming.put(('changes', self.remote_batches, entries))
+
+    def read_entries(self):
+        lines = (self.partial + self.reader.read()).split(b'\n')
+        self.partial = lines.pop()  # Not ended yet (or torn by a crash)
+        entries = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                print(f"Ignoring unreadable journal record in {self.path}")
+                continue
+            self.note(entry, self.file_versions, self.file_records)
+            entries.append(entry)
+        return entries
+
+    def replay(self, snapshot_stat=None):
+        # Apply the journal(s) left since the last snapshot and start following the journal
+        # from there. Runs under the clerks' lock, so no line is half written by another
+        # clerk; False if the snapshot was replaced since it was read (it must be read again).
+        PERSISTENCE.flush()
+        self.following = False
+        with self.lock, self.pause():
+            if snapshot_stat is not None and os.path.exists(self.snapshot_path) and \
+                    not os.path.samestat(snapshot_stat, os.stat(self.snapshot_path)):
+                return False
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+            self.file_versions.clear()
+            self.file_records.clear()
+            self.versions.clear()
+            for path in (self.compacting_path, self.path):
+                if not os.path.exists(path):
+                    continue
+                self.partial = b''
+                self.reader = open(path, 'rb')
+                for entry in self.read_entries():
+                    self.apply(entry)
+                    self.note(entry, self.versions)
+                if path == self.compacting_path:
+                    self.reader.close()
+                    self.reader = None
+            if self.partial:
+                print(f"Ignoring incomplete journal record in {self.path}")
+            # Whatever was read so far is in the store; later compactions must not wait for it
+            self.applied_batches = self.remote_batches
+        self.following = True
+        return True
+
+    def apply(self, entry):
+        # Replaying must be idempotent: a crash during compaction replays a journal that the
+        # new snapshot already contains
+        store = self.store
+        try:
+            if entry['op'] == 'delete':
+                if entry['id'] in store:
+                    store.delete(entry['id'])
+                return
+            record = dict(zip(store.keys(), entry['record']))
+            if entry['id'] in store:
+                store.update(entry['id'], record)
+            elif record[store.primary_key] in store:
+                store.update(record[store.primary_key], record)
+            else:
+                store.add(record)
+        except ValueError as e:
+            print(f"Skipping journal record: {e}")
+
+    def check_for_changes(self):
+        # UI thread, from the ChangeWatcher: have the worker read the journal, but only when
+        # it was written to or replaced since the last look (one stat when nothing happened)
+        if not self.following:
+            return
+        try:
+            stat = os.stat(self.path)
+            seen = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            seen = None
+        if seen != self.last_seen:
+            self.last_seen = seen
+            PERSISTENCE.submit(('journal', self.path), self.SYNC, self.write)
+
+    def apply_changes(self):
+        # UI thread: apply what other clerks changed, and undo this clerk's changes that lost;
+        # then retry a snapshot that compact_now() could not write yet
+        while True:
+            try:
+                item = self.incoming.get_nowait()
+            except queue.Empty:
+                break
+            with self.pause():
+                if item[0] == 'changes':
+                    _, batch, entries = item
+                    for entry in entries:
+                        self.apply(entry)
+                        self.note(entry, self.versions)
+                    self.applied_batches = batch
+                    METRICS.count('journal.remote_changes', len(entries))
+                else:
+                    self.resolve(item[1], item[2])
+        if self.snapshot_owed and not self.compacting:
+            self.compact()
+
+    def resolve(self, entry, state):
+        # Put the records a rejected change touched back the way the files have them; the
+        # other clerk's changes themselves arrive as ordinary changes
+        METRICS.count('journal.conflicts')
+        for record_id, (version, record) in sorted(state.items(), key=lambda item: item[1][1] is not None):
+            self.versions[record_id] = version
+            if record is self.UNKNOWN:
+                record = self.snapshot_record(record_id)
+            try:
+                if record is None:
+                    if record_id in self.store:
+                        self.store.delete(record_id)
+                elif record_id in self.store:
+                    self.store.update(record_id, dict(zip(self.store.keys(), record)))
+                else:
+                    self.store.add(record)
+            except ValueError as e:
+                print(f"Could not restore {record_id}: {e}")
+        self.on_conflict(f"{entry['id']} was changed by another clerk at the same time; "
+                         f"your change to it was not saved.")
+
+    def snapshot_record(self, record_id):
+        # A record as the snapshot file has it (only needed when resolving a rare conflict)
+        try:
+            with open(self.snapshot_path, 'r', newline='') as file:
+                for row_data in read_rows(file, len(self.store.keys()), self.snapshot_path):
+                    if row_data[self.key_position] == record_id:
+                        return row_data
+        except FileNotFoundError:
+            pass
+        return None
+
+    def maybe_compact(self):
+        if self.compacting or self.size < self.compact_bytes:
+            return
+        self.compact()
+
+    def compact_now(self):
+        # Fold everything into a fresh snapshot now, after any compaction already under way.
+        # If other clerks' changes are still on their way to the store, or one of them is
+        # writing a snapshot, the UI does not wait: apply_changes() tries again on every
+        # ChangeWatcher poll until the snapshot is written.
+        PERSISTENCE.flush()
+        if self.compactor is not None:
+            self.compactor.join()
+        self.apply_changes()
+        self.snapshot_owed = True
+        if not self.compacting:
+            self.compact()
+
+    def compact(self):
+        # Copy the columns here, on the thread that owns the store; the worker rotates the
+        # journal right after the records written so far and starts the snapshot writer
+        self.compacting = True
+        columns = self.store.snapshot()
+        PERSISTENCE.submit(('journal', self.path), (columns, list(self.kept_rows), self.applied_batches), self.write)
+
+    def rotate(self, columns, kept_rows, applied_batches):
+        # Worker thread, under the lock and caught up with the other clerks
+        if applied_batches != self.remote_batches or not self.compaction_lock.acquire(blocking=False):
+            # The snapshot would miss other clerks' changes, or one of them is writing a
+            # snapshot right now; try again later
+            self.compacting = False
+            return
+        self.snapshot_owed = False
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.reader is not None:
+            self.reader.close()  # Nothing left to read; the next lines go to a new journal
+            self.reader = None
+        if os.path.exists(self.path):
+            if os.path.exists(self.compacting_path):
+                # A compaction interrupted by a crash left its journal behind; keep both
+                with open(self.compacting_path, 'a') as target, open(self.path, 'r') as source:
+                    shutil.copyfileobj(source, target)
+                    target.flush()
+                    os.fsync(target.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.compacting_path)
+        self.size = 0
+        self.compactor = threading.Thread(target=self.write_snapshot, args=(columns, kept_rows),
+                                          name='journal-compactor')
+        self.compactor.start()
+
+    def write_snapshot(self, columns, kept_rows):
+        try:
+            write_snapshot_file(self.snapshot_path, itertools.chain(
+                (row_data for row_data in zip(*columns) if row_data[0] is not None), kept_rows))
+            if os.path.exists(self.compacting_path):  # Nothing was journaled since the last snapshot
+                os.remove(self.compacting_path)
+        except OSError as e:
+            print(f"Error compacting {self.path}: {e}")
+        finally:
+            self.compacting = False
+            self.compaction_lock.release()
+
+    def close(self):
+        PERSISTENCE.flush()
+        if self.compactor is not None:
+            self.compactor.join()
+        deadline = time.monotonic() + SHARED_CLOSE_WAIT_SECONDS
+        while self.snapshot_owed:
+            PERSISTENCE.submit(('journal', self.path), self.SYNC, self.write)
+            PERSISTENCE.flush()
+            self.apply_changes()
+            PERSISTENCE.flush()
+            if self.compactor is not None:
+                self.compactor.join()
+            if not self.snapshot_owed or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)  # Another clerk is writing a snapshot
+        if self.snapshot_owed:
+            print(f"Could not write '{self.snapshot_path}': another clerk kept it locked. "
+                  f"The last bulk change was not saved.")
+            self.snapshot_owed = False  # Said once; closing again must not wait again
+        if self.file is not None or self.reader is not None:
+            PERSISTENCE.submit(('close', self.path), None, lambda payloads: self.close_file())
+            PERSISTENCE.flush()
+
+    def close_file(self):
+        for file in (self.file, self.reader):
+            if file is not None:
+                file.close()
+        self.file = None
+        self.reader = None
+
+
+class ChangeWatcher:
+    # Polls the shared journals and the rental ledger for changes made by other clerks'
+    # processes (one stat per file when nothing happened) and applies them record by record;
+    # the tabs and indexes follow through the ordinary store and ledger events, as for
+    # local edits.
+    def __init__(self, root, logs, interval=SHARED_WATCH_MS):
+        self.root = root
+        self.logs = list(logs)
+        self.interval = interval
+
+    def start(self):
+        if self.logs:
+            self.root.after(self.interval, self.poll)
+
+    def poll(self):
+        for log in self.logs:
+            log.apply_changes()
+            log.check_for_changes()
+        self.root.after(self.interval, self.poll)
+
+
+def write_snapshot_file(path, rows):
+    # Write a complete data file next to the old one and swap it in atomically
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', newline='') as file:
+        write_rows(file, rows)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    fsync_directory(path)
+
+
+def read_rows(lines, width, name, rejected=None):
+    # Parse comma-separated rows; fields containing commas are quoted by write_rows. Rows with
+    # the wrong number of fields are skipped, or set aside in `rejected`.
+    for line_number, row_data in enumerate(csv.reader(lines), 1):
+        if len(row_data) == width:
+            yield row_data
+        elif row_data:
+            print(f"Skipping malformed row {line_number} in {name}: expected {width} fields, "
+                  f"got {len(row_data)}")
+            if rejected is not None:
+                rejected.append(row_data)
+
+
+def write_rows(file, rows):
+    # Plain comma-separated lines; only values that contain commas or quotes get quoted
+    writer = csv.writer(file, lineterminator='\n')
+    for row_data in rows:
+        writer.writerow([str(value) for value in row_data])
+
+
+class TextStorage:
+    # Storage backend for the flat data files, optionally backed by a write-ahead Journal.
+    # Rows of the file that cannot be loaded are set aside and written back after the
+    # records in every rewrite of the file, so a bad line is reported, not lost.
+    def __init__(self, path, store, journal=JOURNAL_MODE):
+        self.path = path
+        self.store = store
+        self.rejected = []  # Rows of the file the last load could not add to the store
+        self.journal = Journal(path, store, kept_rows=self.rejected) if journal else None
+        self.snapshot_stat = None  # Identity of the snapshot file the last load read
+        self.legacy_layouts = LEGACY_LAYOUTS.get(tuple(store.keys()), ())
+        self.legacy_rows = 0  # Rows the last load read in an older column order
+
+    def paused(self):
+        # Rows read back from the files must not be journaled again
+        return self.journal.pause() if self.journal else contextlib.nullcontext()
+
+    def load(self):
+        load_all(self)
+
+    def stream(self, batch_size=LOAD_BATCH_ROWS):
+        # Generator of (rows, fraction of the file read) parsed a batch at a time
+        try:
+            file = open(self.path, 'r', newline='')
+        except FileNotFoundError:
+            print(f"Data file '{self.path}' not found. Starting with empty data.")
+            return
+        with file:
+            self.snapshot_stat = os.fstat(file.fileno())
+            self.legacy_rows = 0
+            self.rejected.clear()
+            total = max(1, self.snapshot_stat.st_size)
+            consumed = 0
+
+            def lines():
+                nonlocal consumed
+                for line in file:
+                    consumed += len(line)
+                    yield line
+
+            batch = []
+            for row_data in read_rows(lines(), len(self.store.keys()), self.path, self.rejected):
+                batch.append(row_data)
+                if len(batch) >= batch_size:
+                    yield batch, min(1.0, consumed / total)
+                    batch = []
+            if batch:
+                yield batch, 1.0
+
+    def add_rows(self, rows):
+        return add_rows(self.store, self.paused(), rows, self.upgrade_row, self.rejected)
+
+    def upgrade_row(self, row_data):
+        # A row the store rejected, rearranged from the first older column order it loads in,
+        # or None
+        for layout in self.legacy_layouts:
+            upgraded = [row_data[layout.index(name)] for name in self.store.keys()]
+            try:
+                self.store.convert(dict(zip(self.store.keys(), upgraded)))
+            except ValueError:
+                continue
+            self.legacy_rows += 1
+            return upgraded
+        return None
+
+    def finish_load(self):
+        # Bring the snapshot up to date with the changes journaled since it was written. If
+        # another clerk compacted in the meantime, the journal no longer matches the snapshot
+        # that was read; read the new one (rare, so synchronously). A file with rows in an
+        # older column order is then rewritten in the current one.
+        if self.journal:
+            while not self.journal.replay(self.snapshot_stat):
+                print(f"'{self.path}' was compacted by another clerk while loading; reading it again.")
+                self.store.clear()
+                for rows, _ in self.stream():
+                    self.add_rows(rows)
+        if self.rejected:
+            print(f"{len(self.rejected)} rows of '{self.path}' could not be loaded; they are kept "
+                  f"at the end of the file until corrected there.")
+        if self.legacy_rows:
+            print(f"Read {self.legacy_rows} rows of '{self.path}' in an older column order; "
+                  f"rewriting it in the current one.")
+            if self.journal:
+                self.journal.compact_now()
+            else:
+                self.save()
+
+    def version(self, record_id):
+        # Version of a record as this clerk last saw it; compared before saving an edit
+        return self.journal.version(record_id) if self.journal else None
+
+    def transaction(self):
+        return contextlib.nullcontext()
+
+    @contextlib.contextmanager
+    def bulk_write(self):
+        # Many changes at once: nothing is journaled per record, one snapshot is written after
+        with self.paused():
+            yield
+        if self.journal:
+            self.journal.compact_now()
+        else:
+            self.save()
+
+    def save(self):
+        if self.journal:
+            # Every change was already appended to the journal by the store listener
+            self.journal.maybe_compact()
+            return
+        # Copy the columns now; the worker writes the file later (and only once per burst)
+        columns = self.store.snapshot()
+        PERSISTENCE.submit(('file', self.path), ('snapshot', (columns, list(self.rejected))), self.write)
+
+    def append(self, record_id):
+        # A record was added at the end of the store; no need to rewrite the whole file
+        if self.journal:
+            self.journal.maybe_compact()
+            return
+        PERSISTENCE.submit(('file', self.path), ('append', [self.store.values(record_id)]), self.write)
+
+    def write(self, payloads):
+        # Worker thread: only the last full rewrite of a burst matters, plus the appends after it
+        snapshots = [position for position, (kind, _) in enumerate(payloads) if kind == 'snapshot']
+        if snapshots:
+            columns, kept_rows = payloads[snapshots[-1]][1]
+            write_snapshot_file(self.path, itertools.chain(
+                (row_data for row_data in zip(*columns) if row_data[0] is not None), kept_rows))
+            payloads = payloads[snapshots[-1] + 1:]
+        rows = [row_data for _, appended in payloads for row_data in appended]
+        if rows:
+            with open(self.path, 'a', newline='') as file:
+                write_rows(file, rows)
+
+    def close(self):
+        if self.journal:
+            self.journal.close()
+        PERSISTENCE.flush()
+
+
+class SQLiteStorage:
+    # Storage backend keeping one table per store in a SQLite database in WAL mode. Every
+    # store change is written through the same few parameterized statements (which sqlite3
+    # keeps compiled in its statement cache) by the persistence worker on its own
+    # connection, one transaction per transaction() block or burst of changes. The ID
+    # primary key and the extra indexed columns let sorting and filtering be answered by
+    # indexed queries instead of Python loops.
+    def __init__(self, db_path, table, store, indexed=(), migrate_from=None):
+        self.db_path = db_path
+        self.table = table
+        self.store = store
+        self.migrate_from = migrate_from
+        self.depth = 0  # Nesting of transaction() blocks
+        self.pending = []  # (sql, parameters) not yet handed to the worker
+        self.changes = []  # Store events of the open transaction, to undo if it fails
+        self.paused = False
+        import sqlite3
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        columns = store.keys()
+        quoted = [quote_identifier(name) for name in columns]
+        key = quote_identifier(store.primary_key)
+        affinity = {int: 'INTEGER', float: 'REAL'}
+        definitions = [f"{quoted_name} {affinity.get(store.types.get(name), 'TEXT')}"
+                       + (" PRIMARY KEY" if quoted_name == key else "") for name, quoted_name in zip(columns, quoted)]
+        with self.connection:
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(definitions)})")
+            for name in indexed:
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_{name.replace(' ', '_')} "
+                                        f"ON {table} ({quote_identifier(name)})")
+        self.select_sql = f"SELECT {', '.join(quoted)} FROM {table} ORDER BY rowid"
+        self.insert_sql = f"INSERT INTO {table} ({', '.join(quoted)}) VALUES ({', '.join('?' * len(columns))})"
+        self.update_sql = f"UPDATE {table} SET {', '.join(name + ' = ?' for name in quoted)} WHERE {key} = ?"
+        self.delete_sql = f"DELETE FROM {table} WHERE {key} = ?"
+        store.subscribe(self.on_change)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Everything changed inside the block is committed together; if the block fails,
+        # nothing is written and the store changes are undone, so the two still agree
+        self.depth += 1
+        try:
+            yield
+        except BaseException:
+            self.depth -= 1
+            if not self.depth:
+                self.pending.clear()
+                self.undo_changes()
+            raise
+        self.depth -= 1
+        if not self.depth:
+            self.changes.clear()
+            self.submit_pending()
+
+    def undo_changes(self):
+        # Newest first; the listeners (views, indexes) follow the undo like any edit. A
+        # deleted record comes back at the end of the store.
+        changes, self.changes = self.changes, []
+        store = self.store
+        with self.paused_writes():
+            for event, record_id, old_record, new_record in reversed(changes):
+                if event == 'add':
+                    store.delete(record_id)
+                elif event == 'update':
+                    store.update(new_record[store.primary_key], old_record)
+                else:
+                    store.add([old_record[name] for name in store.keys()])
+
+    def bulk_write(self):
+        # One transaction is already a single write for the worker
+        return self.transaction()
+
+    def on_change(self, event, record_id, old_record, new_record):
+        if self.paused or event == 'clear':
+            return
+        columns = self.store.keys()
+        if event == 'add':
+            self.pending.append((self.insert_sql, [new_record[name] for name in columns]))
+        elif event == 'update':
+            self.pending.append((self.update_sql, [new_record[name] for name in columns] + [record_id]))
+        elif event == 'delete':
+            self.pending.append((self.delete_sql, (record_id,)))
+        if self.depth:
+            self.changes.append((event, record_id, old_record, new_record))
+        else:
+            self.submit_pending()
+
+    def submit_pending(self):
+        if self.pending:
+            statements, self.pending = self.pending, []
+            PERSISTENCE.submit(('sqlite', self.db_path), statements, self.write)
+
+    def write(self, payloads):
+        # Worker thread: one transaction for the whole burst, on the worker's own connection
+        connection = SQLITE_WRITERS.get(self.db_path)
+        if connection is None:
+            import sqlite3
+            connection = SQLITE_WRITERS[self.db_path] = sqlite3.connect(self.db_path)
+        with connection:
+            for statements in payloads:
+                for sql, parameters in statements:
+                    connection.execute(sql, parameters)
+
+    @contextlib.contextmanager
+    def paused_writes(self):
+        self.paused = True
+        try:
+            yield
+        finally:
+            self.paused = False
+
+    def load(self):
+        load_all(self)
+
+    def stream(self, batch_size=LOAD_BATCH_ROWS):
+        PERSISTENCE.flush()
+        if self.migrate_from and self.is_empty() and os.path.exists(self.migrate_from):
+            self.migrate(self.migrate_from)
+        total = max(1, self.connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0])
+        cursor = self.connection.execute(self.select_sql)
+        done = 0
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                return
+            done += len(batch)
+            yield [list(row_data) for row_data in batch], min(1.0, done / total)
+
+    def add_rows(self, rows):
+        return add_rows(self.store, self.paused_writes(), rows)
+
+    def finish_load(self):
+        pass
+
+    def version(self, record_id):
+        return None  # Single clerk: nothing to compare
+
+    def is_empty(self):
+        return self.connection.execute(f"SELECT 1 FROM {self.table} LIMIT 1").fetchone() is None
+
+    def migrate(self, text_path):
+        # One-shot import of a text data file (and its journal) into the table
+        source = RecordStore(self.store.keys(), self.store.primary_key, types=self.store.types)
+        text_storage = TextStorage(text_path, source)
+        text_storage.load()
+        text_storage.close()
+        with self.connection:
+            self.connection.executemany(self.insert_sql, source.rows())
+        print(f"Migrated {len(source)} rows from '{text_path}' into {self.db_path}:{self.table}")
+
+    def query_ids(self, where='', params=(), order_by=None, ascending=True):
+        # Record IDs matching an SQL condition on the table, optionally ordered by a column
+        PERSISTENCE.flush()
+        sql = f"SELECT {quote_identifier(self.store.primary_key)} FROM {self.table}"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {quote_identifier(order_by)} {'ASC' if ascending else 'DESC'}, rowid" if order_by \
+            else " ORDER BY rowid"
+        return [row_data[0] for row_data in self.connection.execute(sql, params)]
+
+    def save(self):
+        if not self.depth:
+            self.submit_pending()
+
+    def append(self, record_id):
+        self.save()
+
+    def close(self):
+        self.submit_pending()
+        PERSISTENCE.flush()
+        self.connection.close()
+
+
+class MappedStorage:
+    # Storage backend keeping a store in one memory-mapped file of fixed-width records:
+    #   header: magic, layout checksum, record size, slots in use, head of the free list
+    #   slot:   1 flag byte (1 = in use) and the columns, text NUL-padded to its width and
+    #           numbers as 8-byte little-endian values; a free slot holds the next free slot
+    # Each record lives at a fixed offset (ID -> slot index in memory), so a change writes
+    # only the bytes of the columns that changed: renting a video patches its Status field
+    # in place. Deleted slots go on the free list and are reused by later adds. Loading
+    # decodes records straight out of the mapping, which the OS pages in as it is read.
+    MAGIC = b'VIDCAT01'
+    HEADER = struct.Struct('<8sIIQQ')  # Magic, layout checksum, record size, slot count, free head + 1
+    HEADER_SIZE = 64
+    GROW_SLOTS = 4096
+
+    def __init__(self, path, store, widths, migrate_from=None):
+        self.path = path
+        self.store = store
+        self.migrate_from = migrate_from
+        self.fields = []  # (column, offset in the record, width, struct code)
+        offset = 1
+        for name in store.keys():
+            column_type = store.types.get(name)
+            code = 'q' if column_type is int else 'd' if column_type is float else f"{widths[name]}s"
+            self.fields.append((name, offset, struct.calcsize('<' + code), code))
+            offset += self.fields[-1][2]
+        self.record = struct.Struct('<B' + ''.join(code for _, _, _, code in self.fields))
+        layout = ';'.join(f"{name}:{code}" for name, _, _, code in self.fields)
+        self.layout = zlib.crc32(layout.encode('utf-8'))
+        self.slots = {}  # Record ID -> slot index
+        self.free = []  # Free slots, the head of the on-disk free list last
+        self.slot_count = 0
+        self.depth = 0  # Nesting of transaction() blocks
+        self.pending = []  # (file offset, bytes) not yet handed to the worker
+        self.paused = False
+        self.file = None  # The worker's file and writable mapping
+        self.map = None
+        store.checks.append(self.check_fits)
+        store.subscribe(self.on_change)
+
+    def check_fits(self, record):
+        # RecordStore check: refuse text that would not fit its fixed-width field
+        for name, _, width, code in self.fields:
+            if code.endswith('s') and len(str(record[name]).encode('utf-8')) > width:
+                raise ValueError(f"{name} is longer than {width} bytes.")
+
+    def slot_offset(self, slot):
+        return self.HEADER_SIZE + slot * self.record.size
+
+    def encode(self, record):
+        values = [1]
+        for name, _, _, code in self.fields:
+            values.append(str(record[name]).encode('utf-8') if code.endswith('s') else record[name])
+        return self.record.pack(*values)
+
+    def encode_field(self, field, value):
+        name, _, _, code = field
+        return struct.pack('<' + code, str(value).encode('utf-8') if code.endswith('s') else value)
+
+    def header(self):
+        free_head = self.free[-1] + 1 if self.free else 0
+        return self.HEADER.pack(self.MAGIC, self.layout, self.record.size, self.slot_count, free_head)
+
+    def free_slot_bytes(self):
+        # Flag 0, then the next slot of the free list (+1, 0 ends it)
+        next_free = self.free[-1] + 1 if self.free else 0
+        return struct.pack('<Bq', 0, next_free)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Everything changed inside the block is handed to the worker in one piece
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.submit_pending()
+
+    def bulk_write(self):
+        return self.transaction()
+
+    @contextlib.contextmanager
+    def paused_writes(self):
+        self.paused = True
+        try:
+            yield
+        finally:
+            self.paused = False
+
+    def on_change(self, event, record_id, old_record, new_record):
+        if self.paused or event == 'clear':
+            return
+        if event == 'add':
+            if self.free:
+                slot = self.free.pop()
+            else:
+                slot = self.slot_count
+                self.slot_count += 1
+            self.slots[record_id] = slot
+            self.pending.append((self.slot_offset(slot), self.encode(new_record)))
+            self.pending.append((0, self.header()))
+        elif event == 'update':
+            new_id = new_record[self.store.primary_key]
+            slot = self.slots.pop(record_id)
+            self.slots[new_id] = slot
+            base = self.slot_offset(slot)
+            for field in self.fields:
+                name, offset = field[0], field[1]
+                if old_record[name] != new_record[name]:
+                    self.pending.append((base + offset, self.encode_field(field, new_record[name])))
+        elif event == 'delete':
+            slot = self.slots.pop(record_id)
+            self.pending.append((self.slot_offset(slot), self.free_slot_bytes()))
+            self.free.append(slot)
+            self.pending.append((0, self.header()))
+        if not self.depth:
+            self.submit_pending()
+
+    def submit_pending(self):
+        if self.pending:
+            patches, self.pending = self.pending, []
+            PERSISTENCE.submit(('mapped', self.path), (patches, self.slot_offset(self.slot_count)), self.write)
+
+    def write(self, payloads):
+        # Worker thread: apply the byte patches of a burst, growing the file first if needed,
+        # then flush the dirty pages once
+        size = max(size for _, size in payloads)
+        if self.map is None or size > len(self.map):
+            self.remap(size)
+        for patches, _ in payloads:
+            for offset, data in patches:
+                self.map[offset:offset + len(data)] = data
+        self.map.flush()
+
+    def remap(self, size):
+        if self.map is not None:
+            self.map.close()
+        if self.file is None:
+            self.file = open(self.path, 'r+b' if os.path.exists(self.path) else 'w+b')
+        current = os.fstat(self.file.fileno()).st_size
+        if size > current or current == 0:
+            # Grow by whole chunks of slots so a run of adds does not remap every time
+            grown = self.slot_offset(self.GROW_SLOTS)
+            self.file.truncate(max(size + self.GROW_SLOTS * self.record.size, current + current // 4, grown))
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def load(self):
+        load_all(self)
+
+    def stream(self, batch_size=LOAD_BATCH_ROWS):
+        PERSISTENCE.flush()
+        self.slots.clear()
+        self.free = []
+        self.slot_count = 0
+        if not os.path.exists(self.path) and self.migrate_from and os.path.exists(self.migrate_from):
+            self.migrate(self.migrate_from)
+        try:
+            file = open(self.path, 'rb')
+        except FileNotFoundError:
+            print(f"Data file '{self.path}' not found. Starting with empty data.")
+            return
+        with file:
+            if os.fstat(file.fileno()).st_size < self.HEADER_SIZE:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                magic, layout, record_size, slot_count, free_head = self.HEADER.unpack_from(view, 0)
+                if magic != self.MAGIC or layout != self.layout or record_size != self.record.size:
+                    raise ValueError(f"'{self.path}' does not match the {self.store.keys()} layout")
+                self.slot_count = slot_count
+                free = []
+                while free_head:
+                    free.append(free_head - 1)
+                    free_head = struct.unpack_from('<q', view, self.slot_offset(free_head - 1) + 1)[0]
+                self.free = free[::-1]  # The head of the list is popped first
+                names = [name for name, _, _, _ in self.fields]
+                text = [code.endswith('s') for _, _, _, code in self.fields]
+                batch, slots = [], []
+                for slot in range(slot_count):
+                    values = self.record.unpack_from(view, self.slot_offset(slot))
+                    if not values[0]:
+                        continue
+                    batch.append([value.rstrip(b'\0').decode('utf-8') if is_text else value
+                                  for value, is_text in zip(values[1:], text)])
+                    slots.append(slot)
+                    if len(batch) >= batch_size:
+                        self.remember_slots(batch, slots, names)
+                        yield batch, (slot + 1) / max(1, slot_count)
+                        batch, slots = [], []
+                if batch:
+                    self.remember_slots(batch, slots, names)
+                    yield batch, 1.0
+
+    def remember_slots(self, batch, slots, names):
+        key = names.index(self.store.primary_key)
+        for row_data, slot in zip(batch, slots):
+            self.slots[row_data[key]] = slot
+
+    def add_rows(self, rows):
+        return add_rows(self.store, self.paused_writes(), rows)
+
+    def finish_load(self):
+        pass
+
+    def version(self, record_id):
+        return None  # Single clerk: nothing to compare
+
+    def migrate(self, text_path):
+        # One-shot conversion of a text data file (and its journal) into a new record file
+        source = RecordStore(self.store.keys(), self.store.primary_key, types=self.store.types)
+        text_storage = TextStorage(text_path, source)
+        text_storage.load()
+        text_storage.close()
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            count = 0
+            file.write(b'\0' * self.HEADER_SIZE)
+            for row_data in source.rows():
+                record = dict(zip(source.keys(), row_data))
+                try:
+                    self.check_fits(record)
+                except ValueError as e:
+                    print(f"Skipping row {record[source.primary_key]}: {e}")
+                    continue
+                file.write(self.encode(record))
+                count += 1
+            file.seek(0)
+            file.write(self.HEADER.pack(self.MAGIC, self.layout, self.record.size, count, 0))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        fsync_directory(self.path)
+        print(f"Migrated {count} rows from '{text_path}' into '{self.path}'")
+
+    def save(self):
+        # Every change was already patched into the file by on_change
+        if not self.depth:
+            self.submit_pending()
+
+    def append(self, record_id):
+        self.save()
+
+    def close(self):
+        self.submit_pending()
+        PERSISTENCE.flush()
+        PERSISTENCE.submit(('close', self.path), None, lambda payloads: self.close_map())
+        PERSISTENCE.flush()
+
+    def close_map(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+SQLITE_WRITERS = {}  # Database path -> connection, only used on the persistence worker thread
+
+
+def add_rows(store, paused, rows, upgrade=None, rejected=None):
+    # Add a parsed batch to a store without persisting it again; returns the added IDs. A row
+    # the store rejects is passed to upgrade(), which may return it in the current layout;
+    # failing that it is skipped, or set aside in `rejected`.
+    added = []
+    with paused:
+        for row_data in rows:
+            try:
+                added.append(store.add(row_data))
+                continue
+            except ValueError as e:
+                error = e
+            upgraded = upgrade(row_data) if upgrade is not None else None
+            if upgraded is not None:
+                try:
+                    added.append(store.add(upgraded))
+                    continue
+                except ValueError as e:
+                    error = e
+            print(f"Skipping row: {error}")
+            if rejected is not None:
+                rejected.append(row_data)
+    return added
+
+
+def load_all(storage):
+    # Synchronous load of a whole storage backend into its store
+    storage.store.clear()
+    for rows, _ in storage.stream():
+        storage.add_rows(rows)
+    storage.finish_load()
+
+
+class ProgressiveLoader:
+    # Streams a storage backend into its store from Tk callbacks, one LOAD_SLICE_MS time
+    # slice at a time, so the window appears with the first rows right away and stays
+    # responsive while the rest of a large catalog is parsed. Any number of tabs can watch
+    # one load, each with its own callbacks and progress bar.
+    def __init__(self, root, storage, name='load'):
+        self.root = root
+        self.storage = storage
+        self.name = name  # Metrics name of the whole load; every time slice is recorded as load.slice
+        self.watchers = []  # (on_rows(ids of a batch), on_done(), progress bar, progress label)
+        self.batches = None
+        self.started = None
+        self.running = False
+
+    def watch(self, on_rows, on_done, progress_bar=None, progress_label=None):
+        self.watchers.append((on_rows, on_done, progress_bar, progress_label))
+        if self.running:
+            self.show_progress(progress_bar, progress_label, 0)
+
+    def show_progress(self, progress_bar, progress_label, fraction):
+        if progress_bar is not None:
+            progress_bar['value'] = fraction * 100
+            progress_bar.grid()
+            progress_label.configure(text=f"Loading... {len(self.storage.store):,} rows")
+            progress_label.grid()
+
+    def start(self):
+        self.storage.store.clear()
+        self.batches = self.storage.stream()
+        self.running = True
+        self.started = time.perf_counter()
+        for _, _, progress_bar, progress_label in self.watchers:
+            self.show_progress(progress_bar, progress_label, 0)
+        self.step()  # The first batch goes in before the window is even shown
+
+    def step(self):
+        slice_start = time.perf_counter()
+        deadline = slice_start + LOAD_SLICE_MS / 1000
+        fraction = 0.0
+        try:
+            while True:
+                try:
+                    rows, fraction = next(self.batches)
+                except StopIteration:
+                    self.finish()
+                    return
+                added = self.storage.add_rows(rows)
+                for on_rows, _, _, _ in self.watchers:
+                    on_rows(added)
+                if time.perf_counter() >= deadline:
+                    break
+            METRICS.observe('load.slice', (time.perf_counter() - slice_start) * 1000)
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            self.finish()
+            return
+        for _, _, progress_bar, progress_label in self.watchers:
+            self.show_progress(progress_bar, progress_label, fraction)
+        self.root.after(1, self.step)
+
+    def finish(self):
+        try:
+            with METRICS.timed('load.replay'):
+                self.storage.finish_load()
+        except Exception as e:
+            print(f"Error loading data: {e}")
+        self.running = False
+        METRICS.observe(self.name, (time.perf_counter() - self.started) * 1000)
+        STARTUP.mark(f"{self.name} finished")
+        for _, on_done, progress_bar, progress_label in self.watchers:
+            if progress_bar is not None:
+                progress_bar.grid_remove()
+                progress_label.grid_remove()
+            on_done()
+
+
+def parse_import_file(path, columns, primary_key='ID', unique_keys=(), types=None, statuses=None):
+    # Runs in a worker process: read a CSV (optionally with a header row) or JSON-lines file
+    # into typed rows, checked the same way RecordStore.add checks them. Returns
+    # (rows, errors); a row repeating an ID or unique value seen earlier in the file is an error.
+    scratch = RecordStore(columns, primary_key, unique_keys, types)
+    records = []
+    errors = []
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        if path.lower().endswith(('.jsonl', '.json')):
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    errors.append(f"Line {line_number}: not valid JSON")
+                    continue
+                if not isinstance(record, dict):
+                    errors.append(f"Line {line_number}: expected an object")
+                    continue
+                records.append((line_number, {name: record.get(name, '') for name in columns}))
+        else:
+            for line_number, row_data in enumerate(csv.reader(file), 1):
+                if not row_data or (line_number == 1 and row_data == list(columns)):
+                    continue
+                if len(row_data) != len(columns):
+                    errors.append(f"Line {line_number}: expected {len(columns)} fields, got {len(row_data)}")
+                    continue
+                records.append((line_number, dict(zip(columns, row_data))))
+    for line_number, record in records:
+        if statuses and record.get('Status') not in statuses:
+            errors.append(f"Line {line_number}: Status must be one of {', '.join(statuses)}, "
+                          f"not '{record.get('Status')}'.")
+            continue
+        try:
+            scratch.add(record)
+        except ValueError as e:
+            errors.append(f"Line {line_number}: {e}")
+    return list(scratch.rows()), errors
+
+
+IMPORT_EXECUTOR = None
+
+
+def import_executor():
+    # One worker process, started on first use. 'spawn' keeps the child clear of the
+    # persistence and compactor threads running in this process.
+    global IMPORT_EXECUTOR
+    if IMPORT_EXECUTOR is None:
+        import concurrent.futures
+        import multiprocessing
+        IMPORT_EXECUTOR = concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    return IMPORT_EXECUTOR
+
+
+def reset_import_executor():
+    # A worker process that died takes the pool with it; the next import starts a new one
+    global IMPORT_EXECUTOR
+    if IMPORT_EXECUTOR is not None:
+        IMPORT_EXECUTOR.shutdown(wait=False)
+        IMPORT_EXECUTOR = None
+
+
+def fold(value):
+    # Text filters compare case-insensitively
+    return str(value).lower()
+
+
+class Condition(abc.ABC):
+    # A filter over the columns of a RecordStore, evaluated by FilterEngine into a mask with
+    # one entry per row, or for one record by matches_record() (to follow a single edit).
+    # Combine conditions with & (and), | (or) and ~ (not).
+    @abc.abstractmethod
+    def matches_record(self, record):
+        pass
+
+    def __and__(self, other):
+        return AllOf(self, other)
+
+    def __or__(self, other):
+        return AnyOf(self, other)
+
+    def __invert__(self):
+        return Negated(self)
+
+
+class ValueCondition(Condition):
+    # A test of the values of one column. A dictionary-encoded column tests each distinct
+    # value once and then picks rows by code; other columns test every row, in C where a
+    # subclass knows how to for typed number columns.
+    def __init__(self, column):
+        self.column = column
+
+    def column_names(self):
+        return {self.column}
+
+    @abc.abstractmethod
+    def matches(self, value):
+        pass
+
+    def matches_record(self, record):
+        value = record[self.column]
+        return value is not None and self.matches(value)
+
+    def number_mask(self, masks, data):
+        return masks.test(data, self.matches)
+
+    def mask(self, masks, columns, length):
+        column = columns[self.column]
+        if isinstance(column, DictionaryColumn):
+            codes = {code for code, value in enumerate(column.dictionary)
+                     if value is not None and self.matches(value)}
+            return masks.codes_in(column.codes, codes, len(column.dictionary))
+        if isinstance(column, NumberColumn):
+            return self.number_mask(masks, column.data)
+        return masks.test(column, lambda value: value is not None and self.matches(value))
+
+
+class OneOf(ValueCondition):
+    # Genre in {Drama, Comedy}
+    def __init__(self, column, values):
+        super().__init__(column)
+        self.values = list(values)
+        self.texts = {fold(value) for value in self.values}
+
+    def matches(self, value):
+        return fold(value) in self.texts
+
+    def number_mask(self, masks, data):
+        return masks.test(data, set(self.values).__contains__)
+
+
+class Equals(OneOf):
+    # Status = Available
+    def __init__(self, column, value):
+        super().__init__(column, [value])
+
+
+class Compare(ValueCondition):
+    # Rating >= 7, with any function from the operator module
+    def __init__(self, column, operation, value):
+        super().__init__(column)
+        self.operation = operation
+        self.value = value
+
+    def matches(self, value):
+        if isinstance(value, (int, float)):
+            return self.operation(value, self.value)
+        return self.operation(fold(value), fold(self.value))
+
+    def number_mask(self, masks, data):
+        return masks.compare(data, self.operation, self.value)
+
+
+class Between(ValueCondition):
+    # Year 1990..1999, inclusive; either end may be None
+    def __init__(self, column, low=None, high=None):
+        super().__init__(column)
+        self.bounds = [Compare(column, operation, value) for operation, value
+                       in ((operator.ge, low), (operator.le, high)) if value is not None]
+
+    def matches(self, value):
+        return all(bound.matches(value) for bound in self.bounds)
+
+    def number_mask(self, masks, data):
+        mask = masks.fill(len(data), True)
+        for bound in self.bounds:
+            mask = masks.and_(mask, bound.number_mask(masks, data))
+        return mask
+
+
+class StartsWith(ValueCondition):
+    # Director starting with "kub"
+    def __init__(self, column, prefix):
+        super().__init__(column)
+        self.prefix = fold(prefix)
+
+    def matches(self, value):
+        return fold(value).startswith(self.prefix)
+
+
+class AllOf(Condition):
+    def __init__(self, *conditions):
+        self.conditions = conditions
+
+    def column_names(self):
+        return set().union(*(condition.column_names() for condition in self.conditions))
+
+    def matches_record(self, record):
+        return all(condition.matches_record(record) for condition in self.conditions)
+
+    def mask(self, masks, columns, length):
+        mask = masks.fill(length, True)
+        for condition in self.conditions:
+            mask = masks.and_(mask, condition.mask(masks, columns, length))
+        return mask
+
+
+class AnyOf(AllOf):
+    def matches_record(self, record):
+        return any(condition.matches_record(record) for condition in self.conditions)
+
+    def mask(self, masks, columns, length):
+        mask = masks.fill(length, False)
+        for condition in self.conditions:
+            mask = masks.or_(mask, condition.mask(masks, columns, length))
+        return mask
+
+
+class Negated(Condition):
+    def __init__(self, condition):
+        self.condition = condition
+
+    def column_names(self):
+        return self.condition.column_names()
+
+    def matches_record(self, record):
+        return not self.condition.matches_record(record)
+
+    def mask(self, masks, columns, length):
+        return masks.not_(self.condition.mask(masks, columns, length))
+
+
+class ByteMasks:
+    # Standard-library masks: one 0/1 byte per row. Number columns are compared with map()
+    # over their typed arrays and one-byte codes are translated through a 256-entry table,
+    # so no Python code runs per row; AND/OR go through big ints, one C loop per mask.
+    NOT_TABLE = bytes([1, 0]) + bytes(254)
+
+    def fill(self, length, value):
+        return (b'\x01' if value else b'\x00') * length
+
+    def compare(self, data, operation, value):
+        return bytes(map(operation, data, itertools.repeat(value)))
+
+    def codes_in(self, codes, wanted, size):
+        if codes.typecode == 'B':
+            table = bytearray(256)
+            for code in wanted:
+                table[code] = 1
+            return codes.tobytes().translate(table)
+        return bytes(map(wanted.__contains__, codes))
+
+    def test(self, values, predicate):
+        return bytes(map(predicate, values))
+
+    def and_(self, left, right):
+        return (int.from_bytes(left, 'little') & int.from_bytes(right, 'little')).to_bytes(len(left), 'little')
+
+    def or_(self, left, right):
+        return (int.from_bytes(left, 'little') | int.from_bytes(right, 'little')).to_bytes(len(left), 'little')
+
+    def not_(self, mask):
+        return mask.translate(self.NOT_TABLE)
+
+    def concat(self, masks):
+        return b''.join(masks)
+
+    def select(self, record_ids, mask):
+        # Deleted rows (no ID) never match, whatever the condition
+        return [record_id for record_id in itertools.compress(record_ids, mask) if record_id is not None]
+
+
+class NumpyMasks:
+    # The same with NumPy boolean arrays, reading the typed value and code arrays in place
+    def __init__(self, numpy):
+        self.numpy = numpy
+
+    def array(self, data):
+        # A view of an array.array; it must not outlive the call, or the array could not grow
+        if not len(data):
+            return self.numpy.zeros(0, dtype=data.typecode)
+        return self.numpy.frombuffer(data, dtype=data.typecode)
+
+    def fill(self, length, value):
+        return self.numpy.full(length, value, dtype=bool)
+
+    def compare(self, data, operation, value):
+        return operation(self.array(data), value)
+
+    def codes_in(self, codes, wanted, size):
+        table = self.numpy.zeros(size, dtype=bool)
+        table[list(wanted)] = True
+        return table[self.array(codes)]
+
+    def test(self, values, predicate):
+        return self.numpy.fromiter(map(predicate, values), dtype=bool, count=len(values))
+
+    def and_(self, left, right):
+        return left & right
+
+    def or_(self, left, right):
+        return left | right
+
+    def not_(self, mask):
+        return ~mask
+
+    def concat(self, masks):
+        return self.numpy.concatenate(masks)
+
+    def select(self, record_ids, mask):
+        return [record_ids[position] for position in self.numpy.flatnonzero(mask).tolist()
+                if record_ids[position] is not None]
+
+
+def make_masks(use_numpy=FILTER_USE_NUMPY):
+    if use_numpy:
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            return NumpyMasks(numpy)
+    return ByteMasks()
+
+
+def filter_partition(condition, columns, length, use_numpy):
+    # Runs in a worker process: the mask of one slice of rows
+    return condition.mask(make_masks(use_numpy), columns, length)
+
+
+class FilterEngine:
+    # Evaluates Conditions over the columns of a RecordStore and returns the record IDs that
+    # match, in catalog order, e.g.
+    #     engine.query(OneOf('Genre', ['Drama', 'Comedy']) & Between('Year', 1990, 1999)
+    #                  | Compare('Rating', operator.ge, 8))
+    # Large catalogs are split into equal row ranges for the filter worker processes.
+    def __init__(self, store, use_numpy=FILTER_USE_NUMPY, processes=FILTER_PROCESSES,
+                 parallel_rows=FILTER_PARALLEL_ROWS):
+        self.store = store
+        self.masks = make_masks(use_numpy)
+        self.processes = processes
+        self.parallel_rows = parallel_rows
+
+    @METRICS.timed('filter.query')
+    def query(self, condition):
+        for name in condition.column_names():
+            if name not in self.store.columns:
+                raise ValueError(f"Unknown column '{name}'.")
+        record_ids = self.store.columns[self.store.primary_key]
+        length = len(record_ids)
+        if self.processes > 1 and length >= self.parallel_rows:
+            mask = self.parallel_mask(condition, length)
+        else:
+            mask = condition.mask(self.masks, self.store.columns, length)
+        return self.masks.select(record_ids, mask)
+
+    def parallel_mask(self, condition, length):
+        step = -(-length // self.processes)
+        names = condition.column_names()
+        use_numpy = isinstance(self.masks, NumpyMasks)
+        try:
+            executor = filter_executor(self.processes)
+            futures = [executor.submit(filter_partition, condition,
+                                       {name: self.store.columns[name].part(start, start + step) for name in names},
+                                       min(step, length - start), use_numpy)
+                       for start in range(0, length, step)]
+            return self.masks.concat([future.result() for future in futures])
+        except (OSError, RuntimeError) as e:
+            # A worker that died takes the pool with it (BrokenProcessPool is a RuntimeError)
+            print(f"Error filtering in worker processes, filtering here instead: {e}")
+            reset_filter_executor()
+            return condition.mask(self.masks, self.store.columns, length)
+
+
+FILTER_TERM = re.compile(r'^(-?)(\w+)(>=|<=|>|<|=|:)(.*)$', re.DOTALL)
+FILTER_OPERATIONS = {'>=': operator.ge, '<=': operator.le, '>': operator.gt, '<': operator.lt}
+
+
+def parse_filter(text, store):
+    # The filter bar syntax. Terms are ANDed and OR separates alternatives (AND binds
+    # tighter); a leading - negates a term. A term is column:a,b (one of), column:low..high
+    # (inclusive, either end may be left out), column:prefix* (starts with) or
+    # column>=x (also <=, >, < and =). Column names are case-insensitive, with _ for spaces;
+    # quote values that have spaces: director:"Stanley K*"
+    import shlex
+    columns = {name.lower().replace(' ', '_'): name for name in store.keys()}
+    try:
+        tokens = shlex.split(text)
+    except ValueError:
+        raise ValueError("A quote in the filter is not closed.")
+    alternatives = [[]]
+    for token in tokens:
+        if token.lower() == 'or':
+            alternatives.append([])
+            continue
+        if token.lower() == 'and':
+            continue
+        match = FILTER_TERM.match(token)
+        if match is None:
+            raise ValueError(f"Cannot read filter '{token}'. Use column:value, e.g. genre:Drama.")
+        negate, name, operation, value = match.groups()
+        column = columns.get(name.lower())
+        if column is None:
+            raise ValueError(f"Unknown column '{name}' in filter '{token}'.")
+        condition = parse_filter_term(store, column, operation, value)
+        alternatives[-1].append(~condition if negate else condition)
+    if not all(alternatives):
+        raise ValueError("OR needs a filter on both sides.")
+    conditions = [AllOf(*terms) if len(terms) > 1 else terms[0] for terms in alternatives]
+    return AnyOf(*conditions) if len(conditions) > 1 else conditions[0]
+
+
+def parse_filter_term(store, column, operation, value):
+    def typed(text):
+        column_type = store.types.get(column)
+        if column_type is None:
+            return text.strip()
+        try:
+            return column_type(text.strip())
+        except ValueError:
+            kind = 'a whole number' if column_type is int else 'a number'
+            raise ValueError(f"{column} must be {kind}, not '{text.strip()}'.")
+
+    if operation in FILTER_OPERATIONS:
+        return Compare(column, FILTER_OPERATIONS[operation], typed(value))
+    if operation == '=':
+        return Equals(column, typed(value))
+    if '..' in value:
+        low, high = value.split('..', 1)
+        return Between(column, typed(low) if low.strip() else None, typed(high) if high.strip() else None)
+    if value.endswith('*') and ',' not in value:
+        return StartsWith(column, value[:-1])
+    return OneOf(column, [typed(part) for part in value.split(',')])
+
+
+def decade(year):
+    return year // 10 * 10
+
+
+# Facet panel columns, with the function grouping their values (None lists every value)
+VIDEO_FACETS = (('Genre', None), ('Status', None), ('Director', None), ('Year', decade))
+
+
+class FacetCounts:
+    # Live value counts of a few columns over a set of records: every record in the store,
+    # or the rows a view shows. reset() counts once (a C-level Counter over the code or
+    # value array for the whole catalog) and change events then adjust the counts in
+    # O(facets) each, so adding, editing, renting or returning a title never rescans.
+    def __init__(self, store, facets):
+        self.store = store
+        self.facets = dict(facets)  # Column -> function from a value to its bucket, or None
+        self.counts = {column: collections.Counter() for column in self.facets}
+        self.members = None  # Record IDs counted; None for every record in the store
+
+    def reset(self, record_ids=None):
+        self.members = None if record_ids is None else set(record_ids)
+        live = None
+        positions = None
+        if record_ids is None:
+            live = list(map(operator.is_not, self.store.columns[self.store.primary_key], itertools.repeat(None)))
+        else:
+            index = self.store.indexes[self.store.primary_key]
+            positions = [index[record_id] for record_id in record_ids]
+        for column, bucket in self.facets.items():
+            column_data = self.store.columns[column]
+            dictionary = None
+            if isinstance(column_data, DictionaryColumn):
+                dictionary = column_data.dictionary
+                column_data = column_data.codes
+            elif isinstance(column_data, NumberColumn):
+                column_data = column_data.data
+            if positions is None:
+                counted = collections.Counter(itertools.compress(column_data, live))
+            else:
+                counted = collections.Counter(map(column_data.__getitem__, positions))
+            # Decoding and bucketing once per distinct value, not per row
+            counts = collections.Counter()
+            for value, count in counted.items():
+                if dictionary is not None:
+                    value = dictionary[value]
+                counts[bucket(value) if bucket else value] += count
+            self.counts[column] = counts
+
+    def on_change(self, event, record_id, old_record, new_record, shown=None):
+        # For counts over the rows shown, `shown` says whether the record as it is now
+        # belongs to them (after a filter or search), as for VirtualTreeview.apply_change.
+        # Without it new records are counted in and edited ones stay where they were.
+        if event == 'clear':
+            for counts in self.counts.values():
+                counts.clear()
+            if self.members is not None:
+                self.members.clear()
+            return
+        counted = event != 'add' and (self.members is None or record_id in self.members)
+        if counted:
+            self.count(old_record, -1)
+            if self.members is not None:
+                self.members.discard(record_id)
+        if event == 'delete':
+            return
+        if shown is None:
+            shown = event == 'add' or counted
+        if self.members is None or shown:
+            self.count(new_record, 1)
+            if self.members is not None:
+                self.members.add(new_record[self.store.primary_key])
+
+    def count(self, record, delta):
+        for column, bucket in self.facets.items():
+            value = bucket(record[column]) if bucket else record[column]
+            counts = self.counts[column]
+            counts[value] += delta
+            if counts[value] <= 0:
+                del counts[value]
+
+    def top(self, column, limit=FACET_LIMIT):
+        # (value, count) pairs, most common first and ties by value
+        return sorted(self.counts[column].items(), key=lambda item: (-item[1], str(item[0])))[:limit]
+
+
+FILTER_EXECUTOR = None
+
+
+def filter_executor(processes):
+    # Started on first use, like the import worker
+    global FILTER_EXECUTOR
+    if FILTER_EXECUTOR is None:
+        import concurrent.futures
+        import multiprocessing
+        FILTER_EXECUTOR = concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+    return FILTER_EXECUTOR
+
+
+def reset_filter_executor():
+    global FILTER_EXECUTOR
+    if FILTER_EXECUTOR is not None:
+        FILTER_EXECUTOR.shutdown(wait=False)
+        FILTER_EXECUTOR = None
+
+
+class BulkImport:
+    # Imports a file into a storage backend's store: parsing and validation run in the
+    # worker process, then every valid row is merged in one batch with a single write to
+    # disk, and on_done(added IDs, error messages) is called once for the UI to refresh.
+    def __init__(self, root, storage, on_done, statuses=None):
+        self.root = root
+        self.storage = storage
+        self.on_done = on_done
+        self.statuses = statuses
+        self.future = None
+        self.started = None
+        self.running = False
+
+    def start(self, path):
+        store = self.storage.store
+        self.running = True
+        self.started = time.perf_counter()
+        self.future = import_executor().submit(parse_import_file, path, store.keys(), store.primary_key,
+                                               store.unique_keys[1:], store.types, self.statuses)
+        self.root.after(IMPORT_POLL_MS, self.poll)
+
+    def poll(self):
+        if not self.future.done():
+            self.root.after(IMPORT_POLL_MS, self.poll)
+            return
+        try:
+            rows, errors = self.future.result()
+        except Exception as e:
+            import concurrent.futures.process
+            if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+                reset_import_executor()
+            self.running = False
+            self.on_done([], [f"Could not read the file: {e}"])
+            return
+        added = self.merge(rows, errors)
+        self.running = False
+        METRICS.observe('import', (time.perf_counter() - self.started) * 1000)
+        self.on_done(added, errors)
+
+    def merge(self, rows, errors):
+        # Rows that clash with the catalog (rather than with each other) are reported here
+        store = self.storage.store
+        added = []
+        with METRICS.timed('import.merge'), self.storage.bulk_write():
+            for row_data in rows:
+                try:
+                    added.append(store.add(row_data))
+                except ValueError as e:
+                    errors.append(f"{store.primary_key} {row_data[0]}: {e}")
+        return added
+
+
+def export_records(path, store, record_ids=None):
+    # Write records (all of them, or the given IDs in that order) to a CSV or JSON-lines
+    # file. The columns are copied here and the persistence worker streams the file out.
+    columns = store.snapshot()
+    positions = None
+    if record_ids is not None:
+        index = store.indexes[store.primary_key]
+        positions = array.array('Q', (index[record_id] for record_id in record_ids))
+    PERSISTENCE.submit(('export', path), (path, store.keys(), columns, positions), write_export)
+
+
+def write_export(payloads):
+    # Worker thread: only the last export of a burst to the same file matters
+    path, names, columns, positions = payloads[-1]
+    if positions is None:
+        rows = (row_data for row_data in zip(*columns) if row_data[0] is not None)
+    else:
+        rows = ([column[position] for column in columns] for position in positions)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', newline='', encoding='utf-8') as file:
+        if path.lower().endswith(('.jsonl', '.json')):
+            for row_data in rows:
+                file.write(json.dumps(dict(zip(names, row_data))) + '\n')
+        else:
+            file.write(','.join(names) + '\n')  # parse_import_file skips this header row
+            write_rows(file, rows)
+    os.replace(temp_path, path)
+
+
+class RentalLedger:
+    # Every rental and return, indexed by video (the open rental and the full history) and by
+    # customer (open rentals), so "is it rented?" is a dict lookup. Rentals are numbered in
+    # the order this process learns of them; their times are kept in typed arrays, with
+    # time-ordered indexes so date ranges are found by bisection.
+    # On disk it is an append-only binary log of small fixed-layout records, read back with
+    # struct rather than parsed as text; writes go through the persistence worker. Several
+    # clerks append to the same log, so its records name videos, never rental numbers: a
+    # checkout carries the video, customer, rental time and due time, a checkin the video
+    # whose open rental it closes. As with the journals, the worker reads what the other
+    # clerks appended while it holds the lock, and apply_changes() (from the ChangeWatcher)
+    # applies it. Older ledgers are still read: version 2 checkouts carry no due time, and
+    # version 1 ledgers were written by one clerk with numbered RENT and RETURN records.
+    # Their rentals are due RENTAL_PERIOD_DAYS after checkout.
+    MAGIC = b'RLG3'
+    OLD_MAGICS = (b'RLG1', b'RLG2')  # Read as well; the header is upgraded on the first write
+    CHECKOUT, CHECKIN, RENAME = b'C', b'I', b'M'
+    UNDATED_CHECKOUT = b'O'  # Version 2 only
+    RENT, RETURN = b'R', b'T'  # Version 1 only
+    TIMES = struct.Struct('<Iq')  # Rental number, Unix time in seconds
+    BOOKING = struct.Struct('<qq')  # Rented and due, Unix seconds
+    WHEN = struct.Struct('<q')
+    LENGTHS = struct.Struct('<HH')  # Byte lengths of the two IDs that follow
+    LENGTH = struct.Struct('<H')  # Byte length of the one ID that follows
+    SYNC = b''  # Payload asking the worker only to read what other clerks wrote
+
+    def __init__(self, path=RENTAL_LEDGER_FILE):
+        self.path = path
+        self.video_ids = []  # Rental number -> video ID
+        self.customer_ids = []  # Rental number -> customer ID
+        self.rented_at = array.array('q')  # Rental number -> time
+        self.returned_at = array.array('q')  # Rental number -> time, 0 while still rented
+        self.due_at = array.array('q')  # Rental number -> when it is due back
+        self.returns = array.array('I')  # Rental numbers in the order their returns came in
+        # Clerks' records interleave in the log, so their times do not always come in order
+        self.rent_times = array.array('q')  # Rental times, never decreasing
+        self.rents_by_time = array.array('I')  # ...and their rental numbers
+        self.return_times = array.array('q')  # Return times, never decreasing
+        self.returns_by_time = array.array('I')  # ...and their rental numbers
+        self.active_by_video = {}  # Video ID -> rental number
+        self.active_by_customer = {}  # Customer ID -> set of rental numbers
+        self.history_by_video = {}  # Video ID -> rental numbers, oldest first
+        self.file = None  # Only used on the persistence worker thread
+        self.lock = FileLock(path + '.lock')  # Other clerks append to the same log
+        self.following = False
+        self.last_seen = None  # Ledger size and time at the last read request
+        # Worker thread: reading the records other clerks append
+        self.reader = None
+        self.read_offset = len(self.MAGIC)  # Where the records not read yet start
+        self.partial = b''  # The start of a record that is still being written
+        self.incoming = queue.SimpleQueue()  # Lists of other clerks' records
+        self.listeners = []
+        atexit.register(self.close)
+
+    def load(self):
+        # Read the log under the clerks' lock, so no record is half written by another clerk.
+        # Only a record cut short at the end was torn (by a crash in the middle of an
+        # append); it is cut off so that new records are appended to a readable file. A
+        # record that contradicts the ones before it is reported and skipped.
+        with self.lock:
+            try:
+                with open(self.path, 'rb') as file:
+                    data = file.read()
+            except FileNotFoundError:
+                self.following = True
+                return
+            self.read_offset = len(data)
+            if not data.startswith((self.MAGIC,) + self.OLD_MAGICS):
+                print(f"Ignoring '{self.path}': not a rental ledger")
+                return
+            records, end, error = self.parse(data, len(self.MAGIC))
+            if error is not None:
+                # Damage, not a torn append: keep the bytes, but nothing after them is read
+                print(f"Cannot read '{self.path}' past byte {end}: {error}")
+            elif end < len(data):
+                print(f"Dropping the incomplete record at the end of '{self.path}' (byte {end})")
+                with open(self.path, 'r+b') as file:
+                    file.truncate(end)
+                self.read_offset = end
+        for record in records:
+            self.apply_record(record)
+        self.following = True
+
+    def parse(self, data, offset):
+        # Split log bytes into records; returns (records, where the readable ones end, error).
+        # A record cut short by the end of the data ends them without an error.
+        records = []
+        while offset < len(data):
+            try:
+                record, end = self.parse_record(data, offset)
+            except struct.error:
+                break
+            except (ValueError, UnicodeDecodeError) as e:
+                return records, offset, e
+            records.append(record)
+            offset = end
+        return records, offset, None
+
+    def parse_record(self, data, offset):
+        kind = data[offset:offset + 1]
+        offset += 1
+        if kind == self.CHECKOUT:
+            rented, due = self.BOOKING.unpack_from(data, offset)
+            video_id, customer_id, offset = self.unpack_ids(data, offset + self.BOOKING.size)
+            return ('checkout', video_id, customer_id, rented, due), offset
+        if kind == self.UNDATED_CHECKOUT:
+            (when,) = self.WHEN.unpack_from(data, offset)
+            video_id, customer_id, offset = self.unpack_ids(data, offset + self.WHEN.size)
+            return ('checkout', video_id, customer_id, when, None), offset
+        if kind == self.CHECKIN:
+            (when,) = self.WHEN.unpack_from(data, offset)
+            video_id, offset = self.unpack_id(data, offset + self.WHEN.size)
+            return ('checkin', video_id, when), offset
+        if kind == self.RENAME:
+            old_id, new_id, offset = self.unpack_ids(data, offset)
+            return ('rename', old_id, new_id), offset
+        if kind in (self.RENT, self.RETURN):
+            # Version 1 numbers count the RENT records from the start of the log
+            rental, when = self.TIMES.unpack_from(data, offset)
+            offset += self.TIMES.size
+            if kind == self.RENT:
+                video_id, customer_id, offset = self.unpack_ids(data, offset)
+                return ('checkout', video_id, customer_id, when, None), offset
+            return ('return', rental, when), offset
+        raise ValueError(f"unknown record type {kind!r}")
+
+    def apply_record(self, record):
+        # Apply one record read from the log and tell the listeners
+        kind = record[0]
+        try:
+            if kind == 'checkout':
+                _, video_id, customer_id, when, due = record
+                rental = self.apply_rent(video_id, customer_id, when)
+                if due is not None:
+                    self.apply_due(rental, due)
+                self.notify('rent', rental)
+            elif kind == 'checkin' or kind == 'return':
+                rental = record[1]
+                if kind == 'checkin':
+                    rental = self.active_by_video.get(record[1])
+                    if rental is None:
+                        raise ValueError(f"video {record[1]} is not rented")
+                self.apply_return(rental, record[2])
+                self.notify('return', rental)
+            elif record[1] in self.history_by_video:
+                self.apply_rename(record[1], record[2])
+                self.notify('rename', record[1], record[2])
+        except ValueError as e:
+            print(f"Skipping rental record: {e}")
+
+    def subscribe(self, callback):
+        # callback('rent', rental), callback('return', rental) or callback('rename', old ID, new ID)
+        self.listeners.append(callback)
+
+    def notify(self, event, *details):
+        for callback in self.listeners:
+            callback(event, *details)
+
+    def unpack_ids(self, data, offset):
+        first_length, second_length = self.LENGTHS.unpack_from(data, offset)
+        offset += self.LENGTHS.size
+        end = offset + first_length + second_length
+        if end > len(data):
+            raise struct.error("record is cut short")
+        first = data[offset:offset + first_length].decode('utf-8')
+        second = data[offset + first_length:end].decode('utf-8')
+        return first, second, end
+
+    def unpack_id(self, data, offset):
+        (length,) = self.LENGTH.unpack_from(data, offset)
+        offset += self.LENGTH.size
+        if offset + length > len(data):
+            raise struct.error("record is cut short")
+        return data[offset:offset + length].decode('utf-8'), offset + length
+
+    def pack_ids(self, first, second):
+        first, second = str(first).encode('utf-8'), str(second).encode('utf-8')
+        return self.LENGTHS.pack(len(first), len(second)) + first + second
+
+    def pack_id(self, value):
+        value = str(value).encode('utf-8')
+        return self.LENGTH.pack(len(value)) + value
+
+    @staticmethod
+    def insert_time(times, rentals, when, rental):
+        # Keep a time index sorted; appending is the common case
+        if times and when < times[-1]:
+            position = bisect.bisect_right(times, when)
+            times.insert(position, when)
+            rentals.insert(position, rental)
+        else:
+            times.append(when)
+            rentals.append(rental)
+
+    def apply_rent(self, video_id, customer_id, when):
+        if video_id in self.active_by_video:
+            raise ValueError(f"video {video_id} is already rented")
+        rental = len(self.video_ids)
+        self.video_ids.append(video_id)
+        self.customer_ids.append(customer_id)
+        self.rented_at.append(when)
+        self.returned_at.append(0)
+        self.due_at.append(when + RENTAL_PERIOD_DAYS * 86400)
+        self.insert_time(self.rent_times, self.rents_by_time, when, rental)
+        self.active_by_video[video_id] = rental
+        self.active_by_customer.setdefault(customer_id, set()).add(rental)
+        self.history_by_video.setdefault(video_id, []).append(rental)
+        return rental
+
+    def apply_return(self, rental, when):
+        if rental >= len(self.video_ids) or self.returned_at[rental]:
+            raise ValueError(f"rental {rental} is not open")
+        self.returned_at[rental] = when
+        self.returns.append(rental)
+        self.insert_time(self.return_times, self.returns_by_time, when, rental)
+        del self.active_by_video[self.video_ids[rental]]
+        rentals = self.active_by_customer[self.customer_ids[rental]]
+        rentals.discard(rental)
+        if not rentals:
+            del self.active_by_customer[self.customer_ids[rental]]
+
+    def apply_due(self, rental, when):
+        if rental >= len(self.video_ids):
+            raise ValueError(f"rental {rental} does not exist")
+        self.due_at[rental] = when
+
+    def apply_rename(self, old_id, new_id):
+        history = self.history_by_video.pop(old_id, None)
+        if history is None:
+            return
+        self.history_by_video[new_id] = history
+        for rental in history:
+            self.video_ids[rental] = new_id
+        if old_id in self.active_by_video:
+            self.active_by_video[new_id] = self.active_by_video.pop(old_id)
+
+    def now(self, times):
+        # Whole seconds, never earlier than the latest entry
+        return max(int(time.time()), times[-1] if times else 0)
+
+    def rent(self, video_id, customer_id, due=None):
+        # Record a new rental, due back at `due` (Unix seconds; by default RENTAL_PERIOD_DAYS
+        # from now); returns its number
+        if video_id in self.active_by_video:
+            raise ValueError(f"Video {video_id} is already rented.")
+        when = self.now(self.rent_times)
+        rental = self.apply_rent(video_id, customer_id, when)
+        if due is not None:
+            self.apply_due(rental, due)
+        self.append(self.CHECKOUT + self.BOOKING.pack(when, self.due_at[rental])
+                    + self.pack_ids(video_id, customer_id))
+        self.notify('rent', rental)
+        return rental
+
+    def return_video(self, video_id):
+        # Close the open rental of a video; returns its number, or None if it had none
+        rental = self.active_by_video.get(video_id)
+        if rental is None:
+            return None
+        when = self.now(self.return_times)
+        self.apply_return(rental, when)
+        self.append(self.CHECKIN + self.WHEN.pack(when) + self.pack_id(video_id))
+        self.notify('return', rental)
+        return rental
+
+    def on_video_change(self, event, record_id, old_record, new_record):
+        # RecordStore listener: follow video ID changes so the history stays attached
+        if event == 'update' and new_record['ID'] != record_id and record_id in self.history_by_video:
+            self.apply_rename(record_id, new_record['ID'])
+            self.append(self.RENAME + self.pack_ids(record_id, new_record['ID']))
+            self.notify('rename', record_id, new_record['ID'])
+
+    def is_rented(self, video_id):
+        return video_id in self.active_by_video
+
+    def is_rented_by(self, customer_id, video_id):
+        rental = self.active_by_video.get(video_id)
+        return rental is not None and self.customer_ids[rental] == customer_id
+
+    def rental(self, rental):
+        return {'Rental': rental, 'Video ID': self.video_ids[rental], 'Customer ID': self.customer_ids[rental],
+                'Rented': self.rented_at[rental], 'Due': self.due_at[rental],
+                'Returned': self.returned_at[rental] or None}
+
+    def active_rentals(self, customer_id):
+        return [self.rental(rental) for rental in sorted(self.active_by_customer.get(customer_id, ()))]
+
+    def history(self, video_id):
+        return [self.rental(rental) for rental in self.history_by_video.get(video_id, ())]
+
+    def rented_between(self, start, end):
+        # Rentals that started in [start, end), oldest first (times in Unix seconds)
+        first = bisect.bisect_left(self.rent_times, start)
+        last = bisect.bisect_left(self.rent_times, end)
+        return [self.rental(rental) for rental in self.rents_by_time[first:last]]
+
+    def returned_between(self, start, end):
+        first = bisect.bisect_left(self.return_times, start)
+        last = bisect.bisect_left(self.return_times, end)
+        return [self.rental(rental) for rental in self.returns_by_time[first:last]]
+
+    def append(self, record):
+        PERSISTENCE.submit(('ledger', self.path), record, self.write)
+
+    def write(self, records):
+        # Worker thread, holding the clerks' lock: catch up on what the others appended, then
+        # append this clerk's records with one write and one fsync
+        records = [record for record in records if record != self.SYNC]
+        with self.lock:
+            if self.file is None:
+                self.upgrade_header()
+                self.file = open(self.path, 'ab')
+            self.follow()
+            if not records:
+                return
+            end = self.file.seek(0, os.SEEK_END)
+            if self.partial:
+                # The others append whole records under the lock, so a clerk crashed in the
+                # middle of this one; cut it off so that the new records can be read
+                end -= len(self.partial)
+                print(f"Dropping the incomplete record at the end of '{self.path}' (byte {end})")
+                self.file.truncate(end)
+                self.partial = b''
+            if end == 0:
+                records.insert(0, self.MAGIC)
+            self.file.write(b''.join(records))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.reader.seek(self.file.tell())  # This clerk's own records are no news to it
+
+    def follow(self):
+        # Worker thread, under the lock: read the records other clerks appended
+        if self.reader is None:
+            self.reader = open(self.path, 'rb')
+            self.reader.seek(self.read_offset)
+        data = self.partial + self.reader.read()
+        records, end, error = self.parse(data, 0)
+        self.partial = data[end:]
+        if error is not None:
+            print(f"Ignoring unreadable rental records in '{self.path}': {error}")
+            self.partial = b''
+        if records:
+            self.incoming.put(records)
+
+    def check_for_changes(self):
+        # UI thread, from the ChangeWatcher: have the worker read the log, but only when it
+        # was written to since the last look
+        if not self.following:
+            return
+        try:
+            stat = os.stat(self.path)
+            seen = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            seen = None
+        if seen != self.last_seen:
+            self.last_seen = seen
+            PERSISTENCE.submit(('ledger', self.path), self.SYNC, self.write)
+
+    def apply_changes(self):
+        # UI thread: apply the rentals and returns other clerks recorded
+        while True:
+            try:
+                records = self.incoming.get_nowait()
+            except queue.Empty:
+                return
+            for record in records:
+                self.apply_record(record)
+            METRICS.count('ledger.remote_changes', len(records))
+
+    def sync(self):
+        # Write this clerk's records and apply everything the others have written so far
+        PERSISTENCE.submit(('ledger', self.path), self.SYNC, self.write)
+        PERSISTENCE.flush()
+        self.apply_changes()
+
+    def upgrade_header(self):
+        # Worker thread: an older ledger is about to get records its version cannot read;
+        # mark it as the current version so that they are not taken for damage
+        try:
+            with open(self.path, 'r+b') as file:
+                if file.read(len(self.MAGIC)) in self.OLD_MAGICS:
+                    file.seek(0)
+                    file.write(self.MAGIC)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        PERSISTENCE.flush()
+        if self.file is not None or self.reader is not None:
+            PERSISTENCE.submit(('close', self.path), None, lambda payloads: self.close_file())
+            PERSISTENCE.flush()
+
+    def close_file(self):
+        for file in (self.file, self.reader):
+            if file is not None:
+                file.close()
+        self.file = None
+        self.reader = None
+
+
+class OverdueScheduler:
+    # Finds rentals as they become overdue without scanning the open ones: they wait in a
+    # min-heap keyed by due time, and a single root.after timer is set for the earliest.
+    # When it fires, the rentals now past due are popped, O(log n) each, and reported to the
+    # listeners; returned rentals are not searched for in the heap but skipped when they
+    # reach the top. Without a root (--headless), poll() brings it up to date on demand.
+    def __init__(self, ledger, clock=time.time):
+        self.ledger = ledger
+        self.clock = clock
+        self.heap = []  # (due time, rental number) of open rentals not yet found overdue
+        self.overdue = {}  # Rental number -> due time of the open overdue rentals, as found
+        self.listeners = []  # listener(newly overdue rentals, overdue rentals returned)
+        self.root = None
+        self.timer = None
+        self.timer_due = None  # When the pending timer fires
+        self.started = False
+
+    def start(self, root=None):
+        # One sort of the open rentals: those already past due are overdue, the rest (a sorted
+        # list is a heap) wait for their time. From here on the ledger's events keep it current.
+        if self.started:
+            return
+        self.started = True
+        self.root = root
+        ledger = self.ledger
+        # Sorting the numbers by due time is several times faster than sorting (due, rental)
+        # pairs; sorting the numbers first keeps ties in the order the heap compares them
+        rentals = sorted(sorted(ledger.active_by_video.values()), key=ledger.due_at.__getitem__)
+        dues = [ledger.due_at[rental] for rental in rentals]
+        split = bisect.bisect_right(dues, self.clock())
+        self.overdue = dict(zip(rentals[:split], dues[:split]))
+        self.heap = list(zip(dues[split:], rentals[split:]))
+        ledger.subscribe(self.on_ledger_event)
+        if self.overdue:
+            METRICS.count('overdue.found', len(self.overdue))
+            self.notify(list(self.overdue), [])
+        self.arm()
+
+    def on_ledger_event(self, event, *details):
+        if event == 'rent':
+            rental = details[0]
+            heapq.heappush(self.heap, (self.ledger.due_at[rental], rental))
+            self.arm()
+        elif event == 'return':
+            if self.overdue.pop(details[0], None) is not None:
+                self.notify([], [details[0]])
+        elif event == 'rename' and self.overdue:
+            self.notify([], [])  # Only the titles shown changed
+
+    def poll(self):
+        # Move the rentals that are past due now from the heap to `overdue`; returns them
+        self.timer = None
+        ledger = self.ledger
+        heap = self.heap
+        now = self.clock()
+        found = []
+        while heap and heap[0][0] <= now:
+            due, rental = heapq.heappop(heap)
+            if not ledger.returned_at[rental] and ledger.due_at[rental] == due:
+                self.overdue[rental] = due
+                found.append(rental)
+        if found:
+            METRICS.count('overdue.found', len(found))
+            self.notify(found, [])
+        self.arm()
+        return found
+
+    def arm(self):
+        # Keep one timer, for the earliest due time, but never longer than OVERDUE_MAX_WAIT_MS
+        if self.root is None:
+            return
+        due = self.heap[0][0] if self.heap else None
+        if self.timer is not None:
+            if due is None or due >= self.timer_due:
+                return  # The pending timer fires early enough
+            self.root.after_cancel(self.timer)
+        now = self.clock()
+        delay = OVERDUE_MAX_WAIT_MS if due is None else min(OVERDUE_MAX_WAIT_MS, max(0, int((due - now) * 1000)))
+        self.timer_due = now + delay / 1000
+        self.timer = self.root.after(delay, self.poll)
+
+    def notify(self, found, returned):
+        for listener in self.listeners:
+            listener(found, returned)
+
+
+class RentalAnalytics:
+    # Materialized rental statistics: rentals per video, per genre (as it was when rented)
+    # and per customer, and per day the rentals, returns and catalog size. The first time
+    # they are needed they are built in one pass over the ledger; from then on every
+    # rental and return is folded in as the ledger reports it. They are saved to
+    # ANALYTICS_FILE together with how far into the ledger they go, so the next start
+    # only folds in the rentals and returns recorded since. The catalog size of a day is
+    # only known for days seen as they happen; days before are kept without one (None).
+    FORMAT = 1
+
+    def __init__(self, ledger, video_data, path=ANALYTICS_FILE, clock=time.time):
+        self.ledger = ledger
+        self.video_data = video_data
+        self.path = path
+        self.by_video = collections.Counter()
+        self.by_genre = collections.Counter()
+        self.by_customer = collections.Counter()
+        self.daily = {}  # 'YYYY-MM-DD' -> [rentals, returns, catalog size or None]
+        self.rentals_seen = 0  # Ledger rentals folded in so far
+        self.returns_seen = 0  # ...and returns, in the order of ledger.returns
+        self.day_bounds = (0, 0, None)  # Start, end and key of the last day looked up
+        self.clock = clock
+        self.dirty = False
+        self.listeners = []  # Called with no arguments after every change
+
+    def start(self):
+        # Pick up the saved aggregates (or start over), catch up, then follow the ledger
+        with METRICS.timed('analytics.start'):
+            if not self.load():
+                self.reset()
+            self.catch_up()
+        self.ledger.subscribe(self.on_ledger_event)
+
+    def reset(self):
+        self.by_video.clear()
+        self.by_genre.clear()
+        self.by_customer.clear()
+        self.daily = {}
+        self.rentals_seen = self.returns_seen = 0
+
+    def load(self):
+        # True if the saved aggregates belong to this ledger and can be brought up to date
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print(f"Rebuilding the rental analytics: cannot read '{self.path}': {e}")
+            return False
+        ledger = self.ledger
+        first_rental = ledger.rented_at[0] if ledger.rented_at else None
+        if (saved.get('format') != self.FORMAT or saved.get('first_rental') != first_rental
+                or saved['rentals_seen'] > len(ledger.video_ids) or saved['returns_seen'] > len(ledger.returns)):
+            return False  # Saved for another ledger, or the ledger was cut short since
+        self.by_video = collections.Counter(saved['by_video'])
+        self.by_genre = collections.Counter(saved['by_genre'])
+        self.by_customer = collections.Counter(saved['by_customer'])
+        self.daily = saved['daily']
+        self.rentals_seen = saved['rentals_seen']
+        self.returns_seen = saved['returns_seen']
+        return True
+
+    def catch_up(self):
+        # Fold in the rentals and returns the ledger has that the aggregates do not
+        ledger = self.ledger
+        catalog_size = len(self.video_data)
+        for rental in range(self.rentals_seen, len(ledger.video_ids)):
+            video_id = ledger.video_ids[rental]
+            self.by_video[video_id] += 1
+            self.by_genre[self.video_data.value(video_id, 'Genre') if video_id in self.video_data else 'Unknown'] += 1
+            self.by_customer[ledger.customer_ids[rental]] += 1
+            day = self.day(ledger.rented_at[rental], catalog_size)
+            day[0] += 1
+        for position in range(self.returns_seen, len(ledger.returns)):
+            day = self.day(ledger.returned_at[ledger.returns[position]], catalog_size)
+            day[1] += 1
+        if self.rentals_seen != len(ledger.video_ids) or self.returns_seen != len(ledger.returns):
+            self.rentals_seen = len(ledger.video_ids)
+            self.returns_seen = len(ledger.returns)
+            self.dirty = True
+
+    def day(self, when, catalog_size):
+        # The daily entry for a Unix time (local calendar day). Times come mostly in order,
+        # so the bounds of the day last looked up are kept. A new entry for today is stamped
+        # with the catalog size; one for an earlier day (first seen catching up) is not, and
+        # an entry's stamp is never changed afterwards.
+        start, end, key = self.day_bounds
+        if not start <= when < end:
+            year, month, day_of_month = time.localtime(when)[:3]
+            start = time.mktime((year, month, day_of_month, 0, 0, 0, 0, 0, -1))
+            end = time.mktime((year, month, day_of_month + 1, 0, 0, 0, 0, 0, -1))
+            key = f"{year:04d}-{month:02d}-{day_of_month:02d}"
+            self.day_bounds = (start, end, key)
+        entry = self.daily.get(key)
+        if entry is None:
+            today = start <= self.clock() < end
+            entry = self.daily[key] = [0, 0, catalog_size if today else None]
+        return entry
+
+    def on_ledger_event(self, event, *details):
+        if event == 'rename':
+            old_id, new_id = details
+            if old_id in self.by_video:
+                self.by_video[new_id] += self.by_video.pop(old_id)
+                self.dirty = True
+        else:
+            self.catch_up()  # The new rental or return is the next one in the ledger
+        for listener in self.listeners:
+            listener()
+
+    def top_videos(self, limit=ANALYTICS_TOP):
+        return self.by_video.most_common(limit)
+
+    def top_customers(self, limit=ANALYTICS_TOP):
+        return self.by_customer.most_common(limit)
+
+    def genres(self):
+        return self.by_genre.most_common()
+
+    def days(self, count=ANALYTICS_DAYS):
+        # (day, rentals, returns, videos out at the end of the day, catalog size or None) of
+        # the last `count` days with any activity, oldest first
+        rows = []
+        out = 0
+        for key in sorted(self.daily):
+            rentals, returns, catalog_size = self.daily[key]
+            out += rentals - returns
+            rows.append((key, rentals, returns, out, catalog_size))
+        return rows[-count:]
+
+    def save(self):
+        # Hand a copy to the persistence worker, which replaces the file atomically. Caught
+        # up with the whole ledger file first, so that the counts saved cover its first
+        # rentals_seen rentals and returns_seen returns, whichever clerks recorded them.
+        self.ledger.sync()
+        if not self.dirty:
+            return
+        self.dirty = False
+        ledger = self.ledger
+        state = {'format': self.FORMAT, 'first_rental': ledger.rented_at[0] if ledger.rented_at else None,
+                 'rentals_seen': self.rentals_seen, 'returns_seen': self.returns_seen,
+                 'by_video': dict(self.by_video), 'by_genre': dict(self.by_genre),
+                 'by_customer': dict(self.by_customer), 'daily': {key: list(entry) for key, entry in self.daily.items()}}
+        PERSISTENCE.submit(('analytics', self.path), state, self.write)
+
+    def write(self, states):
+        # Worker thread: only the latest state of a burst matters
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(states[-1], file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+
+class Repository:
+    # The one in-memory copy of the videos, customers and rentals, with their indexes,
+    # storage backends and loaders, owned by TabbedApp and shared by every tab. Tabs and
+    # dialogs subscribe to video_data/customer_data (add/update/delete/clear events) and
+    # to the ledger, so a change made anywhere shows up everywhere without a reload.
+    def __init__(self, root=None):
+        self.root = root
+        self.video_data = RecordStore(VIDEO_COLUMNS, unique_keys=('Name',), types=VIDEO_COLUMN_TYPES,
+                                      categorical=VIDEO_CATEGORICAL_COLUMNS)
+        self.video_sort_index = SortIndex(self.video_data, {'ID': natural_key})
+        self.video_search_index = NgramIndex(('Name', 'Director', 'Genre'))
+        self.video_data.subscribe(self.video_search_index.on_change)
+        self.video_filter_engine = FilterEngine(self.video_data)
+        self.video_storage = make_storage(DATA_FILE, 'videos', self.video_data, indexed=('Name', 'Status'))
+
+        self.customer_data = RecordStore(CUSTOMER_COLUMNS)
+        self.customer_sort_index = SortIndex(self.customer_data, {'ID': natural_key})
+        self.customer_storage = make_storage(CUSTOMER_DATA_FILE, 'customers', self.customer_data,
+                                             indexed=('First Name', 'Last Name'))
+        # Type-ahead lookups for the rent dialogs
+        self.customer_prefix_index = PrefixIndex(self.customer_data, CUSTOMER_SEARCH_COLUMNS, customer_search_terms)
+        self.video_prefix_index = PrefixIndex(self.video_data, VIDEO_SEARCH_COLUMNS, video_search_terms)
+
+        self.ledger = RentalLedger()
+        self.ledger.load()
+        self.video_data.subscribe(self.ledger.on_video_change)
+        self.overdue = OverdueScheduler(self.ledger)  # Started with the loaders
+
+        self.analytics = None  # Built the first time the statistics are asked for
+
+        self.video_loader = ProgressiveLoader(root, self.video_storage, name='load.videos')
+        self.customer_loader = ProgressiveLoader(root, self.customer_storage, name='load.customers')
+
+    def start_loading(self):
+        # Both catalogs stream in side by side; the customers are needed by the rent dialogs
+        # even while the customer tab has not been opened
+        for loader in (self.video_loader, self.customer_loader):
+            if loader.started is None:
+                loader.start()
+        self.overdue.start(self.root)
+
+    def rent(self, customer_id, video_id):
+        # Rent a video to a customer (for the tabs and the JSON API alike); returns the rental
+        # number, or raises ValueError saying why not. The caller saves the video storage.
+        _, failures = self.rent_many(customer_id, [video_id])
+        if failures:
+            raise ValueError(failures[0][1])
+        return self.ledger.active_by_video[video_id]
+
+    def return_video(self, video_id):
+        # Mark a video available and close its open rental; returns the rental number (None
+        # for a video marked rented before rentals were recorded), or raises ValueError
+        # saying why not, as return_many reports it. The caller saves the video storage.
+        rental = self.ledger.active_by_video.get(video_id)
+        _, failures = self.return_many([video_id])
+        if failures:
+            raise ValueError(failures[0][1])
+        return rental
+
+    def rent_many(self, customer_id, video_ids):
+        # Rent several videos to one customer; returns (rented video IDs, [(video ID, reason)]).
+        # One video that cannot be rented does not stop the others. The caller wraps the
+        # batch in one storage transaction and saves once.
+        if customer_id not in self.customer_data:
+            raise ValueError("The selected customer no longer exists.")
+        self.ledger.apply_changes()  # Other clerks' rentals read so far
+        rented, failures = [], []
+        for video_id in dict.fromkeys(video_ids):
+            if video_id not in self.video_data:
+                failures.append((video_id, "The selected movie no longer exists."))
+            elif self.ledger.is_rented_by(customer_id, video_id):
+                failures.append((video_id, "This movie is already rented by the selected customer."))
+            elif self.ledger.is_rented(video_id) or self.video_data.value(video_id, 'Status') == 'Rented':
+                failures.append((video_id, "This movie is already rented."))
+            else:
+                self.video_data.set_value(video_id, 'Status', 'Rented')
+                rented.append(video_id)
+        # The ledger records follow all the store changes, so each file gets one write
+        for video_id in rented:
+            self.ledger.rent(video_id, customer_id)
+        return rented, failures
+
+    def return_many(self, video_ids):
+        # Return several videos; returns (returned video IDs, [(video ID, reason)])
+        returned, failures = [], []
+        for video_id in dict.fromkeys(video_ids):
+            if video_id not in self.video_data:
+                failures.append((video_id, "No video has this ID."))
+            elif not self.ledger.is_rented(video_id) and self.video_data.value(video_id, 'Status') != 'Rented':
+                failures.append((video_id, "This movie is not rented."))
+            else:
+                self.video_data.set_value(video_id, 'Status', 'Available')
+                returned.append(video_id)
+        for video_id in returned:
+            self.ledger.return_video(video_id)
+        return returned, failures
+
+    def get_analytics(self):
+        # Rental statistics, built (or brought up to date) on first use
+        if self.analytics is None:
+            self.analytics = RentalAnalytics(self.ledger, self.video_data)
+            self.analytics.start()
+        return self.analytics
+
+    def journals(self):
+        # The journals other clerks' processes may be writing to as well
+        return [storage.journal for storage in (self.video_storage, self.customer_storage)
+                if isinstance(storage, TextStorage) and storage.journal]
+
+    def shared_logs(self):
+        # Everything the ChangeWatcher follows: the journals and the rental ledger
+        return self.journals() + [self.ledger]
+
+    def close(self):
+        if self.analytics is not None:
+            self.analytics.save()
+        for storage in (self.video_storage, self.customer_storage):
+            storage.close()
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def make_storage(path, table, store, indexed=()):
+    if STORAGE_BACKEND == 'sqlite':
+        return SQLiteStorage(SQLITE_DATABASE, table, store, indexed=indexed, migrate_from=path)
+    if STORAGE_BACKEND == 'mmap' and table == 'videos':
+        return MappedStorage(MAPPED_VIDEO_FILE, store, MAPPED_VIDEO_WIDTHS, migrate_from=path)
+    return TextStorage(path, store)
+
+
+def fsync_directory(path):
+    # Make a rename inside the directory durable (not supported on Windows)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def longest_increasing_run(sequence):
+    # Positions of one longest strictly increasing subsequence (patience sorting, O(n log n))
+    tails, tail_positions, previous = [], [], [None] * len(sequence)
+    for position, value in enumerate(sequence):
+        slot = bisect.bisect_left(tails, value)
+        if slot == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[slot] = value
+            tail_positions[slot] = position
+        previous[position] = tail_positions[slot - 1] if slot else None
+    run = []
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        run.append(position)
+        position = previous[position]
+    return run[::-1]
+
+
+class VirtualTreeview:
+    # Keeps the full ordered list of row keys (record IDs) in Python and maps them to
+    # Treeview items. Only the rows on screen are materialized when virtual is set, and
+    # every change is applied as a minimal insert/delete/move diff against the items
+    # that are already in Tk instead of clearing and reinserting the tree. Tk forgets the
+    # selection of the items it drops, so the selected row keys are kept here as well and
+    # selected again when their rows come back into view. Row keys are found through a
+    # key -> position map, and removed rows are dropped from the list in one pass on the
+    # next render, so a burst of edits (a batch return under a filter) stays linear.
+    def __init__(self, tree, scrollbar, get_values, virtual=True, overscan=VIRTUAL_OVERSCAN):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.get_values = get_values  # Callback returning the row values for a row key
+        self.virtual = virtual
+        self.overscan = overscan
+        self.rows = []  # Row keys of the full view, in display order
+        self.positions = {}  # Row key -> position in self.rows, for the rows up to len(positions)
+        self.removed = set()  # Row keys still in self.rows until the next render
+        self.render_id = None
+        self.first = 0  # Position in self.rows of the first visible row
+        self.page_size = int(tree.cget('height'))
+        self.keys_by_iid = {}  # Materialized Treeview items -> row keys
+        self.iids_by_key = {}
+        self.selected = {}  # Selected row keys, in the order they were selected (virtual only)
+
+        if not self.virtual:
+            if self.scrollbar is not None:
+                self.scrollbar.configure(command=self.tree.yview)
+                self.tree.configure(yscrollcommand=self.scrollbar.set)
+            return
+        self.scrollbar.configure(command=self.yview)
+        self.tree.bind('<Configure>', self.on_configure)
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll(3))
+        self.tree.bind('<Up>', lambda event: self.on_key_move(-1))
+        self.tree.bind('<Down>', lambda event: self.on_key_move(1))
+        self.tree.bind('<Prior>', lambda event: self.scroll(-self.page_size))
+        self.tree.bind('<Next>', lambda event: self.scroll(self.page_size))
+        self.tree.bind('<Home>', lambda event: self.scroll_to(0))
+        self.tree.bind('<End>', lambda event: self.scroll_to(len(self.rows)))
+        self.tree.bind('<ButtonPress-1>', self.on_press, add='+')
+        self.tree.bind('<<TreeviewSelect>>', self.on_select, add='+')
+
+    def set_rows(self, rows, keep_position=False):
+        # Replace the full view (after a load, search or sort); rows no longer shown are
+        # no longer selected
+        removed, self.removed = self.removed, set()
+        self.rows = [key for key in rows if key not in removed] if removed else list(rows)
+        self.positions = {}
+        if self.selected:
+            shown = set(self.rows)
+            self.selected = {key: None for key in self.selected if key in shown}
+        if not keep_position:
+            self.first = 0
+        self.render()
+
+    def key_for_item(self, iid):
+        return self.keys_by_iid.get(iid)
+
+    def selected_keys(self):
+        # Row keys of the whole selection, including rows scrolled out of view
+        if not self.virtual:
+            return [self.keys_by_iid[iid] for iid in self.tree.selection()]
+        return list(self.selected)
+
+    def set_selection(self, keys):
+        # Select exactly these rows (those on screen are selected in Tk right away)
+        self.selected = dict.fromkeys(keys)
+        self.tree.selection_set([self.iids_by_key[key] for key in self.selected if key in self.iids_by_key])
+
+    def on_press(self, event):
+        # A click without Shift or Control starts a new selection, off-screen rows included;
+        # the Treeview's own binding then selects the clicked row
+        if not event.state & 0x0005 and self.tree.identify_region(event.x, event.y) in ('cell', 'tree'):
+            self.selected.clear()
+
+    def on_select(self, event):
+        # Tk reports the selection of the materialized rows only; the rest stay as they were
+        selection = set(self.tree.selection())
+        for iid, key in self.keys_by_iid.items():
+            if iid in selection:
+                self.selected[key] = None
+            else:
+                self.selected.pop(key, None)
+
+    def apply_change(self, event, key, old_record, new_record, key_column='ID', shown=None):
+        # Follow one RecordStore change event; new records go at the end of the rows shown.
+        # For a view narrowed by a filter or search, `shown` says whether the record as it
+        # is now belongs in it, so that an edit brings its row in or takes it out.
+        if event == 'add':
+            if shown is not False:
+                self.insert_row(key)
+        elif event == 'update':
+            new_key = new_record[key_column]
+            if shown is not None and shown != self.contains(key):
+                if shown:
+                    self.insert_row(new_key)
+                else:
+                    self.remove_row(key)
+            elif new_key != key:
+                self.rename_row(key, new_key)
+            else:
+                self.update_row(key)
+        elif event == 'delete':
+            self.remove_row(key)
+        elif event == 'clear':
+            self.set_rows([])
+
+    def position(self, key):
+        # Position of a row key in self.rows, or None if it is not shown. Rows appended
+        # since the last lookup (also by extending self.rows) are mapped first.
+        positions = self.positions
+        rows = self.rows
+        if len(positions) < len(rows):
+            start = len(positions)
+            positions.update(zip(rows[start:], range(start, len(rows))))
+        position = positions.get(key)
+        return None if position is None or key in self.removed else position
+
+    def contains(self, key):
+        return self.position(key) is not None
+
+    def update_row(self, key):
+        # A single record changed: touch its item only if it is materialized
+        iid = self.iids_by_key.get(key)
+        if iid is not None:
+            self.tree.item(iid, values=self.get_values(key))
+
+    def insert_row(self, key, position=None):
+        if key in self.removed:
+            # Back before its old row was dropped; its item may still show the old values
+            self.drop_removed()
+            self.update_row(key)
+        if position is None:
+            self.rows.append(key)
+        else:
+            self.rows.insert(position, key)
+            self.positions = {}
+        self.render()
+
+    def remove_row(self, key):
+        if self.position(key) is None:
+            return
+        self.removed.add(key)
+        self.selected.pop(key, None)
+        if self.render_id is None:
+            self.render_id = self.tree.after_idle(self.render)  # Once for a burst of removals
+
+    def drop_removed(self):
+        removed, self.removed = self.removed, set()
+        self.rows = [key for key in self.rows if key not in removed]
+        self.positions = {}
+
+    def rename_row(self, old_key, new_key):
+        # The record ID itself was edited; keep the same Treeview item for it
+        position = self.position(old_key)
+        if position is None:
+            return  # Not in the rows shown
+        self.rows[position] = new_key
+        self.positions[new_key] = self.positions.pop(old_key)
+        if old_key in self.selected:
+            self.selected = {new_key if key == old_key else key: None for key in self.selected}
+        iid = self.iids_by_key.pop(old_key, None)
+        if iid is not None:
+            self.iids_by_key[new_key] = iid
+            self.keys_by_iid[iid] = new_key
+            self.update_row(new_key)
+
+    @METRICS.timed('view.render')
+    def render(self):
+        # Clamp the scroll position and work out which rows need to be materialized
+        if self.render_id is not None:
+            self.tree.after_cancel(self.render_id)
+            self.render_id = None
+        if self.removed:
+            self.drop_removed()
+        total = len(self.rows)
+        if self.virtual:
+            self.first = max(0, min(self.first, total - self.page_size))
+            start = max(0, self.first - self.overscan)
+            end = min(total, self.first + self.page_size + self.overscan)
+        else:
+            self.first, start, end = 0, 0, total
+        self.apply_diff(self.rows[start:end])
+
+        if self.virtual:
+            # Hide the overscan rows above the viewport
+            self.tree.yview_moveto(0)
+            if self.first > start:
+                self.tree.yview_scroll(self.first - start, 'units')
+            self.update_scrollbar()
+
+    def apply_diff(self, keys):
+        # Turn the materialized items into exactly `keys`, in order, with as few Tk calls as possible
+        wanted = set(keys)
+        stale = [iid for iid, key in self.keys_by_iid.items() if key not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                del self.iids_by_key[self.keys_by_iid.pop(iid)]
+
+        # Items already in Tk that sit on a longest increasing run of their new positions stay put;
+        # the rest are detached in one call and reattached at their new position below
+        current = [self.keys_by_iid[iid] for iid in self.tree.get_children('')]
+        new_positions = {key: position for position, key in enumerate(keys)}
+        sequence = [new_positions[key] for key in current]
+        unmoved = {current[position] for position in longest_increasing_run(sequence)}
+        moved = [self.iids_by_key[key] for key in current if key not in unmoved]
+        if moved:
+            self.tree.detach(*moved)
+
+        for position, key in enumerate(keys):
+            iid = self.iids_by_key.get(key)
+            if iid is None:
+                iid = self.tree.insert('', position, values=self.get_values(key))
+                self.keys_by_iid[iid] = key
+                self.iids_by_key[key] = iid
+            elif key not in unmoved:
+                self.tree.move(iid, '', position)
+
+        if self.virtual and self.selected:
+            # Rows coming back into view (or moved) are selected again
+            reselect = [self.iids_by_key[key] for key in keys if key in self.selected]
+            if reselect:
+                self.tree.selection_add(reselect)
+
+    def refresh_values(self):
+        # Rebind the values of the rows currently on screen without touching the view
+        for iid, key in self.keys_by_iid.items():
+            self.tree.item(iid, values=self.get_values(key))
+
+    def update_scrollbar(self):
+        total = len(self.rows)
+        if total <= self.page_size:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.page_size) / total))
+
+    def scroll(self, rows):
+        self.scroll_to(self.first + rows)
+        return 'break'
+
+    def scroll_to(self, position):
+        previous = self.first
+        self.first = max(0, min(position, len(self.rows) - self.page_size))
+        if self.first != previous:
+            self.render()
+        return 'break'
+
+    def yview(self, *args):
+        # Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * len(self.rows)))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.page_size
+            self.scroll(amount)
+
+    def on_mousewheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def on_key_move(self, step):
+        # Move the selection one row, scrolling the window when it reaches the edge
+        selection = self.tree.selection()
+        position = self.position(self.keys_by_iid.get(selection[0])) if selection else None
+        if position is None:
+            return None
+        position += step
+        if position < 0 or position >= len(self.rows):
+            return 'break'
+        if position < self.first:
+            self.scroll_to(position)
+        elif position >= self.first + self.page_size:
+            self.scroll_to(position - self.page_size + 1)
+        self.set_selection([self.rows[position]])
+        iid = self.iids_by_key.get(self.rows[position])
+        if iid:
+            self.tree.focus(iid)
+        return 'break'
+
+    def on_configure(self, event):
+        # Keep the number of materialized rows in step with the widget height
+        style = ttk.Style()
+        row_height = int(style.lookup('Treeview', 'rowheight') or 20)
+        page_size = max(1, event.height // row_height - 1)  # Minus the heading row
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self.render()
+
+
+def report_batch(done_text, failures, parent=None):
+    # Tell the clerk how a batch went, listing the items that failed and why (the first
+    # BATCH_REPORT_LINES of them); a batch of one that went through needs no message
+    if failures:
+        lines = [f"{record_id}: {reason}" for record_id, reason in failures[:BATCH_REPORT_LINES]]
+        if len(failures) > BATCH_REPORT_LINES:
+            lines.append(f"...and {len(failures) - BATCH_REPORT_LINES} more")
+        messagebox.showwarning("Some items failed", done_text + "\n\n" + "\n".join(lines), parent=parent)
+    elif done_text:
+        messagebox.showinfo("Done", done_text, parent=parent)
+
+
+class TypeAheadPicker:
+    # An entry with the best few matches listed under it, looked up in a PrefixIndex on
+    # every keystroke. Up/Down move through the matches; Return or a double click picks one.
+    def __init__(self, parent, index, describe, on_pick=None, limit=PICKER_MATCHES):
+        self.index = index
+        self.describe = describe  # Record ID -> the line shown for it
+        self.on_pick = on_pick
+        self.limit = limit
+        self.matches = []  # Record IDs of the listed matches, in listbox order
+        self.frame = ttk.Frame(parent)
+        self.entry = ttk.Entry(self.frame, width=40)
+        self.entry.grid(row=0, column=0, sticky='EW')
+        self.listbox = tk.Listbox(self.frame, height=10, width=60, exportselection=False)
+        self.listbox.grid(row=1, column=0, sticky='NSEW')
+        self.frame.grid_columnconfigure(0, weight=1)
+        self.entry.bind('<KeyRelease>', self.on_key)
+        self.entry.bind('<Down>', lambda event: self.move(1))
+        self.entry.bind('<Up>', lambda event: self.move(-1))
+        self.entry.bind('<Return>', lambda event: self.pick())
+        self.listbox.bind('<Double-Button-1>', lambda event: self.pick())
+
+    def grid(self, **options):
+        self.frame.grid(**options)
+
+    def grid_remove(self):
+        self.frame.grid_remove()
+
+    def on_key(self, event):
+        if event.keysym not in ('Up', 'Down', 'Return'):
+            self.refresh()
+
+    @METRICS.timed('picker.search')
+    def refresh(self):
+        self.matches = self.index.search(self.entry.get(), self.limit)
+        self.listbox.delete(0, tk.END)
+        for record_id in self.matches:
+            self.listbox.insert(tk.END, self.describe(record_id))
+        if self.matches:
+            self.listbox.selection_set(0)  # Return takes the best match
+
+    def move(self, delta):
+        if self.matches:
+            selection = self.listbox.curselection()
+            position = min(max((selection[0] if selection else -1) + delta, 0), len(self.matches) - 1)
+            self.listbox.selection_clear(0, tk.END)
+            self.listbox.selection_set(position)
+            self.listbox.see(position)
+        return 'break'
+
+    def selected(self):
+        selection = self.listbox.curselection()
+        return self.matches[selection[0]] if selection else None
+
+    def pick(self):
+        if self.on_pick is not None and self.selected() is not None:
+            self.on_pick()
+        return 'break'
+
+    def reset(self):
+        self.entry.delete(0, tk.END)
+        self.matches = []
+        self.listbox.delete(0, tk.END)
+
+
+class RentDialog:
+    # The one rent window of a tab, hidden rather than destroyed between rentals so it
+    # opens instantly. The customer, and the video when none was selected beforehand, are
+    # picked by typing a few characters of a name, ID, phone number or email. Opened for
+    # several videos (a multi-selection or a scanned stack), it rents them all at once.
+    def __init__(self, root, repository, on_rent):
+        self.repository = repository
+        self.on_rent = on_rent  # (customer ID, video IDs) -> True once the rental went through
+        self.video_ids = []  # Videos selected in the tab (or scanned); empty: pick one here
+        self.visible = False
+        self.refresh_id = None
+        self.window = tk.Toplevel(root)
+        self.window.title("Rent Movie")
+        self.window.protocol('WM_DELETE_WINDOW', self.close)
+        self.window.bind('<Escape>', lambda event: self.close())
+
+        self.video_label = ttk.Label(self.window, text="")
+        self.video_label.grid(row=0, column=0, padx=10, pady=5, sticky='W')
+        self.video_picker = TypeAheadPicker(self.window, repository.video_prefix_index, self.describe_video,
+                                            on_pick=lambda: self.customer_picker.entry.focus_set())
+        self.video_picker.grid(row=1, column=0, padx=10, pady=5, sticky='EW')
+
+        customer_label = ttk.Label(self.window, text="Select a Customer (name, ID, phone or email):")
+        customer_label.grid(row=2, column=0, padx=10, pady=5, sticky='W')
+        self.customer_picker = TypeAheadPicker(self.window, repository.customer_prefix_index,
+                                               self.describe_customer, on_pick=self.confirm)
+        self.customer_picker.grid(row=3, column=0, padx=10, pady=5, sticky='EW')
+
+        rent_button = ttk.Button(self.window, text="Rent", command=self.confirm)
+        rent_button.grid(row=4, column=0, padx=10, pady=10)
+
+        # Listed matches follow edits made anywhere while the window is open
+        repository.customer_data.subscribe(self.on_data_changed)
+        repository.video_data.subscribe(self.on_data_changed)
+        self.window.withdraw()
+
+    def describe_customer(self, customer_id):
+        customers = self.repository.customer_data
+        return (f"{customers.value(customer_id, 'First Name')} {customers.value(customer_id, 'Last Name')}"
+                f"  (ID {customer_id})  {customers.value(customer_id, 'Phone Number')}"
+                f"  {customers.value(customer_id, 'Email Address')}")
+
+    def describe_video(self, video_id):
+        videos = self.repository.video_data
+        return (f"{videos.value(video_id, 'Name')} ({videos.value(video_id, 'Year')})  (ID {video_id})"
+                f"  {videos.value(video_id, 'Status')}")
+
+    def open(self, video_ids=()):
+        self.video_ids = list(video_ids)
+        self.customer_picker.reset()
+        if not self.video_ids:
+            self.video_label.configure(text="Select a Video (name or ID):")
+            self.video_picker.reset()
+            self.video_picker.grid()
+            first_entry = self.video_picker.entry
+        else:
+            self.show_videos()
+            self.video_picker.grid_remove()
+            first_entry = self.customer_picker.entry
+        self.visible = True
+        self.window.deiconify()
+        self.window.lift()
+        first_entry.focus_set()
+
+    def close(self):
+        self.visible = False
+        self.window.withdraw()
+
+    def show_videos(self):
+        videos = [video_id for video_id in self.video_ids if video_id in self.repository.video_data]
+        if len(videos) == 1:
+            text = f"Video: {self.describe_video(videos[0])}"
+        else:
+            names = ", ".join(self.repository.video_data.value(video_id, 'Name') for video_id in videos[:3])
+            text = f"{len(videos)} videos: {names}" + (", ..." if len(videos) > 3 else "")
+        self.video_label.configure(text=text)
+
+    def on_data_changed(self, event, record_id, old_record, new_record):
+        if event == 'update' and new_record['ID'] != record_id and record_id in self.video_ids:
+            self.video_ids[self.video_ids.index(record_id)] = new_record['ID']
+        if self.visible and self.refresh_id is None:
+            self.refresh_id = self.window.after_idle(self.refresh)  # Once for a burst of changes
+
+    def refresh(self):
+        self.refresh_id = None
+        if self.video_ids:
+            self.show_videos()
+        for picker in (self.video_picker, self.customer_picker):
+            if picker.matches:
+                picker.refresh()
+
+    def confirm(self):
+        video_ids = self.video_ids
+        if not video_ids:
+            picked = self.video_picker.selected()
+            video_ids = [picked] if picked is not None else []
+        if not video_ids:
+            messagebox.showerror("Error", "Please select a video to rent.", parent=self.window)
+            return
+        customer_id = self.customer_picker.selected()
+        if customer_id is None:
+            messagebox.showerror("Error", "Please select a customer to rent the movie to.", parent=self.window)
+            return
+        if self.on_rent(customer_id, video_ids):
+            self.close()
+
+
+class ScanDialog:
+    # Window for working through a stack of discs: IDs typed, or read by a barcode scanner
+    # (which types the ID and presses Return), pile up in a list that is then returned, or
+    # rented to one customer, in one go. Hidden rather than destroyed, like RentDialog.
+    def __init__(self, root, video_data, on_return, on_rent):
+        self.video_data = video_data
+        self.on_return = on_return  # Video IDs -> the ones that were returned
+        self.on_rent = on_rent  # Video IDs -> opens the rent dialog for them
+        self.video_ids = []  # Scanned, in scan order
+        self.visible = False
+        self.refresh_id = None
+        self.window = tk.Toplevel(root)
+        self.window.title("Scan Videos")
+        self.window.protocol('WM_DELETE_WINDOW', self.close)
+        self.window.bind('<Escape>', lambda event: self.close())
+
+        scan_label = ttk.Label(self.window, text="Scan or type video IDs:")
+        scan_label.grid(row=0, column=0, columnspan=4, padx=10, pady=5, sticky='W')
+        self.entry = ttk.Entry(self.window, width=40)
+        self.entry.grid(row=1, column=0, columnspan=4, padx=10, pady=5, sticky='EW')
+        self.entry.bind('<Return>', lambda event: self.scan())
+        self.listbox = tk.Listbox(self.window, height=15, width=70, selectmode='extended')
+        self.listbox.grid(row=2, column=0, columnspan=4, padx=10, pady=5, sticky='NSEW')
+        self.count_label = ttk.Label(self.window, text="")
+        self.count_label.grid(row=3, column=0, columnspan=4, padx=10, sticky='W')
+
+        ttk.Button(self.window, text="Return All", command=self.return_all).grid(row=4, column=0, padx=5, pady=10)
+        ttk.Button(self.window, text="Rent All...", command=self.rent_all).grid(row=4, column=1, padx=5, pady=10)
+        ttk.Button(self.window, text="Remove", command=self.remove_selected).grid(row=4, column=2, padx=5, pady=10)
+        ttk.Button(self.window, text="Clear", command=self.clear).grid(row=4, column=3, padx=5, pady=10)
+        self.window.grid_columnconfigure(0, weight=1)
+        self.window.grid_rowconfigure(2, weight=1)
+
+        # Statuses shown follow returns, rentals and edits made anywhere
+        video_data.subscribe(self.on_data_changed)
+        self.window.withdraw()
+
+    def open(self):
+        self.visible = True
+        self.window.deiconify()
+        self.window.lift()
+        self.entry.focus_set()
+
+    def close(self):
+        self.visible = False
+        self.window.withdraw()
+
+    def describe(self, video_id):
+        if video_id not in self.video_data:
+            return f"{video_id}  (no video has this ID)"
+        return (f"{video_id}  {self.video_data.value(video_id, 'Name')} ({self.video_data.value(video_id, 'Year')})"
+                f"  {self.video_data.value(video_id, 'Status')}")
+
+    def scan(self):
+        # One ID per scan; a pasted list of IDs separated by spaces or commas works as well.
+        # A disc scanned twice is listed once.
+        for video_id in self.entry.get().replace(',', ' ').split():
+            if video_id not in self.video_ids:
+                self.video_ids.append(video_id)
+                self.listbox.insert(tk.END, self.describe(video_id))
+        self.entry.delete(0, tk.END)
+        self.listbox.see(tk.END)
+        self.count_label.configure(text=f"{len(self.video_ids)} scanned")
+        return 'break'
+
+    def render(self):
+        self.refresh_id = None
+        self.listbox.delete(0, tk.END)
+        for video_id in self.video_ids:
+            self.listbox.insert(tk.END, self.describe(video_id))
+        self.count_label.configure(text=f"{len(self.video_ids)} scanned" if self.video_ids else "")
+
+    def on_data_changed(self, event, record_id, old_record, new_record):
+        if event == 'update' and new_record['ID'] != record_id and record_id in self.video_ids:
+            self.video_ids[self.video_ids.index(record_id)] = new_record['ID']
+        if self.visible and self.refresh_id is None:
+            self.refresh_id = self.window.after_idle(self.render)  # Once for a burst of changes
+
+    def forget(self, video_ids):
+        # Take videos that were dealt with off the list
+        done = set(video_ids)
+        self.video_ids = [video_id for video_id in self.video_ids if video_id not in done]
+        self.render()
+
+    def remove_selected(self):
+        self.forget([self.video_ids[position] for position in self.listbox.curselection()])
+
+    def clear(self):
+        self.forget(self.video_ids)
+
+    def return_all(self):
+        if self.video_ids:
+            self.forget(self.on_return(list(self.video_ids)))
+        self.entry.focus_set()
+
+    def rent_all(self):
+        if not self.video_ids:
+            messagebox.showerror("Error", "Please scan the videos to rent first.", parent=self.window)
+            return
+        self.on_rent(list(self.video_ids))
+
+
+class OverdueDialog:
+    # Live list of the overdue rentals, oldest due first, kept by the OverdueScheduler. The
+    # list is virtualized, so hundreds of thousands of rows cost no more than a screenful;
+    # newly overdue rentals are appended and returned ones dropped as it happens.
+    COLUMNS = ('Video ID', 'Title', 'Customer', 'Phone', 'Due', 'Days Late')
+
+    def __init__(self, root, repository):
+        self.repository = repository
+        self.scheduler = repository.overdue
+        self.visible = False
+        self.returned = set()  # Returned since the rows were last pruned
+        self.prune_id = None
+        self.window = tk.Toplevel(root)
+        self.window.title("Overdue Rentals")
+        self.window.protocol('WM_DELETE_WINDOW', self.close)
+        self.window.bind('<Escape>', lambda event: self.close())
+
+        self.count_label = ttk.Label(self.window, text="")
+        self.count_label.grid(row=0, column=0, padx=10, pady=5, sticky='W')
+        self.tree = ttk.Treeview(self.window, columns=self.COLUMNS, show='headings', height=20)
+        for column in self.COLUMNS:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=200 if column in ('Title', 'Customer') else 100)
+        self.tree.grid(row=1, column=0, padx=(10, 0), pady=5, sticky='NSEW')
+        scrollbar = ttk.Scrollbar(self.window, orient='vertical')
+        scrollbar.grid(row=1, column=1, padx=(0, 10), pady=5, sticky='NS')
+        self.view = VirtualTreeview(self.tree, scrollbar, self.get_row_values, virtual=VIRTUALIZE_TREEVIEW)
+        self.window.grid_columnconfigure(0, weight=1)
+        self.window.grid_rowconfigure(1, weight=1)
+
+        self.scheduler.listeners.append(self.on_overdue_changed)
+        self.window.withdraw()
+
+    def get_row_values(self, rental):
+        ledger = self.repository.ledger
+        videos = self.repository.video_data
+        customers = self.repository.customer_data
+        video_id = ledger.video_ids[rental]
+        customer_id = ledger.customer_ids[rental]
+        title = videos.value(video_id, 'Name') if video_id in videos else "(deleted)"
+        if customer_id in customers:
+            customer = (f"{customers.value(customer_id, 'First Name')} {customers.value(customer_id, 'Last Name')}"
+                        f" (ID {customer_id})")
+            phone = customers.value(customer_id, 'Phone Number')
+        else:
+            customer, phone = f"(deleted) ID {customer_id}", ""
+        due = ledger.due_at[rental]
+        days_late = int((time.time() - due) // 86400)
+        return [video_id, title, customer, phone, time.strftime('%Y-%m-%d %H:%M', time.localtime(due)), days_late]
+
+    def open(self):
+        self.returned.clear()
+        self.view.set_rows(list(self.scheduler.overdue))
+        self.show_count()
+        self.visible = True
+        self.window.deiconify()
+        self.window.lift()
+
+    def close(self):
+        self.visible = False
+        self.window.withdraw()
+
+    def show_count(self):
+        self.count_label.configure(text=f"{len(self.scheduler.overdue)} overdue")
+
+    def on_overdue_changed(self, found, returned):
+        if not self.visible:
+            return  # The rows are rebuilt when the window is opened again
+        if found:
+            self.view.rows.extend(found)  # Found in due order, after everything listed
+            self.view.render()
+        if returned:
+            self.returned.update(returned)
+            if self.prune_id is None:
+                self.prune_id = self.window.after_idle(self.prune)  # Once for a batch of returns
+        if not found and not returned:
+            self.view.refresh_values()  # A video was renamed
+        self.show_count()
+
+    def prune(self):
+        self.prune_id = None
+        returned, self.returned = self.returned, set()
+        self.view.set_rows([rental for rental in self.view.rows if rental not in returned], keep_position=True)
 
 
 class TabbedApp:
-    def __init__(self):
+    def __init__(self, debug_overlay=False):
+        STARTUP.mark('imports')
         self.root = tk.Tk()
         self.root.title("Tabbed App")
+        ttk.Style().theme_use('clam')  # Once for every tab, before any of them is drawn
+        STARTUP.mark('window')
+        self.painted = False
+        self.root.bind('<Map>', self.on_first_map)
 
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill='both', expand=True)
+        # Tabs are only built the first time they are selected
+        self.tab_factories = {}  # Tab frame -> (tab class, tab name)
+        self.tabs = {}  # Tab name -> built tab
+        self.notebook.bind('<<NotebookTabChanged>>', lambda event: self.build_selected_tab())
+        # One copy of the data for every tab; loading starts once the window is up
+        self.repository = Repository(self.root)
+        self.lag_probe = LagProbe(self.root)
+        self.overlay = DebugOverlay(self.root, self.notebook, visible=debug_overlay)
+        # Other clerks working on the same files: their changes come in through the journals
+        self.change_watcher = ChangeWatcher(self.root, self.repository.shared_logs())
+        for journal in self.repository.journals():
+            journal.on_conflict = lambda message: messagebox.showwarning("Changed by another clerk", message)
+
+        # Writes happen on the persistence worker; completions and errors come back here
+        PERSISTENCE.on_error = lambda error: messagebox.showerror("Error", f"Could not save data: {error}")
+        self.root.after(PERSIST_POLL_MS, self.poll_persistence)
+
+    def poll_persistence(self):
+        PERSISTENCE.poll()
+        self.root.after(PERSIST_POLL_MS, self.poll_persistence)
 
     def add_tab(self, tab_class, tab_name):
         tab_frame = ttk.Frame(self.notebook)
-        tab_instance = tab_class(tab_frame)
+        self.tab_factories[str(tab_frame)] = (tab_class, tab_name)
         self.notebook.add(tab_frame, text=tab_name)
 
+    def build_selected_tab(self):
+        if not self.painted:
+            return  # Adding the first tab selects it; it is built once the window is up
+        frame_name = self.notebook.select()
+        factory = self.tab_factories.pop(frame_name, None)
+        if factory is None:
+            return
+        tab_class, tab_name = factory
+        with METRICS.timed(f"tab.build.{tab_name}"):
+            self.tabs[tab_name] = tab_class(self.root.nametowidget(frame_name), self.repository)
+        STARTUP.mark(f"tab built: {tab_name}")
+
+    def on_first_map(self, event):
+        if event.widget is self.root:
+            self.root.unbind('<Map>')
+            # The window is on screen; draw it before building the first tab into it
+            self.root.update_idletasks()
+            STARTUP.mark('first paint')
+            self.painted = True
+            self.root.after_idle(self.build_selected_tab)
+            self.root.after_idle(self.repository.start_loading)
+
+    def export_metrics(self):
+        METRICS.export()
+        self.root.after(METRICS_EXPORT_MS, self.export_metrics)
+
     def run(self):
+        if METRICS.enabled:
+            self.lag_probe.start()
+            self.root.after(METRICS_EXPORT_MS, self.export_metrics)
+        self.change_watcher.start()
         self.root.mainloop()
+        self.flush_on_exit()
+
+    def flush_on_exit(self):
+        # Wait for every queued write before the process goes away
+        if self.repository.analytics is not None:
+            self.repository.analytics.save()
+        PERSISTENCE.close()
+        if METRICS.enabled:
+            METRICS.export()
 
 
 class VideoInfoApp:
-    def __init__(self, root):
+    def __init__(self, root, repository=None):
         self.root = root
-        self.customer_data = {'ID': [], 'First Name': [], 'Last Name': [], 'Address': [], 'Phone Number': [],
-                              'Email Address': []}
-        self.video_data = {'ID': [], 'Name': [], 'Year': [], 'Director': [], 'Rating': [], 'Genre': [], 'Status': []}
-        self.rental_data = []  # List to store rental information
+        # Everything lives in the shared repository; standalone, the tab gets one of its own
+        self.repository = repository if repository is not None else Repository(root)
+        self.customer_data = self.repository.customer_data
+        self.video_data = self.repository.video_data
+        self.sort_index = self.repository.video_sort_index
+        self.sort_keys = []  # (column, ascending) of the current sort, most significant first
+        self.search_index = self.repository.video_search_index
+        self.search_after_id = None  # Pending debounced search-as-you-type callback
+        self.filter_engine = self.repository.video_filter_engine
+        self.video_filter = None  # Condition from the filter bar, applied on top of any search
+        self.facets = FacetCounts(self.video_data, VIDEO_FACETS)  # Counts over the rows shown
+        self.facet_refresh_id = None
+        self.storage = self.repository.video_storage
+        self.ledger = self.repository.ledger
+        self.rent_dialog = None  # Built the first time a movie is rented
+        self.scan_dialog = None  # Built the first time videos are scanned
+        self.overdue_dialog = None  # Built the first time the overdue rentals are shown
         self.initialize_ui()
-        self.load_data_from_file()
+        self.video_data.subscribe(self.on_video_changed)
+        if self.loader.started is None:
+            self.load_data_from_file()
+        else:
+            self.populate_treeview_with_data()  # What has been loaded so far; the rest follows
         self.sort_order = {}  # To keep track of the sorting order for each column
 
     def initialize_ui(self):
         style = ttk.Style()
-        style.theme_use('clam')
+        if style.theme_use() != 'clam':  # TabbedApp normally picked it already
+            style.theme_use('clam')
 
         # Light theme color configuration
         bg_color = '#FFFFFF'
@@ -73,11 +4523,31 @@ class VideoInfoApp:
                                             background=bg_color, foreground=fg_color)
         self.manage_video_label.grid(row=0, column=0, columnspan=4, padx=10, pady=10, sticky='W')
 
-        self.search_label = ttk.Label(self.root, text="Movie Name Search", background=bg_color, foreground=fg_color)
+        self.search_label = ttk.Label(self.root, text="Search Name, Director or Genre", background=bg_color,
+                                      foreground=fg_color)
         self.search_label.grid(row=1, column=0, padx=5, pady=0, sticky='EW')
 
+        # Filter bar, e.g. genre:Drama,Comedy year:1990..1999 rating>=7 status:Available director:Kub*
+        self.filter_bar = ttk.Frame(self.root)
+        self.filter_bar.grid(row=1, column=1, columnspan=4, padx=5, pady=0, sticky='EW')
+        self.filter_label = ttk.Label(self.filter_bar, text="Filter:", background=bg_color, foreground=fg_color)
+        self.filter_label.grid(row=0, column=0, padx=5, sticky='W')
+        self.filter_entry = ttk.Entry(self.filter_bar, width=50)
+        self.filter_entry.grid(row=0, column=1, padx=5, sticky='EW')
+        self.filter_entry.bind('<Return>', lambda event: self.apply_video_filter())
+        self.filter_button = ttk.Button(self.filter_bar, text="Filter", command=self.apply_video_filter)
+        self.filter_button.grid(row=0, column=2, padx=2)
+        self.clear_filter_button = ttk.Button(self.filter_bar, text="Clear", command=self.clear_video_filter)
+        self.clear_filter_button.grid(row=0, column=3, padx=2)
+        self.filter_help_button = ttk.Button(self.filter_bar, text="?", width=2, command=self.show_filter_help)
+        self.filter_help_button.grid(row=0, column=4, padx=2)
+        self.filter_bar.grid_columnconfigure(1, weight=1)
+
         self.search_entry = ttk.Entry(self.root, width=20)
         self.search_entry.grid(row=2, column=0, padx=5, pady=5, sticky='EW')
+        self.search_entry.bind('<Return>', lambda event: self.search_video())
+        if SEARCH_AS_YOU_TYPE:
+            self.search_entry.bind('<KeyRelease>', self.on_search_typed)
 
         self.search_button = ttk.Button(self.root, text="Search", command=self.search_video)
         self.search_button.grid(row=2, column=1, padx=5, pady=5, sticky='EW')
@@ -96,13 +4566,33 @@ class VideoInfoApp:
         # Create and configure the Treeview for displaying video data
         self.tree = ttk.Treeview(self.root, columns=list(self.video_data.keys()) + ['Edit', 'Delete'], show='headings')
         for col in self.video_data.keys():
-            self.tree.heading(col, text=col)
+            # Click a heading to sort by it, Shift-click to add it as a secondary sort column
+            self.tree.heading(col, text=col, command=lambda col=col: self.on_heading_click(col))
             self.tree.column(col, width=100)
+        self.tree.bind('<Shift-ButtonRelease-1>', self.on_heading_shift_click)
         self.tree.column('Edit', width=60, anchor='center')
         self.tree.column('Delete', width=60, anchor='center')
 
-        self.populate_treeview_with_data()
+        self.tree_scrollbar = ttk.Scrollbar(self.root, orient='vertical')
+        self.view = VirtualTreeview(self.tree, self.tree_scrollbar, self.get_row_values,
+                                    virtual=VIRTUALIZE_TREEVIEW)
+
         self.tree.grid(row=3, column=0, columnspan=4, padx=10, pady=10, sticky='NSEW')
+        self.tree_scrollbar.grid(row=3, column=4, pady=10, sticky='NSW')
+
+        # Facet panel: counts of the rows shown per Genre, Status, Director and decade;
+        # clicking a value adds it to the filter
+        self.facet_tree = ttk.Treeview(self.root, columns=['Count'], show='tree headings', selectmode='browse')
+        self.facet_tree.heading('#0', text='Facet')
+        self.facet_tree.heading('Count', text='Count')
+        self.facet_tree.column('#0', width=160)
+        self.facet_tree.column('Count', width=70, anchor='e')
+        for column, _ in VIDEO_FACETS:
+            self.facet_tree.insert('', 'end', iid=column, text=column, open=column in ('Genre', 'Status'))
+        self.facet_tree.grid(row=3, column=5, padx=(0, 10), pady=10, sticky='NS')
+        self.facet_tree.bind('<<TreeviewSelect>>', self.on_facet_selected)
+        self.facet_items = {}  # Facet value item -> (column, value)
+        self.populate_treeview_with_data()
 
         self.root.grid_columnconfigure(0, weight=1)
         self.root.grid_rowconfigure(3, weight=1)
@@ -115,9 +4605,37 @@ class VideoInfoApp:
                                         command=self.return_movie)
         self.return_button.grid(row=4, column=1, padx=10, pady=5, sticky='EW')
 
+        # Bulk import/export of CSV or JSON-lines files
+        self.import_button = ttk.Button(self.root, text="Import...", command=self.open_import_dialog)
+        self.import_button.grid(row=4, column=2, padx=10, pady=5, sticky='EW')
+        self.export_button = ttk.Button(self.root, text="Export...", command=self.open_export_dialog)
+        self.export_button.grid(row=4, column=3, padx=10, pady=5, sticky='EW')
+        # A stack of discs to return or rent, by scanning their IDs
+        self.scan_button = ttk.Button(self.root, text="Scan IDs...", command=self.open_scan_dialog)
+        self.scan_button.grid(row=4, column=4, padx=10, pady=5, sticky='EW')
+        # Badge with the number of overdue rentals; opens the list of them
+        style.configure('TOverdueBadge.TButton', background=rent_button_color, foreground=text_color_on_buttons)
+        style.map('TOverdueBadge.TButton', background=[('active', rent_button_color)],
+                  foreground=[('active', text_color_on_buttons)])
+        self.overdue_button = ttk.Button(self.root, text="Overdue (0)", command=self.open_overdue_dialog)
+        self.overdue_button.grid(row=4, column=5, padx=10, pady=5, sticky='EW')
+        self.repository.overdue.listeners.append(lambda found, returned: self.show_overdue_badge())
+        self.show_overdue_badge()
+        self.importer = BulkImport(self.root, self.storage, self.on_import_finished, statuses=VIDEO_STATUSES)
+
         separator = ttk.Separator(self.root, orient='horizontal')
         separator.grid(row=5, column=0, columnspan=4, sticky="ew", pady=10)
 
+        # Progress of the catalog load, only shown while it is running
+        self.load_progress = ttk.Progressbar(self.root, orient='horizontal', mode='determinate', maximum=100)
+        self.load_progress.grid(row=6, column=0, columnspan=2, padx=10, pady=5, sticky='EW')
+        self.load_progress_label = ttk.Label(self.root, text="")
+        self.load_progress_label.grid(row=6, column=2, columnspan=2, padx=5, pady=5, sticky='W')
+        self.load_progress.grid_remove()
+        self.load_progress_label.grid_remove()
+        self.loader = self.repository.video_loader
+        self.loader.watch(self.on_rows_loaded, self.on_load_finished, self.load_progress, self.load_progress_label)
+
         # Add headings for Edit/Delete
         self.tree.heading('Edit', text='Edit')
         self.tree.heading('Delete', text='Delete')
@@ -125,42 +4643,60 @@ class VideoInfoApp:
         self.tree.bind("<ButtonRelease-1>", self.on_treeview_click)
 
     def open_rent_movie_popup(self):
-        # Check if a movie is selected in the Treeview
-        selected_item = self.tree.selection()
-        if not selected_item:
+        if self.is_loading_for_rental():
+            return
+        # Check if a movie is selected in the Treeview (several can be rented at once)
+        video_ids = self.selected_video_ids()
+        if not video_ids:
             messagebox.showerror("Error", "Please select a movie to rent.")
             return
 
-        # Create a popup window for renting the movie
-        rent_window = tk.Toplevel(self.root)
-        rent_window.title("Rent Movie")
+        # Reuse the rent window; only the customer has to be picked
+        self.get_rent_dialog().open(video_ids)
 
-        # Create a label for selecting a customer
-        customer_label = ttk.Label(rent_window, text="Select a Customer:")
-        customer_label.grid(row=0, column=0, padx=10, pady=5)
+    def selected_video_ids(self):
+        return self.view.selected_keys()
 
-        # Create a Treeview for displaying customer data
-        customer_tree = ttk.Treeview(rent_window, columns=list(self.customer_data.keys()))
-        for col in self.customer_data.keys():
-            customer_tree.heading(col, text=col)
-            customer_tree.column(col, width=100)
+    def get_rent_dialog(self):
+        if self.rent_dialog is None:
+            self.rent_dialog = RentDialog(self.root, self.repository, self.confirm_rental)
+        return self.rent_dialog
 
-        customer_tree.grid(row=1, column=0, padx=10, pady=5)
+    def show_overdue_badge(self):
+        count = len(self.repository.overdue.overdue)
+        self.overdue_button.configure(text=f"Overdue ({count})", style='TOverdueBadge.TButton' if count else 'TButton')
 
-        # Populate the customer Treeview with data
-        self.populate_customer_treeview(customer_tree)
+    def open_overdue_dialog(self):
+        if self.overdue_dialog is None:
+            self.overdue_dialog = OverdueDialog(self.root, self.repository)
+        self.overdue_dialog.open()
 
-        # Create a button to confirm the movie rental for the selected customer
-        rent_button = ttk.Button(rent_window, text="Rent",
-                                 command=lambda: self.confirm_rental(selected_item, customer_tree, rent_window))
-        rent_button.grid(row=2, column=0, padx=10, pady=10)
+    def open_scan_dialog(self):
+        if self.is_loading():
+            return
+        if self.scan_dialog is None:
+            self.scan_dialog = ScanDialog(self.root, self.video_data, self.return_videos, self.rent_scanned)
+        self.scan_dialog.open()
+
+    def rent_scanned(self, video_ids):
+        if not self.is_loading_for_rental():
+            self.get_rent_dialog().open(video_ids)
+
+    def is_loading_for_rental(self):
+        # Renting also needs the customers, which load next to the catalog
+        if self.is_loading():
+            return True
+        if self.repository.customer_loader.running:
+            messagebox.showinfo("Loading", "Customers are still loading. Please try again in a moment.")
+            return True
+        return False
 
     def show_tree_menu(self, event):
         # Check if there's an item under the cursor
         iid = self.tree.identify_row(event.y)
         if iid:
             # Change the selection to the right-clicked item
-            self.tree.selection_set(iid)
+            self.view.set_selection([self.view.key_for_item(iid)])
             self.tree_menu.post(event.x_root, event.y_root)
 
     def delete_selected_item(self):
@@ -168,29 +4704,28 @@ class VideoInfoApp:
         # Code to delete the selected item goes here
         print(f"Delete item {selected_item}")
 
-    def rent_movie(self):
-        selected_item = self.tree.selection()[0]
-        movie_id = self.tree.item(selected_item, 'values')[0]
-        index = self.video_data['ID'].index(movie_id)
-        self.video_data['Status'][index] = 'Rented'
-        self.update_treeview()
-        self.save_data_to_file()
-
-    def populate_customer_treeview(self, tree):
-        for item in tree.get_children():
-            tree.delete(item)
-
-        for i in range(len(self.customer_data['ID'])):
-            row_data = [self.customer_data[key][i] for key in self.customer_data.keys()]
-            tree.insert("", "end", values=row_data)
-
+    @METRICS.timed('video.return')
     def return_movie(self):
-        selected_item = self.tree.selection()[0]
-        movie_id = self.tree.item(selected_item, 'values')[0]
-        index = self.video_data['ID'].index(movie_id)
-        self.video_data['Status'][index] = 'Available'
-        self.update_treeview()
-        self.save_data_to_file()
+        if self.is_loading():
+            return
+        video_ids = self.selected_video_ids()
+        if not video_ids:
+            messagebox.showerror("Error", "Please select a movie to return.")
+            return
+        self.return_videos(video_ids)
+
+    def return_videos(self, video_ids):
+        # Return any number of videos in one transaction, saved once, closing their open
+        # rentals; the ones that could not be returned are reported. Returns the returned IDs.
+        with self.storage.transaction():
+            returned, failures = self.repository.return_many(video_ids)
+            if returned:
+                self.save_data_to_file()
+        if len(video_ids) == 1 and failures:
+            messagebox.showerror("Error", failures[0][1])
+        elif len(video_ids) > 1:
+            report_batch(f"Returned {len(returned)} of {len(video_ids)} videos.", failures)
+        return returned
 
     def add_customer_to_treeview(self, entries, add_window):
         # Validate phone number
@@ -199,45 +4734,181 @@ class VideoInfoApp:
             return
 
     def update_treeview(self):
-        # Clear the existing Treeview entries
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        # Only the materialized rows are in Tk, so rebinding their values is enough
+        self.view.refresh_values()
 
-        # Repopulate the Treeview with updated data including 'Edit' and 'Delete' buttons
-        for i in range(len(self.video_data['ID'])):
-            row_data = [self.video_data[key][i] for key in self.video_data.keys()]
-            row_data.extend(['Edit', 'Delete'])  # Add 'Edit' and 'Delete' options to each row
-            self.tree.insert("", "end", values=row_data)
+    def get_row_values(self, video_id):
+        # Row keys of the video view are video IDs
+        return self.video_data.values(video_id) + ['Edit', 'Delete']  # Add 'Edit' and 'Delete' options
 
     def load_data_from_file(self):
-        try:
-            with open(DATA_FILE, 'r') as file:
-                lines = file.readlines()
-
-            for key in self.video_data:
-                self.video_data[key].clear()
-
-            for line in lines:
-                data = line.strip().split(',')
-                if len(data) == len(self.video_data):
-                    for key, value in zip(self.video_data.keys(), data):
-                        self.video_data[key].append(value)
-
+        # Stream the catalog in; rows show up in the Treeview batch by batch
+        self.view.set_rows([])
+        self.loader.start()
+
+    def on_rows_loaded(self, video_ids):
+        # Only grow the view while it is showing the whole catalog, not a search
+        if not self.search_entry.get().strip():
+            self.view.rows.extend(video_ids)
+            self.view.render()
+
+    def on_load_finished(self):
+        # Journal replay may have changed rows that are already on screen
+        if self.search_entry.get().strip():
+            self.search_video()
+        else:
             self.populate_treeview_with_data()
-        except FileNotFoundError:
-            print("Video data file not found. Starting with empty data.")
-        except Exception as e:
-            print(f"Error loading data: {e}")
 
+    def on_video_changed(self, event, video_id, old_record, new_record):
+        # Edits from any tab show up here; bulk loads and imports refresh the view themselves
+        if self.loader.running or self.importer.running:
+            return
+        shown = None if new_record is None else self.shows(new_record)
+        self.view.apply_change(event, video_id, old_record, new_record, shown=shown)
+        self.facets.on_change(event, video_id, old_record, new_record, shown=shown)
+        self.schedule_facet_refresh()
+
+    def shows(self, record):
+        # Whether the filter and the search let a video into the view; None when neither is set
+        search_text = self.search_entry.get().strip()
+        if self.video_filter is None and not search_text:
+            return None
+        if self.video_filter is not None and not self.video_filter.matches_record(record):
+            return False
+        return not search_text or self.search_index.matches(record['ID'], search_text)
+
+    def is_loading(self):
+        # Changes are held off until the load (and its journal replay) or an import has finished
+        if self.loader.running or self.importer.running:
+            messagebox.showinfo("Loading", "The catalog is still loading. Please try again in a moment.")
+            return True
+        return False
+
+    def open_import_dialog(self):
+        if self.is_loading():
+            return
+        from tkinter import filedialog
+        path = filedialog.askopenfilename(title="Import videos", filetypes=[
+            ("CSV or JSON lines", "*.csv *.txt *.jsonl *.json"), ("All files", "*.*")])
+        if not path:
+            return
+        self.load_progress.configure(mode='indeterminate')
+        self.load_progress.grid()
+        self.load_progress.start()
+        self.load_progress_label.configure(text="Importing...")
+        self.load_progress_label.grid()
+        self.importer.start(path)
+
+    def on_import_finished(self, added, errors):
+        self.load_progress.stop()
+        self.load_progress.configure(mode='determinate')
+        self.load_progress.grid_remove()
+        self.load_progress_label.grid_remove()
+        # One refresh of the view for the whole batch
+        if self.search_entry.get().strip():
+            self.search_video()
+        else:
+            self.populate_treeview_with_data()
+        message = f"Imported {len(added):,} videos."
+        if errors:
+            message += f"\n\n{len(errors):,} rows were skipped:\n" + "\n".join(errors[:20])
+            if len(errors) > 20:
+                message += f"\n... and {len(errors) - 20:,} more"
+            messagebox.showwarning("Import", message)
+        else:
+            messagebox.showinfo("Import", message)
+
+    def open_export_dialog(self):
+        from tkinter import filedialog
+        path = filedialog.asksaveasfilename(title="Export videos", defaultextension='.csv', filetypes=[
+            ("CSV", "*.csv"), ("JSON lines", "*.jsonl")])
+        if path:
+            # The rows shown, in the order shown
+            export_records(path, self.video_data, list(self.view.rows))
+
+    @METRICS.timed('video.populate')
     def populate_treeview_with_data(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        for i in range(len(self.video_data['ID'])):
-            row_data = [self.video_data[key][i] for key in self.video_data.keys()]
-            self.tree.insert("", "end", values=row_data + ['Edit', 'Delete'])
+        if self.video_filter is not None:
+            rows = self.filter_engine.query(self.video_filter)
+            self.view.set_rows(rows)
+            self.facets.reset(rows)
+        else:
+            self.view.set_rows(self.video_data.ids())
+            self.facets.reset()
+        self.render_facets()
+
+    def render_facets(self):
+        # Redraw the facet values from the live counts; at most FACET_LIMIT items per facet
+        self.facet_refresh_id = None
+        for item in self.facet_items:
+            self.facet_tree.delete(item)
+        self.facet_items = {}
+        for column, bucket in VIDEO_FACETS:
+            top = self.facets.top(column)
+            if bucket is not None:
+                top.sort()  # Ranges read best in order
+            for value, count in top:
+                text = f"{value}s" if bucket is decade else str(value)
+                item = self.facet_tree.insert(column, 'end', text=text, values=[f"{count:,}"])
+                self.facet_items[item] = (column, value)
+
+    def schedule_facet_refresh(self):
+        # One redraw for a burst of changes
+        if self.facet_refresh_id is None:
+            self.facet_refresh_id = self.root.after_idle(self.render_facets)
+
+    def on_facet_selected(self, event):
+        selection = self.facet_tree.selection()
+        if not selection or selection[0] not in self.facet_items:
+            return
+        column, value = self.facet_items[selection[0]]
+        if column == 'Year':
+            term = f"year:{value}..{value + 9}"
+        else:
+            term = f'{column.lower()}:"{value}"'
+        # AND the facet value onto the filter bar and apply it
+        text = self.filter_entry.get().strip()
+        if term not in text:
+            self.filter_entry.delete(0, tk.END)
+            self.filter_entry.insert(0, f"{text} {term}".strip())
+        self.apply_video_filter()
+
+    def apply_video_filter(self):
+        if self.is_loading():
+            return
+        text = self.filter_entry.get().strip()
+        try:
+            self.video_filter = parse_filter(text, self.video_data) if text else None
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.refresh_rows()
+
+    def clear_video_filter(self):
+        self.filter_entry.delete(0, tk.END)
+        self.video_filter = None
+        self.refresh_rows()
+
+    def show_filter_help(self):
+        messagebox.showinfo("Filter", "Terms are combined with AND; OR separates alternatives.\n\n"
+                                      "genre:Drama,Comedy  one of these\n"
+                                      "year:1990..1999  a range (year:..1960 or year:2000.. for one end)\n"
+                                      "rating>=7  also <=, >, < and =\n"
+                                      "status:Available\n"
+                                      "director:Kub*  starts with\n"
+                                      "-genre:Horror  anything but\n\n"
+                                      'Quote values with spaces: director:"Stanley K*"')
+
+    def refresh_rows(self):
+        # Rows for the current search and filter
+        if self.search_entry.get().strip():
+            self.search_video()
+        else:
+            self.populate_treeview_with_data()
 
     def create_add_window(self):
+        if self.is_loading():
+            return
         # Create a new window for adding video information
         add_window = tk.Toplevel(self.root)
         add_window.title("Add Video")
@@ -260,55 +4931,35 @@ class VideoInfoApp:
             [entry.get() for entry in entry_widgets], add_window))
         add_video_button.grid(row=row + 1, columnspan=2, padx=5, pady=5)
 
-    def confirm_rental(self, selected_item, customer_tree, rent_window):
-        # Check if a customer is selected
-        selected_customer = customer_tree.selection()
-        if not selected_customer:
-            messagebox.showerror("Error", "Please select a customer to rent the movie to.")
-            return
-
-        # Get the selected movie's title
-        movie_title = self.tree.item(selected_item, 'values')[1]  # Assuming the movie title is in the second column
-
-        # Get the selected customer's ID
-        customer_id = customer_tree.item(selected_customer, 'values')[0]  # Assuming the customer ID is in the first column
-
-        # Check if the customer has already rented the movie
-        if self.is_movie_already_rented(customer_id, movie_title):
-            messagebox.showerror("Error", "This movie is already rented by the selected customer.")
-            return
-
-        # Perform the movie rental operation, such as updating data, and save to file
-        self.rent_movie_to_customer(customer_id, movie_title)
-
-        # Close the rental popup
-        rent_window.destroy()
-
-    def is_movie_already_rented(self, customer_id, movie_title):
-        # Check if the movie is already rented by the customer
-        # Iterate through the customer data to find the customer by ID
-        for i in range(len(self.customer_data['ID'])):
-            if self.customer_data['ID'][i] == customer_id:
-                # Check if the movie_title is already in the list of rented movies for the customer
-                if movie_title in self.customer_data['Rented Movies'][i]:
-                    return True  # Movie is already rented by the customer
-        return False  # Movie is not rented by the customer
-
-    def rent_movie_to_customer(self, customer_id, movie_title):
-        # Find the index of the customer with the given customer_id
-        customer_index = self.customer_data['ID'].index(customer_id)
-
-        # Add the rented movie to the customer's list of rented movies
-        self.customer_data['Rented Movies'][customer_index].append(movie_title)
-
-        # Update the Treeview with the customer's rented movies
-        self.tree.item(self.tree.selection(), values=self.customer_data['Rented Movies'][customer_index])
-
-        # Save the updated customer data to the file
-        self.save_data_to_file()
+    @METRICS.timed('video.rental')
+    def confirm_rental(self, customer_id, video_ids):
+        # Called by the rent dialog; True once the rentals are recorded so the dialog can close
+        if self.is_loading_for_rental():
+            return False
+
+        # Mark the videos rented and record who has them, in one transaction saved once;
+        # videos that are gone or rented already are reported and the rest go through
+        with self.storage.transaction():
+            try:
+                rented, failures = self.repository.rent_many(customer_id, video_ids)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return False
+            if rented:
+                self.save_data_to_file()
+        if self.scan_dialog is not None:
+            self.scan_dialog.forget(rented)
 
         # Show a confirmation message to the user
-        messagebox.showinfo("Success", f"{movie_title} rented to customer {customer_id}.")
+        if len(video_ids) == 1:
+            if failures:
+                messagebox.showerror("Error", failures[0][1])
+                return False
+            movie_title = self.video_data.value(rented[0], 'Name')
+            messagebox.showinfo("Success", f"{movie_title} rented to customer {customer_id}.")
+            return True
+        report_batch(f"Rented {len(rented)} of {len(video_ids)} videos to customer {customer_id}.", failures)
+        return bool(rented)
 
     def create_edit_window(self, item_data, selected_item):
         edit_window = tk.Toplevel(self.root)
@@ -323,72 +4974,50 @@ class VideoInfoApp:
             entry.grid(row=index, column=1)
             entry_widgets[key] = entry
 
-        # Button to save changes
+        # Button to save changes, refused if another clerk changes the video meanwhile
+        version = self.storage.version(self.view.key_for_item(selected_item))
         save_button = tk.Button(edit_window, text="Save Changes",
-                                command=lambda: self.save_changes(selected_item, entry_widgets, edit_window))
+                                command=lambda: self.save_changes(selected_item, entry_widgets, edit_window, version))
         save_button.grid(row=len(self.customer_data.keys()), columnspan=2)
 
     def add_video_to_treeview(self, entries, add_window):
-        # Add video information to the dictionary
-        for i, key in enumerate(self.video_data):
-            self.video_data[key].append(entries[i])
-
-        # Insert data into the Treeview
-        self.tree.insert("", "end", values=tuple(entries + ['Edit', 'Delete']))
+        # Add video information to the store, refusing duplicate IDs and names
+        try:
+            self.video_data.add(entries)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
 
         # Close the add window after adding video
         add_window.destroy()
 
-        # Append new entry to video.txt in CSV format instead of writing the whole dictionary
-        with open(DATA_FILE, 'a') as file:
-            line = ','.join(entries)
-            file.write(line + '\n')
+        # Append new entry to the data file instead of writing the whole catalog
+        self.storage.append(entries[0])
 
     def on_treeview_click(self, event):
         region = self.tree.identify_region(event.x, event.y)
         if region == "cell":
             column = self.tree.identify_column(event.x)
             row_id = self.tree.identify_row(event.y)
+            if self.tree.heading(column, 'text') in ('Edit', 'Delete') and self.is_loading():
+                return
             if self.tree.heading(column, 'text') == 'Edit':
                 self.edit_video(row_id)
             elif self.tree.heading(column, 'text') == 'Delete':
                 self.delete_video(row_id)
 
     def create_rent_popup(self):
-        # This is the method to create the rental popup window
-        rent_window = tk.Toplevel(self.root)
-        rent_window.title("Rent Video")
-
-        # Assume you have a list of customer names/IDs and video titles/IDs
-        customer_names = self.get_customer_names()  # This should be a method returning customer names/IDs
-        video_titles = self.get_video_titles()  # This should be a method returning video titles/IDs
-
-        # Dropdown to select customer
-        customer_var = tk.StringVar(rent_window)
-        customer_dropdown = ttk.Combobox(rent_window, textvariable=customer_var, values=customer_names)
-        customer_dropdown.grid(row=0, column=1)
-
-        # Dropdown to select video
-        video_var = tk.StringVar(rent_window)
-        video_dropdown = ttk.Combobox(rent_window, textvariable=video_var, values=video_titles)
-        video_dropdown.grid(row=1, column=1)
-
-        # Add a 'Confirm' button that will call a method to process the rental
-        confirm_button = tk.Button(rent_window, text="Confirm",
-                                   command=lambda: self.process_rental(customer_var.get(), video_var.get(),
-                                                                       rent_window))
-        confirm_button.grid(row=2, columnspan=2)
+        if self.is_loading_for_rental():
+            return
+        # The same rent window, with the video picked by typing as well
+        self.get_rent_dialog().open()
 
     def delete_video(self, row_id):
         if messagebox.askyesno("Delete", "Are you sure you want to delete this video?"):
-            # Get the ID of the video to be deleted
-            video_id = self.tree.item(row_id, 'values')[0]
             # Remove the video from the data
-            index = self.video_data['ID'].index(video_id)
-            for key in self.video_data:
-                self.video_data[key].pop(index)
-            # Remove from Treeview and save
-            self.tree.delete(row_id)
+            video_id = self.view.key_for_item(row_id)
+            self.video_data.delete(video_id)
+            # The view drops its row when notified; save
             self.save_data_to_file()
 
     def on_sort_selection(self, selection):
@@ -399,14 +5028,35 @@ class VideoInfoApp:
         self.sort_order[selection] = not order
 
     def sort_treeview_data(self, column, ascending=True):
-        # Extract the data from the treeview
-        data = [(self.tree.set(item, column), item) for item in self.tree.get_children('')]
-        # Sort the data
-        data.sort(reverse=not ascending)
-
-        # Rearrange items in the treeview
-        for index, (_, item) in enumerate(data):
-            self.tree.move(item, '', index)
+        self.sort_keys = [(column, ascending)]
+        self.apply_sort()
+
+    @METRICS.timed('video.sort')
+    def apply_sort(self):
+        # Sort the rows of the current view from the cached, typed sort permutations
+        subset = None if len(self.view.rows) == len(self.video_data) else self.view.rows
+        self.view.set_rows(self.sort_index.sorted_ids(self.sort_keys, subset))
+
+    def on_heading_click(self, column):
+        # Sort by the column, toggling the direction when it is already the sort column
+        ascending = not self.sort_keys[0][1] if self.sort_keys and self.sort_keys[0][0] == column else True
+        self.sort_order[column] = not ascending
+        self.sort_treeview_data(column, ascending)
+
+    def on_heading_shift_click(self, event):
+        if self.tree.identify_region(event.x, event.y) != 'heading':
+            return None
+        column = self.tree.column(self.tree.identify_column(event.x), 'id')
+        if column not in self.video_data.keys():
+            return 'break'
+        for position, (sort_column, ascending) in enumerate(self.sort_keys):
+            if sort_column == column:
+                self.sort_keys[position] = (column, not ascending)
+                break
+        else:
+            self.sort_keys.append((column, True))
+        self.apply_sort()
+        return 'break'
 
     def on_tree_click(self, event):
         item = self.tree.selection()[0]
@@ -418,75 +5068,43 @@ class VideoInfoApp:
             self.delete_row(item)
 
     def delete_row(self, item):
-        # Find the index of the row in the dictionary
-        index = self.tree.index(item)
+        # Find the row in the dictionary and remove it; the view follows the change
+        video_id = self.view.key_for_item(item)
+        self.video_data.delete(video_id)
 
-        # Remove the row from the dictionary
-        for key in self.video_data:
-            self.video_data[key].pop(index)
-
-        # Remove the row from the Treeview
-        self.tree.delete(item)
+    def on_search_typed(self, event):
+        # Debounce keystrokes so a burst of typing runs a single search
+        if event.keysym == 'Return':
+            return
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.search_video)
 
+    @METRICS.timed('video.search')
     def search_video(self):
-        # Get the video name to search for
-        search_name = self.search_entry.get().lower()
-
-        # Clear the Treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # Search for the video name in the stored data
-        for i, name in enumerate(self.video_data['Name']):
-            if search_name in name.lower():
-                values = [self.video_data[key][i] for key in self.video_data.keys()] + ['Edit', 'Delete']
-                self.tree.insert("", "end", values=values)
-
-    def sort_treeview(self, event=None):
-        column_to_sort = self.sort_column_var.get()
-        current_items = [(self.tree.item(item, 'values'), item) for item in self.tree.get_children('')]
-        current_items.sort(key=lambda x: x[0][list(self.video_data.keys()).index(column_to_sort)])
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+            self.search_after_id = None
 
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        for values, item in current_items:
-            values_tuple = tuple(values)
-            self.tree.insert("", "end", values=values_tuple + ('Edit', 'Delete'))
-
-    def process_rental(self, customer_name, video_title, rent_window):
-        # Validate selections
-        if not customer_name or not video_title:
-            messagebox.showerror("Error", "You must select both a customer and a video to rent.")
+        # Get the text to search for
+        search_text = self.search_entry.get().strip()
+        if not search_text:
+            self.populate_treeview_with_data()
             return
 
-        # Check if the video is already rented
-        for video in self.video_data['Name']:
-            if video_title == video and self.video_data['Status'][self.video_data['Name'].index(video)] == 'Rented':
-                messagebox.showerror("Error", "This video is already rented.")
-                return
-
-        # Update the video status to 'Rented'
-        try:
-            video_index = self.video_data['Name'].index(video_title)
-            self.video_data['Status'][video_index] = 'Rented'
-            self.update_treeview()  # Assuming this method refreshes the Treeview with the current data
-            self.save_data_to_file()  # Assuming this method saves the current state of video_data to a file
-
-            # Log the rental in a simplistic rental log (you'd likely have a more complex system in a real application)
-            rental_log_entry = f"Customer: {customer_name}, Video: {video_title}, Status: Rented\n"
-            with open('rental_log.txt', 'a') as rental_log:  # Append to a rental log file
-                rental_log.write(rental_log_entry)
+        # Look the text up in the trigram index and show only the matching rows
+        matches = self.search_index.search(search_text)
+        if self.video_filter is not None:
+            members = set(self.filter_engine.query(self.video_filter))
+            matches = [video_id for video_id in matches if video_id in members]
+        self.view.set_rows(matches)
+        self.facets.reset(matches)
+        self.render_facets()
 
-            messagebox.showinfo("Success", f"The video '{video_title}' has been rented to '{customer_name}'.")
-        except ValueError as e:
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
-        except Exception as e:
-            messagebox.showerror("Error", "An unexpected error occurred while processing the rental.")
-        finally:
-            rent_window.destroy()  # Close the rent window regardless of the outcome
+    def sort_treeview(self, event=None):
+        self.sort_treeview_data(self.sort_var.get())
 
-    def save_changes(self, item, entry_widgets, edit_window):
+    def save_changes(self, item, entry_widgets, edit_window, version=None):
         # Check if all elements in entry_widgets are Entry widgets
         if not all(isinstance(entry, tk.Entry) for entry in entry_widgets.values()):
             print("Not all elements in entry_widgets are Entry widgets.")
@@ -495,13 +5113,18 @@ class VideoInfoApp:
         # Get the updated values from entry widgets
         updated_values = [entry.get() for entry in entry_widgets.values()]
 
-        # Update the Treeview with the new values
-        self.tree.item(item, values=updated_values + ['Edit', 'Delete'])
-
-        # Update the dictionary with the new values
-        row_index = self.tree.index(item)
-        for col, value in zip(self.video_data.keys(), updated_values):
-            self.video_data[col][row_index] = value
+        # Update the store with the new values
+        # (the view is notified and follows the row, even if its ID was edited)
+        video_id = self.view.key_for_item(item)
+        if self.storage.version(video_id) != version:
+            messagebox.showerror("Error", f"Video {video_id} was changed by another clerk. "
+                                          f"Close this window and edit it again.")
+            return
+        try:
+            self.video_data.update(video_id, dict(zip(self.video_data.keys(), updated_values)))
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
 
         # Save the changes to the text file
         self.save_data_to_file()
@@ -509,11 +5132,9 @@ class VideoInfoApp:
         # Close the edit window
         edit_window.destroy()
 
+    @METRICS.timed('video.save')
     def save_data_to_file(self):
-        with open(DATA_FILE, 'w') as file:
-            for i in range(len(self.video_data['ID'])):
-                line = ','.join([str(self.video_data[key][i]) for key in self.video_data.keys()])
-                file.write(line + '\n')
+        self.storage.save()
 
     def edit_video(self, row_id):
         # Fetch the item's data
@@ -531,9 +5152,10 @@ class VideoInfoApp:
             entry.insert(0, item[index])
             entries[key] = entry
 
-        # Button to save changes
+        # Button to save changes, refused if another clerk changes the video meanwhile
+        version = self.storage.version(self.view.key_for_item(row_id))
         save_button = tk.Button(edit_window, text="Save Changes",
-                                command=lambda: self.save_changes(row_id, entries, edit_window))
+                                command=lambda: self.save_changes(row_id, entries, edit_window, version))
         save_button.grid(row=len(self.video_data.keys()), columnspan=2)
 
     def edit_selected_item(self):
@@ -545,15 +5167,24 @@ class VideoInfoApp:
 
 
 class CustomerInfoApp:
-    def __init__(self, root):
+    def __init__(self, root, repository=None):
         self.root = root
-        self.customer_data = {'ID': [], 'First Name': [], 'Last Name': [], 'Address': [],
-                              'Phone Number': [], 'Email Address': []}
+        self.repository = repository if repository is not None else Repository(root)
+        self.customer_data = self.repository.customer_data
+        self.sort_index = self.repository.customer_sort_index
+        self.storage = self.repository.customer_storage
         self.sort_column_var = tk.StringVar()
         self.initialize_ui()
-        self.read_customer_data_from_file()  # Load customer data from file when the app starts
+        self.customer_data.subscribe(self.on_customer_changed)
+        if self.loader.started is None:
+            self.read_customer_data_from_file()  # Load customer data from file when the app starts
+        else:
+            self.view.set_rows(self.customer_data.ids())  # Already (being) loaded for the rent dialogs
 
     def create_add_window(self):
+        if self.loader.running:
+            messagebox.showinfo("Loading", "Customers are still loading. Please try again in a moment.")
+            return
         # Create a new window for adding customer information
         add_window = tk.Toplevel(self.root)
         add_window.title("Add Customer")
@@ -574,36 +5205,42 @@ class CustomerInfoApp:
                                         )
         add_customer_button.grid(row=row + 1, columnspan=2, padx=5, pady=5)
 
+    @METRICS.timed('customer.save')
     def save_customer_data_to_file(self):
-        with open(CUSTOMER_DATA_FILE, 'w') as file:
-            for i in range(len(self.customer_data['ID'])):
-                customer_info = [self.customer_data[key][i] for key in self.customer_data.keys()]
-                file.write(','.join(customer_info) + '\n')
+        self.storage.save()
 
     def read_customer_data_from_file(self):
-        try:
-            with open('customer.txt', 'r') as file:
-                lines = file.readlines()
-                for line in lines:
-                    data = line.strip().split(',')
-                    if len(data) == len(self.customer_data):
-                        for key, value in zip(self.customer_data.keys(), data):
-                            self.customer_data[key].append(value)
-                        self.tree.insert("", "end", values=tuple(data + ['Edit', 'Delete']))
-        except FileNotFoundError:
-            print("File 'customer_data.txt' not found")
+        # Stream the customers in batch by batch, like the video catalog
+        self.view.set_rows([])
+        self.loader.start()
+
+    def on_rows_loaded(self, customer_ids):
+        if not self.search_entry.get().strip():
+            self.view.rows.extend(customer_ids)
+            self.view.render()
+
+    def on_load_finished(self):
+        if self.search_entry.get().strip():
+            self.search_customer()
+        else:
+            self.view.set_rows(self.customer_data.ids())
+
+    def on_customer_changed(self, event, customer_id, old_record, new_record):
+        if self.loader.running:
+            return
+        self.view.apply_change(event, customer_id, old_record, new_record)
 
-    def add_customer_to_treeview(self, entries, add_window):
-        # Add customer information to the dictionary
-        self.customer_data['ID'].append(entries[0])
-        self.customer_data['First Name'].append(entries[1])
-        self.customer_data['Last Name'].append(entries[2])
-        self.customer_data['Address'].append(entries[3])
-        self.customer_data['Phone Number'].append(entries[4])
-        self.customer_data['Email Address'].append(entries[5])
+    def get_row_values(self, customer_id):
+        # Row keys of the customer view are customer IDs
+        return self.customer_data.values(customer_id) + ['Edit', 'Delete']
 
-        # Insert data into the Treeview
-        self.tree.insert("", "end", values=tuple(entries + ['Edit', 'Delete']))
+    def add_customer_to_treeview(self, entries, add_window):
+        # Add customer information to the store, refusing duplicate IDs
+        try:
+            self.customer_data.add(entries)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
 
         # Close the add window after adding customer
         add_window.destroy()
@@ -641,6 +5278,7 @@ class CustomerInfoApp:
 
         self.tree.heading('Delete', text='Delete')
         self.tree.column('Delete', width=80)
+        self.view = VirtualTreeview(self.tree, None, self.get_row_values, virtual=False)
 
         self.sort_combobox = ttk.Combobox(self.root, textvariable=self.sort_column_var,
                                           values=list(self.customer_data.keys()))
@@ -653,6 +5291,15 @@ class CustomerInfoApp:
         separator = ttk.Separator(self.root, orient='horizontal')
         separator.grid(row=3, column=0, columnspan=9, sticky="ew", pady=5)
 
+        self.load_progress = ttk.Progressbar(self.root, orient='horizontal', mode='determinate', maximum=100)
+        self.load_progress.grid(row=7, column=0, columnspan=4, padx=5, pady=5, sticky='EW')
+        self.load_progress_label = tk.Label(self.root, text="")
+        self.load_progress_label.grid(row=7, column=4, columnspan=3, padx=5, pady=5, sticky='W')
+        self.load_progress.grid_remove()
+        self.load_progress_label.grid_remove()
+        self.loader = self.repository.customer_loader
+        self.loader.watch(self.on_rows_loaded, self.on_load_finished, self.load_progress, self.load_progress_label)
+
     def pack_ui_elements(self):
         # Pack labels, entry widgets, and buttons
         ui_elements = [
@@ -669,6 +5316,8 @@ class CustomerInfoApp:
         self.tree.grid(row=6, column=0, columnspan=9, padx=5, pady=5)
 
     def on_tree_click(self, event):
+        if self.loader.running or not self.tree.selection():
+            return
         item = self.tree.selection()[0]
         col = self.tree.identify_column(event.x)
 
@@ -697,69 +5346,889 @@ class CustomerInfoApp:
             entry.grid(row=row, column=1, padx=10, pady=5)
             entry_widgets.append(entry)
 
-        # Create a button to save changes
+        # Create a button to save changes, refused if another clerk changes the customer meanwhile
+        version = self.storage.version(self.view.key_for_item(item))
         save_button = tk.Button(edit_window, text="Save Changes",
-                                command=lambda: self.save_changes(item, entry_widgets, edit_window))
+                                command=lambda: self.save_changes(item, entry_widgets, edit_window, version))
         save_button.grid(row=len(self.customer_data.keys()), columnspan=2, pady=10)
 
     def delete_row(self, item):
 
-        # Find the index of the row in the dictionary
-        index = self.tree.index(item)
-
-        # Remove the row from the dictionary
-        for key in self.customer_data:
-            self.customer_data[key].pop(index)
-
-        # Remove the row from the Treeview
-        self.tree.delete(item)
+        # Remove the row from the store; the Treeview follows the change
+        customer_id = self.view.key_for_item(item)
+        self.customer_data.delete(customer_id)
 
-    def save_changes(self, item, entry_widgets, edit_window):
+    def save_changes(self, item, entry_widgets, edit_window, version=None):
 
         # Get the updated values from entry widgets
         updated_values = [entry.get() for entry in entry_widgets]
 
-        # Update the Treeview with the new values
-        self.tree.item(item, values=updated_values + ['Edit', 'Delete'])
-
-        # Update the dictionary with the new values
-        row_index = self.tree.index(item)
-        for col, value in zip(self.customer_data.keys(), updated_values):
-            self.customer_data[col][row_index] = value
+        # Update the store with the new values
+        # (the Treeview is notified and follows the row, even if its ID was edited)
+        customer_id = self.view.key_for_item(item)
+        if self.storage.version(customer_id) != version:
+            messagebox.showerror("Error", f"Customer {customer_id} was changed by another clerk. "
+                                          f"Close this window and edit it again.")
+            return
+        try:
+            self.customer_data.update(customer_id, dict(zip(self.customer_data.keys(), updated_values)))
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
 
         # Close the edit window
         edit_window.destroy()
 
+    @METRICS.timed('customer.search')
     def search_customer(self):
 
-        # Get the video name to search for
+        # Get the customer name to search for
         search_name = self.search_entry.get().lower()
 
-        # Clear the Treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # Search for the video name in the stored data
-        for i, name in enumerate(self.customer_data['First Name']):
-            if search_name in name.lower():
-                values = [self.customer_data[key][i] for key in self.customer_data.keys()] + ['Edit', 'Delete']
-                self.tree.insert("", "end", values=values)
+        # Search for the customer name in the stored data; the view only applies the difference
+        matches = [customer_id for customer_id, name in self.customer_data.scan('First Name')
+                   if search_name in name.lower()]
+        self.view.set_rows(matches)
 
+    @METRICS.timed('customer.sort')
     def sort_treeview(self, event=None):
-        column_to_sort = self.sort_column_var.get()
-        current_items = [(self.tree.item(item, 'values'), item) for item in self.tree.get_children('')]
-        current_items.sort(key=lambda x: x[0][list(self.customer_data.keys()).index(column_to_sort)])
+        # Reorder the rows currently shown; the view turns this into Treeview moves
+        subset = None if len(self.view.rows) == len(self.customer_data) else self.view.rows
+        self.view.set_rows(self.sort_index.sorted_ids([(self.sort_column_var.get(), True)], subset))
+
 
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+class AnalyticsApp:
+    # Reports over the rental history: the most rented titles, rentals per genre and per
+    # customer, how much of the catalog is out, and the daily volume. The numbers come from
+    # the repository's RentalAnalytics and follow every rental and return as it happens.
+    def __init__(self, root, repository=None):
+        self.root = root
+        self.repository = repository if repository is not None else Repository(root)
+        self.video_data = self.repository.video_data
+        self.customer_data = self.repository.customer_data
+        self.analytics = None
+        self.render_id = None
+        self.initialize_ui()
+        loader = self.repository.video_loader
+        if loader.running:
+            # Genres come from the catalog; build the statistics once it is in
+            self.summary_label.configure(text="Waiting for the catalog to load...")
+            loader.watch(lambda video_ids: None, self.start)
+        else:
+            self.start()
 
-        for values, item in current_items:
-            values_tuple = tuple(values)
-            self.tree.insert("", "end", values=values_tuple + ('Edit', 'Delete'))
+    def initialize_ui(self):
+        title = ttk.Label(self.root, text="Rental Analytics", font=("Helvetica", 16, "bold"))
+        title.grid(row=0, column=0, columnspan=2, padx=10, pady=10, sticky='W')
+        self.summary_label = ttk.Label(self.root, text="")
+        self.summary_label.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky='W')
+        self.titles_tree = self.make_table("Top Titles", ('Title', 'Rentals'), row=2, column=0)
+        self.genres_tree = self.make_table("Rentals per Genre", ('Genre', 'Rentals', 'Share'), row=2, column=1)
+        self.customers_tree = self.make_table("Top Customers", ('Customer', 'Rentals'), row=3, column=0)
+        self.days_tree = self.make_table("Daily Volume", ('Day', 'Rentals', 'Returns', 'Out', 'Utilization'),
+                                         row=3, column=1)
+        for column in range(2):
+            self.root.grid_columnconfigure(column, weight=1)
+        for row in (2, 3):
+            self.root.grid_rowconfigure(row, weight=1)
+
+    def make_table(self, title, columns, row, column):
+        frame = ttk.LabelFrame(self.root, text=title)
+        frame.grid(row=row, column=column, padx=10, pady=5, sticky='NSEW')
+        tree = ttk.Treeview(frame, columns=columns, show='headings', height=10)
+        for position, name in enumerate(columns):
+            tree.heading(name, text=name)
+            tree.column(name, width=220 if position == 0 else 80, anchor='w' if position == 0 else 'e')
+        tree.pack(fill='both', expand=True)
+        return tree
+
+    def start(self):
+        self.analytics = self.repository.get_analytics()
+        self.analytics.listeners.append(self.schedule_render)
+        self.render()
+        self.root.after(ANALYTICS_SAVE_MS, self.save_periodically)
+
+    def schedule_render(self):
+        if self.render_id is None:
+            self.render_id = self.root.after_idle(self.render)  # Once for a batch of rentals
+
+    @METRICS.timed('analytics.render')
+    def render(self):
+        self.render_id = None
+        analytics = self.analytics
+        out = len(self.repository.ledger.active_by_video)
+        catalog_size = len(self.video_data)
+        self.summary_label.configure(
+            text=f"{analytics.rentals_seen} rentals, {analytics.returns_seen} returns.  "
+                 f"Out now: {out} of {catalog_size} videos ({percent(out, catalog_size)}).")
+        self.fill(self.titles_tree, [(self.describe_video(video_id), count)
+                                     for video_id, count in analytics.top_videos()])
+        total = sum(analytics.by_genre.values())
+        self.fill(self.genres_tree, [(genre, count, percent(count, total)) for genre, count in analytics.genres()])
+        self.fill(self.customers_tree, [(self.describe_customer(customer_id), count)
+                                        for customer_id, count in analytics.top_customers()])
+        self.fill(self.days_tree, [(day, rentals, returns, out, percent(out, size))
+                                   for day, rentals, returns, out, size in reversed(analytics.days())])
+
+    def fill(self, tree, rows):
+        tree.delete(*tree.get_children())
+        for row_values in rows:
+            tree.insert('', 'end', values=row_values)
+
+    def describe_video(self, video_id):
+        if video_id in self.video_data:
+            return f"{self.video_data.value(video_id, 'Name')} (ID {video_id})"
+        return f"Deleted video {video_id}"
+
+    def describe_customer(self, customer_id):
+        if customer_id in self.customer_data:
+            return (f"{self.customer_data.value(customer_id, 'First Name')} "
+                    f"{self.customer_data.value(customer_id, 'Last Name')} (ID {customer_id})")
+        return f"Deleted customer {customer_id}"
+
+    def save_periodically(self):
+        self.analytics.save()
+        self.root.after(ANALYTICS_SAVE_MS, self.save_periodically)
+
+
+def percent(part, whole):
+    return f"{100 * part / whole:.1f}%" if whole else "-"
+
+
+class ApiError(Exception):
+    # Answered to the client as {"error": message} with the given HTTP status
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiServer:
+    # Local HTTP/JSON front end to the shared Repository for --headless mode, so scanners and
+    # kiosks can use the catalog without a window. Everything runs on one asyncio loop:
+    # reads (listing, search, filter, sort, lookups) are answered straight from the indexes,
+    # and every change goes through one queue to a single writer, which applies whatever
+    # has piled up in one storage transaction and saves once for the lot. As reads and the
+    # writer share the loop, a read never sees a change half applied.
+    #
+    #   GET    /videos?q=&filter=&sort=Name,-Year&offset=&limit=    GET /customers?q=...
+    #   GET    /videos/<id>                 POST /videos, PUT|DELETE /videos/<id>  (customers alike)
+    #   POST   /rentals {"customer_id", "video_id" or "video_ids": [...]}
+    #   POST   /returns {"video_id" or "video_ids": [...]}
+    #   GET    /rentals?customer_id=        GET /overdue?offset=&limit=        GET /status
+    #
+    # GET /videos/<id> reports the record's version; PUT and DELETE with an If-Match header
+    # are refused while another clerk has changed the record since.
+    STATUS_TEXT = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                   409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.collections = {
+            'videos': (repository.video_data, repository.video_storage, repository.video_sort_index),
+            'customers': (repository.customer_data, repository.customer_storage, repository.customer_sort_index),
+        }
+        self.mutations = None  # asyncio.Queue of (change, future), created on the server's loop
+        self.dirty = set()  # Storages changed since the writer last saved
+        self.server = None
+        self.tasks = []
+
+    async def start(self, host=API_HOST, port=API_PORT):
+        # Listen (port 0 picks a free one) and start the writer; returns the port
+        import asyncio
+        self.mutations = asyncio.Queue(API_QUEUE_SIZE)
+        self.tasks = [asyncio.ensure_future(self.write_changes()), asyncio.ensure_future(self.poll())]
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        import asyncio
+        self.server.close()
+        await self.server.wait_closed()
+        await self.mutations.join()  # Accepted changes are applied before shutting down
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def handle_connection(self, reader, writer):
+        # HTTP/1.1 with keep-alive: one request after another on the same connection
+        import asyncio
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.split(' ')
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    self.respond(writer, 400, {'error': "Malformed request."}, False)
+                    return
+                if length > API_MAX_BODY:
+                    self.respond(writer, 413, {'error': "Request body too large."}, False)
+                    return
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self.dispatch(method, target, headers, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                self.respond(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {self.STATUS_TEXT[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+
+    async def dispatch(self, method, target, headers, body):
+        # (status, JSON payload) for one request
+        import urllib.parse
+        url = urllib.parse.urlsplit(target)
+        parts = [urllib.parse.unquote(part) for part in url.path.split('/') if part]
+        query = dict(urllib.parse.parse_qsl(url.query))
+        name = parts[0] if parts else ''
+        with METRICS.timed(f"api.{method.lower()}.{name if name in self.collections else 'other'}"):
+            try:
+                data = json.loads(body) if body else {}
+                if name in self.collections and len(parts) <= 2:
+                    record_id = parts[1] if len(parts) == 2 else None
+                    if method == 'GET':
+                        if record_id is None:
+                            return 200, self.list_records(name, query)
+                        return 200, self.get_record(name, record_id)
+                    if method == 'POST' and record_id is None:
+                        return 201, await self.submit(lambda: self.add_record(name, data))
+                    if method == 'PUT' and record_id is not None:
+                        return 200, await self.submit(lambda: self.update_record(name, record_id, data, headers))
+                    if method == 'DELETE' and record_id is not None:
+                        return 200, await self.submit(lambda: self.delete_record(name, record_id, headers))
+                    raise ApiError(405, f"{method} is not supported on {url.path}.")
+                if parts == ['rentals'] and method == 'GET':
+                    return 200, self.list_rentals(query)
+                if parts == ['rentals'] and method == 'POST':
+                    return 201, await self.submit(lambda: self.rent(data))
+                if parts == ['returns'] and method == 'POST':
+                    return 200, await self.submit(lambda: self.return_video(data))
+                if parts == ['overdue'] and method == 'GET':
+                    return 200, self.list_overdue(query)
+                if parts == ['status'] and method == 'GET':
+                    return 200, {'videos': len(self.repository.video_data),
+                                 'customers': len(self.repository.customer_data),
+                                 'queued_changes': self.mutations.qsize()}
+                raise ApiError(404, f"No such resource: {url.path}")
+            except ApiError as e:
+                return e.status, {'error': str(e)}
+            except DuplicateKeyError as e:
+                return 409, {'error': str(e)}
+            except ValueError as e:  # Bad JSON, or values the store refused
+                return 400, {'error': str(e)}
+            except Exception as e:
+                METRICS.count('api.errors')
+                return 500, {'error': f"{type(e).__name__}: {e}"}
+
+    async def submit(self, change):
+        # Queue a change for the writer and wait for its result (or its exception)
+        import asyncio
+        future = asyncio.get_running_loop().create_future()
+        await self.mutations.put((change, future))
+        return await future
+
+    async def write_changes(self):
+        # The single writer: everything queued meanwhile is applied and saved as one batch
+        while True:
+            batch = [await self.mutations.get()]
+            while not self.mutations.empty():
+                batch.append(self.mutations.get_nowait())
+            with METRICS.timed('api.write'):
+                storages = [storage for _, storage, _ in self.collections.values()]
+                with storages[0].transaction(), storages[1].transaction():
+                    for change, future in batch:
+                        try:
+                            result = change()
+                        except Exception as e:
+                            if not future.cancelled():
+                                future.set_exception(e)
+                        else:
+                            if not future.cancelled():
+                                future.set_result(result)
+                    for storage in self.dirty:
+                        storage.save()
+                    self.dirty.clear()
+            for _ in batch:
+                self.mutations.task_done()
+
+    async def poll(self):
+        # Write errors, metrics, and other clerks' changes to the shared files (applied by the writer)
+        import asyncio
+        logs = self.repository.shared_logs()
+        next_export = time.monotonic() + METRICS_EXPORT_MS / 1000
+        next_watch = time.monotonic() + SHARED_WATCH_MS / 1000
+        while True:
+            await asyncio.sleep(PERSIST_POLL_MS / 1000)
+            PERSISTENCE.poll()
+            now = time.monotonic()
+            if METRICS.enabled and now >= next_export:
+                METRICS.export()
+                next_export = now + METRICS_EXPORT_MS / 1000
+            if now >= next_watch:
+                next_watch = now + SHARED_WATCH_MS / 1000
+                await self.submit(lambda: [log.apply_changes() for log in logs])
+                for log in logs:
+                    log.check_for_changes()
+
+    def find(self, store, record_id):
+        if record_id not in store:
+            raise ApiError(404, f"No record with {store.primary_key} '{record_id}'.")
+        return record_id
+
+    def parse_sort(self, store, text):
+        # "Name,-Year" -> [('Name', True), ('Year', False)]
+        sort_keys = []
+        for column in text.split(','):
+            ascending = not column.startswith('-')
+            column = column.lstrip('+-').strip()
+            if column not in store.keys():
+                raise ApiError(400, f"Cannot sort by unknown column '{column}'.")
+            sort_keys.append((column, ascending))
+        return sort_keys
+
+    def list_records(self, name, query):
+        store, _, sort_index = self.collections[name]
+        try:
+            offset = max(0, int(query.get('offset', 0)))
+            limit = min(API_MAX_PAGE, max(0, int(query.get('limit', API_PAGE_SIZE))))
+        except ValueError:
+            raise ApiError(400, "offset and limit must be whole numbers.")
+        record_ids = None  # None: the whole catalog, in catalog order
+        text = query.get('q', '').strip()
+        if text:
+            # The same searches as the tabs: trigram index for videos, first names for customers
+            if name == 'videos':
+                record_ids = self.repository.video_search_index.search(text)
+            else:
+                text = text.lower()
+                record_ids = [customer_id for customer_id, first_name in store.scan('First Name')
+                              if text in first_name.lower()]
+        if query.get('filter', '').strip():
+            if name != 'videos':
+                raise ApiError(400, "Only videos can be filtered.")
+            matches = self.repository.video_filter_engine.query(parse_filter(query['filter'], store))
+            if record_ids is not None:
+                members = set(matches)
+                matches = [video_id for video_id in record_ids if video_id in members]
+            record_ids = matches
+        if query.get('sort'):
+            record_ids = sort_index.sorted_ids(self.parse_sort(store, query['sort']), record_ids)
+        if record_ids is None:
+            total = len(store)
+            page = itertools.islice((record_id for record_id, _ in store.scan(store.primary_key)),
+                                    offset, offset + limit)
+        else:
+            total = len(record_ids)
+            page = record_ids[offset:offset + limit]
+        return {'total': total, 'offset': offset, 'rows': [store.get(record_id) for record_id in page]}
+
+    def get_record(self, name, record_id):
+        store, storage, _ = self.collections[name]
+        self.find(store, record_id)
+        return {'record': store.get(record_id), 'version': storage.version(record_id)}
+
+    def record_values(self, store, data, partial):
+        # Column -> value from a JSON object; text columns are kept as text
+        if not isinstance(data, dict):
+            raise ApiError(400, "Expected a JSON object of column values.")
+        unknown = [column for column in data if column not in store.keys()]
+        if unknown:
+            raise ApiError(400, f"Unknown column(s): {', '.join(unknown)}")
+        if not partial:
+            missing = [column for column in store.keys() if column not in data]
+            if missing:
+                raise ApiError(400, f"Missing column(s): {', '.join(missing)}")
+        return {column: value if column in store.types else str(value) for column, value in data.items()}
+
+    def check_version(self, storage, record_id, headers):
+        expected = headers.get('if-match')
+        if expected is not None and str(storage.version(record_id)) != expected.strip('"'):
+            raise ApiError(409, f"{record_id} was changed by another clerk.")
+
+    # Changes: these run on the writer only
+
+    def add_record(self, name, data):
+        store, storage, _ = self.collections[name]
+        record_id = store.add(self.record_values(store, data, partial=False))
+        self.dirty.add(storage)
+        return {'record': store.get(record_id)}
+
+    def update_record(self, name, record_id, data, headers):
+        store, storage, _ = self.collections[name]
+        self.find(store, record_id)
+        self.check_version(storage, record_id, headers)
+        record_id = store.update(record_id, self.record_values(store, data, partial=True))
+        self.dirty.add(storage)
+        return {'record': store.get(record_id)}
+
+    def delete_record(self, name, record_id, headers):
+        store, storage, _ = self.collections[name]
+        self.find(store, record_id)
+        self.check_version(storage, record_id, headers)
+        store.delete(record_id)
+        self.dirty.add(storage)
+        return {'deleted': record_id}
+
+    def expect_object(self, data):
+        if not isinstance(data, dict):
+            raise ApiError(400, "Expected a JSON object.")
+        return data
+
+    def rent(self, data):
+        if 'video_ids' in self.expect_object(data):
+            return self.rent_many(data)
+        customer_id, video_id = str(data.get('customer_id', '')), str(data.get('video_id', ''))
+        self.find(self.repository.customer_data, customer_id)
+        self.find(self.repository.video_data, video_id)
+        try:
+            rental = self.repository.rent(customer_id, video_id)
+        except ValueError as e:
+            raise ApiError(409, str(e))
+        self.dirty.add(self.repository.video_storage)
+        return {'rental': rental, 'customer_id': customer_id, 'video_id': video_id}
+
+    def rent_many(self, data):
+        # {"customer_id", "video_ids": [...]}: one batch, with the videos that failed and why
+        customer_id = self.find(self.repository.customer_data, str(data.get('customer_id', '')))
+        video_ids = self.id_list(data)
+        rented, failures = self.repository.rent_many(customer_id, video_ids)
+        if rented:
+            self.dirty.add(self.repository.video_storage)
+        return {'customer_id': customer_id, 'rented': rented,
+                'failed': [{'video_id': video_id, 'error': reason} for video_id, reason in failures]}
+
+    def return_many(self, data):
+        returned, failures = self.repository.return_many(self.id_list(data))
+        if returned:
+            self.dirty.add(self.repository.video_storage)
+        return {'returned': returned,
+                'failed': [{'video_id': video_id, 'error': reason} for video_id, reason in failures]}
+
+    def id_list(self, data):
+        video_ids = data.get('video_ids')
+        if not isinstance(video_ids, list):
+            raise ApiError(400, "video_ids must be a list of video IDs.")
+        return [str(video_id) for video_id in video_ids]
+
+    def return_video(self, data):
+        if 'video_ids' in self.expect_object(data):
+            return self.return_many(data)
+        video_id = self.find(self.repository.video_data, str(data.get('video_id', '')))
+        try:
+            rental = self.repository.return_video(video_id)
+        except ValueError as e:
+            raise ApiError(409, str(e))
+        self.dirty.add(self.repository.video_storage)
+        return {'rental': rental, 'video_id': video_id}
+
+    def list_rentals(self, query):
+        # Videos a customer has out
+        customer_id = self.find(self.repository.customer_data, query.get('customer_id', ''))
+        ledger = self.repository.ledger
+        rentals = sorted(ledger.active_by_customer.get(customer_id, ()))
+        return {'customer_id': customer_id, 'rentals': [
+            {'rental': rental, 'video_id': ledger.video_ids[rental], 'rented_at': ledger.rented_at[rental],
+             'due_at': ledger.due_at[rental]}
+            for rental in rentals]}
+
+    def list_overdue(self, query):
+        # Open rentals past their due time, oldest due first
+        scheduler = self.repository.overdue
+        scheduler.poll()
+        try:
+            offset = max(0, int(query.get('offset', 0)))
+            limit = min(API_MAX_PAGE, max(0, int(query.get('limit', API_PAGE_SIZE))))
+        except ValueError:
+            raise ApiError(400, "offset and limit must be whole numbers.")
+        ledger = self.repository.ledger
+        page = itertools.islice(scheduler.overdue.items(), offset, offset + limit)
+        return {'total': len(scheduler.overdue), 'offset': offset, 'rows': [
+            {'rental': rental, 'video_id': ledger.video_ids[rental], 'customer_id': ledger.customer_ids[rental],
+             'due_at': due} for rental, due in page]}
+
+
+def run_headless(host=API_HOST, port=API_PORT):
+    # --headless: load everything, then serve it until interrupted
+    import asyncio
+    repository = Repository()
+    for storage in (repository.video_storage, repository.customer_storage):
+        load_all(storage)
+    repository.overdue.start()
+    for journal in repository.journals():
+        journal.on_conflict = print
+    PERSISTENCE.on_error = lambda error: print(f"Could not save data: {error}")
+    server = ApiServer(repository)
+
+    async def serve():
+        bound = await server.start(host, port)
+        print(f"Serving {len(repository.video_data)} videos and {len(repository.customer_data)} customers "
+              f"on http://{host}:{bound}/")
+        try:
+            await server.server.serve_forever()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        repository.close()
+        PERSISTENCE.close()
+        if METRICS.enabled:
+            METRICS.export()
+
+
+def migrate_to_sqlite():
+    # One-shot copy of the text data files (and their journals) into SQLITE_DATABASE
+    for path, table, store in ((DATA_FILE, 'videos', RecordStore(VIDEO_COLUMNS, types=VIDEO_COLUMN_TYPES)),
+                               (CUSTOMER_DATA_FILE, 'customers', RecordStore(CUSTOMER_COLUMNS))):
+        storage = SQLiteStorage(SQLITE_DATABASE, table, store)
+        if storage.is_empty():
+            storage.migrate(path)
+        else:
+            print(f"{SQLITE_DATABASE}:{table} already has data; not migrating '{path}'")
+        storage.close()
+
+
+def generate_catalog(directory, rows, seed=0):
+    # Synthetic video/customer files with realistic cardinalities, the same for every run
+    import random
+    rng = random.Random(seed)
+    genres = ['Drama', 'Crime', 'Action', 'Comedy', 'Horror', 'Sci-Fi', 'Romance', 'Animation',
+              'Documentary', 'Thriller', 'Western', 'Musical']
+    words = ['Night', 'Road', 'Dark', 'Return', 'Silent', 'River', 'Last', 'City', 'Star', 'Lost',
+             'Summer', 'King', 'Shadow', 'Heart', 'Iron', 'Blue', 'Storm', 'Garden', 'Secret', 'Fire']
+    first_names = ['Ann', 'Ben', 'Carla', 'Dev', 'Eli', 'Fay', 'Gus', 'Hana', 'Ivan', 'Jo', 'Kai', 'Lena']
+    last_names = ['Smith', 'Garcia', 'Chen', 'Okafor', 'Novak', 'Silva', 'Kim', 'Dubois', 'Rossi', 'Berg']
+    directors = [f"{rng.choice(first_names)} {rng.choice(last_names)} {number}"
+                 for number in range(max(10, rows // 200))]
+    with open(os.path.join(directory, DATA_FILE), 'w', newline='') as file:
+        write_rows(file, ([str(number), f"{' '.join(rng.sample(words, 3))} {number}", rng.randint(1920, 2024),
+                           rng.choice(directors), round(rng.uniform(1, 10), 1), rng.choice(genres),
+                           'Rented' if rng.random() < 0.2 else 'Available']
+                          for number in range(1, rows + 1)))
+    with open(os.path.join(directory, CUSTOMER_DATA_FILE), 'w', newline='') as file:
+        write_rows(file, ([str(number), rng.choice(first_names), rng.choice(last_names),
+                           f"{rng.randint(1, 999)} Main Street", f"555{rng.randint(0, 9999999):07d}",
+                           f"customer{number}@example.com"] for number in range(1, max(1, rows // 10) + 1)))
+
+
+def time_call(function, repeat=1):
+    # Median wall time of `repeat` calls, in seconds
+    import statistics
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+BENCHMARK_QUERIES = ('night', 'the', 'storm garden', 'zzz')
+BENCHMARK_FILTERS = ('genre:Drama,Comedy year:1990..1999', 'rating>=7 status:Available',
+                     'director:Ann* OR genre:Western')
+
+
+def benchmark_data_layer(rows, results):
+    # The shared repository the tabs use, without any Tk
+    repository = Repository()
+    video_data = repository.video_data
+    sort_index = repository.video_sort_index
+    search_index = repository.video_search_index
+    storage = repository.video_storage
+    prefix = f"data/{rows}/"
+    results[prefix + 'load'] = time_call(lambda: load_all(storage))
+    for query in BENCHMARK_QUERIES:
+        results[prefix + f"search/{query}"] = time_call(lambda: search_index.search(query), BENCHMARK_REPEAT)
+    for text in BENCHMARK_FILTERS:
+        condition = parse_filter(text, video_data)
+        results[prefix + f"filter/{text}"] = time_call(lambda: repository.video_filter_engine.query(condition),
+                                                      BENCHMARK_REPEAT)
+    for column in video_data.keys():
+        # First sort builds the cached permutation; later ones (and the other direction) reuse it
+        results[prefix + f"sort/{column}/first"] = time_call(lambda: sort_index.sorted_ids([(column, True)]))
+        results[prefix + f"sort/{column}/desc"] = time_call(lambda: sort_index.sorted_ids([(column, False)]),
+                                                           BENCHMARK_REPEAT)
+    # Rent dialog customer picker: the first lookup builds the index, then one per keystroke
+    load_all(repository.customer_storage)
+    customer_index = repository.customer_prefix_index
+    results[prefix + 'picker/build'] = time_call(lambda: customer_index.search('a'))
+    for query in ('a', 'smith', '555'):
+        def type_ahead():
+            for length in range(1, len(query) + 1):
+                customer_index.search(query[:length])
+
+        results[prefix + f"picker/{query}"] = time_call(type_ahead, BENCHMARK_REPEAT) / len(query)
+    import random
+    video_ids = random.Random(1).sample(video_data.ids(), min(100, len(video_data)))
+
+    def set_status(status):
+        for video_id in video_ids:
+            with storage.transaction():
+                video_data.set_value(video_id, 'Status', status)
+                storage.save()
+        PERSISTENCE.flush()
+
+    # Per operation, including getting it onto disk
+    results[prefix + 'rent'] = time_call(lambda: set_status('Rented')) / len(video_ids)
+    results[prefix + 'return'] = time_call(lambda: set_status('Available')) / len(video_ids)
+
+    # The same videos as one batch (a stack of scanned discs), per video
+    customer_ids = repository.customer_data.ids()
+
+    def batch(operation):
+        with storage.transaction():
+            operation()
+            storage.save()
+        PERSISTENCE.flush()
+
+    if customer_ids:
+        results[prefix + 'rent/batch'] = time_call(
+            lambda: batch(lambda: repository.rent_many(customer_ids[0], video_ids))) / len(video_ids)
+        results[prefix + 'return/batch'] = time_call(
+            lambda: batch(lambda: repository.return_many(video_ids))) / len(video_ids)
+
+    def save():
+        storage.save()
+        PERSISTENCE.flush()
+
+    results[prefix + 'save'] = time_call(save)
+    repository.close()
+
+
+def benchmark_gui(rows, results):
+    # The real tabs in a real (possibly virtual) X display, driven the way a user would
+    prefix = f"gui/{rows}/"
+    start = time.perf_counter()
+    tabbed_app = TabbedApp()
+    root = tabbed_app.root
+    tab_frame = ttk.Frame(tabbed_app.notebook)
+    tabbed_app.notebook.add(tab_frame, text="Manage Video")
+    app = VideoInfoApp(tab_frame, tabbed_app.repository)  # Starts loading the catalog on its own
+    root.update()
+    results[prefix + 'first_paint'] = time.perf_counter() - start
+    while app.loader.running:
+        root.update()
+    results[prefix + 'startup'] = time.perf_counter() - start
+
+    def load():
+        app.load_data_from_file()
+        while app.loader.running:
+            root.update()
+
+    results[prefix + 'load'] = time_call(load)
+
+    for query in BENCHMARK_QUERIES:
+        def search():
+            app.search_entry.delete(0, tk.END)
+            app.search_entry.insert(0, query)
+            app.search_video()
+            root.update()
+
+        results[prefix + f"search/{query}"] = time_call(search, BENCHMARK_REPEAT)
+    app.search_entry.delete(0, tk.END)
+    app.search_video()
+    for column in app.video_data.keys():
+        def sort():
+            app.sort_treeview_data(column, True)
+            root.update()
+
+        results[prefix + f"sort/{column}"] = time_call(sort, BENCHMARK_REPEAT)
+
+    # Renting needs the customers, which load next to the catalog
+    repository = tabbed_app.repository
+    while repository.customer_loader.running:
+        root.update()
+    customer_id = next(iter(repository.customer_data))
+    rented = []
+
+    def rent():
+        # What the Rent button and the rent dialog do for a free video on screen, short of
+        # the message box: open the dialog, rent to the picked customer (Repository.rent_many
+        # in one transaction, saved once), close the dialog
+        video_id = next(video_id for video_id in map(app.view.key_for_item, app.tree.get_children())
+                        if not repository.ledger.is_rented(video_id)
+                        and app.video_data.value(video_id, 'Status') != 'Rented')
+        app.view.set_selection([video_id])
+        app.open_rent_movie_popup()
+        with app.storage.transaction():
+            done, _ = repository.rent_many(customer_id, [video_id])
+            app.save_data_to_file()
+        app.get_rent_dialog().close()
+        rented.extend(done)
+        root.update()
+
+    def give_back():
+        app.view.set_selection([rented.pop()])
+        app.return_movie()
+        root.update()
+
+    results[prefix + 'rent'] = time_call(rent, BENCHMARK_REPEAT)
+    results[prefix + 'return'] = time_call(give_back, BENCHMARK_REPEAT)
+
+    def save():
+        app.save_data_to_file()
+        PERSISTENCE.flush()
+
+    results[prefix + 'save'] = time_call(save)
+    tabbed_app.repository.close()
+    root.destroy()
+
+
+@contextlib.contextmanager
+def virtual_display():
+    # Use the current display if there is one, otherwise start an Xvfb server for the run
+    if os.environ.get('DISPLAY'):
+        yield
+        return
+    xvfb = shutil.which('Xvfb')
+    if xvfb is None:
+        raise RuntimeError("No DISPLAY is set and Xvfb is not installed; run under xvfb-run or install Xvfb.")
+    import subprocess
+    display = ':%d' % (100 + os.getpid() % 1000)
+    server = subprocess.Popen([xvfb, display, '-screen', '0', '1280x1024x24', '-nolisten', 'tcp'],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ['DISPLAY'] = display
+    try:
+        time.sleep(0.5)  # Give the server a moment to accept connections
+        yield
+    finally:
+        del os.environ['DISPLAY']
+        server.terminate()
+        server.wait()
+
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, gui=False):
+    # Returns {'environment': ..., 'results': {name: seconds}}, each size in a scratch directory
+    import platform
+    import tempfile
+    results = {}
+    home = os.getcwd()
+    for rows in sizes:
+        with tempfile.TemporaryDirectory(prefix='video-benchmark-') as directory:
+            generate_catalog(directory, rows)
+            os.chdir(directory)
+            try:
+                print(f"Benchmarking {rows:,} rows...")
+                benchmark_data_layer(rows, results)
+                if gui:
+                    with virtual_display():
+                        benchmark_gui(rows, results)
+            finally:
+                PERSISTENCE.flush()
+                os.chdir(home)
+    return {
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'storage': STORAGE_BACKEND, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+    }
+
+
+def compare_benchmarks(report, baseline, tolerance=BENCHMARK_TOLERANCE):
+    # Names of the measurements that got slower than the baseline by more than `tolerance`
+    regressions = []
+    for name, seconds in sorted(report['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = (seconds - before) / before if before else 0.0
+        # Sub-millisecond timings are too noisy to call a regression on their own
+        regressed = change > tolerance and seconds - before > 0.001
+        print(f"{name:<40} {before * 1000:10.2f} ms -> {seconds * 1000:10.2f} ms  {change:+7.1%}"
+              + ("  REGRESSION" if regressed else ""))
+        if regressed:
+            regressions.append(name)
+    return regressions
 
 
 if __name__ == "__main__":
-    app = TabbedApp()
+    parser = argparse.ArgumentParser(description="Video rental manager")
+    parser.add_argument('--storage', choices=['text', 'sqlite', 'mmap'], default=STORAGE_BACKEND,
+                        help="where the catalog is stored")
+    parser.add_argument('--migrate-to-sqlite', action='store_true',
+                        help=f"copy {DATA_FILE} and {CUSTOMER_DATA_FILE} into {SQLITE_DATABASE} and exit")
+    parser.add_argument('--headless', action='store_true',
+                        help="serve the catalog as HTTP/JSON on --host/--port instead of opening a window")
+    parser.add_argument('--host', default=API_HOST, help="address for --headless to listen on")
+    parser.add_argument('--port', type=int, default=API_PORT, help="port for --headless to listen on")
+    parser.add_argument('--debug-overlay', action='store_true',
+                        help="show live timings over the tabs (F12 toggles it at any time)")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="print how long startup took, milestone by milestone, once the first tab has loaded")
+    parser.add_argument('--no-metrics', action='store_true',
+                        help=f"do not time the hot paths or write {METRICS_FILE}")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="time load, search, sort, rent/return and save on synthetic catalogs and exit")
+    parser.add_argument('--sizes', default=','.join(str(rows) for rows in BENCHMARK_SIZES),
+                        help="comma-separated catalog sizes for --benchmark")
+    parser.add_argument('--large', action='store_true',
+                        help="also benchmark catalogs of " + " and ".join(f"{rows:,}" for rows in BENCHMARK_LARGE_SIZES)
+                             + " rows")
+    parser.add_argument('--gui', action='store_true',
+                        help="also benchmark the Tk tabs (starts Xvfb when there is no DISPLAY)")
+    parser.add_argument('--output', help="write the --benchmark results to this JSON file")
+    parser.add_argument('--baseline', default=BENCHMARK_BASELINE,
+                        help="JSON results to compare --benchmark against")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store the --benchmark results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=BENCHMARK_TOLERANCE,
+                        help="allowed slowdown against the baseline, e.g. 0.25 for 25%%")
+    args = parser.parse_args()
+    if args.migrate_to_sqlite:
+        migrate_to_sqlite()
+        raise SystemExit
+    STORAGE_BACKEND = args.storage
+    METRICS.enabled = not args.no_metrics
+    if args.benchmark:
+        try:
+            sizes = [int(rows) for rows in args.sizes.split(',')]
+            if args.large:
+                sizes += [rows for rows in BENCHMARK_LARGE_SIZES if rows not in sizes]
+            report = run_benchmarks(sizes, gui=args.gui)
+        except RuntimeError as e:
+            parser.error(str(e))
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(report, file, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+        regressions = []
+        if args.save_baseline:
+            with open(args.baseline, 'w') as file:
+                json.dump(report, file, indent=2)
+        elif os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                regressions = compare_benchmarks(report, json.load(file), args.tolerance)
+            print(f"{len(regressions)} regression(s) against {args.baseline}")
+        raise SystemExit(1 if regressions else 0)
+    if args.headless:
+        run_headless(args.host, args.port)
+        raise SystemExit
+
+    if args.startup_report:
+        STARTUP.print_at = 'load.videos finished'
+    app = TabbedApp(debug_overlay=args.debug_overlay)
     app.add_tab(VideoInfoApp, "Manage Video")
     app.add_tab(CustomerInfoApp, "Manage Customer")
+    app.add_tab(AnalyticsApp, "Analytics")
     app.run()
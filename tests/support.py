@@ -0,0 +1,20 @@
+# The application is a single script whose file name is not a module name; load it once
+# under the name `video_app` so that every test module shares the same module state.
+import importlib.util
+import os
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'Python Project - 12-9-23 Version1.py')
+
+
+def load_app():
+    if 'video_app' not in sys.modules:
+        spec = importlib.util.spec_from_file_location('video_app', SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['video_app'] = module
+        spec.loader.exec_module(module)
+    return sys.modules['video_app']
+
+
+app = load_app()
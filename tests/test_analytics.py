@@ -0,0 +1,102 @@
+import contextlib
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from tests.support import app
+
+
+class RentalAnalyticsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'rental_analytics.json')
+        self.video_data = app.RecordStore(app.VIDEO_COLUMNS, types=app.VIDEO_COLUMN_TYPES,
+                                          categorical=app.VIDEO_CATEGORICAL_COLUMNS)
+        for row_data in (['1', 'Heat', '1995', 'Michael Mann', '8.3', 'Crime', 'Available'],
+                         ['2', 'Alien', '1979', 'Ridley Scott', '8.5', 'Horror', 'Available'],
+                         ['3', 'Ran', '1985', 'Akira Kurosawa', '8.2', 'Drama', 'Available']):
+            self.video_data.add(row_data)
+        self.ledger = self.open_ledger()
+
+    def tearDown(self):
+        self.ledger.close()
+        self.directory.cleanup()
+
+    def open_ledger(self):
+        ledger = app.RentalLedger(os.path.join(self.directory.name, 'rentals.ledger'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            ledger.load()
+        self.video_data.subscribe(ledger.on_video_change)
+        return ledger
+
+    def open_analytics(self, path=None, clock=time.time):
+        analytics = app.RentalAnalytics(self.ledger, self.video_data, path or self.path, clock=clock)
+        with contextlib.redirect_stdout(io.StringIO()):
+            analytics.start()
+        return analytics
+
+    def totals(self, analytics):
+        return (dict(analytics.by_video), dict(analytics.by_genre), dict(analytics.by_customer),
+                [row[1:4] for row in analytics.days()], analytics.rentals_seen, analytics.returns_seen)
+
+    def rebuilt(self):
+        # The same aggregates built from scratch in one pass over the ledger
+        return self.totals(self.open_analytics(os.path.join(self.directory.name, 'fresh.json')))
+
+    def test_follows_the_ledger(self):
+        self.ledger.rent('1', 'c1')
+        analytics = self.open_analytics()
+        changes = []
+        analytics.listeners.append(lambda: changes.append(True))
+        self.ledger.rent('2', 'c1')
+        self.ledger.rent('3', 'c2')
+        self.ledger.return_video('1')
+        self.ledger.rent('1', 'c2')
+        self.video_data.update('1', {'ID': '10'})
+        self.assertEqual(len(changes), 5)
+        self.assertEqual(analytics.top_videos(1), [('10', 2)])
+        self.assertEqual(analytics.top_customers(), [('c1', 2), ('c2', 2)])
+        self.assertEqual(analytics.genres(), [('Crime', 2), ('Horror', 1), ('Drama', 1)])
+        self.assertEqual(analytics.days()[-1][1:4], (4, 1, 3))
+        self.assertEqual(self.totals(analytics), self.rebuilt())
+
+    def test_catalog_size_is_stamped_once_and_only_on_today(self):
+        self.ledger.rent('1', 'c1')
+        later = self.open_analytics(os.path.join(self.directory.name, 'later.json'),
+                                    clock=lambda: time.time() + 2 * 86400)
+        analytics = self.open_analytics()
+        self.assertEqual(analytics.days()[-1][4], 3)
+        self.video_data.add(['4', 'Up', '2009', 'Pete Docter', '8.3', 'Family', 'Available'])
+        self.ledger.rent('2', 'c1')
+        self.assertEqual(analytics.days()[-1][1:], (2, 0, 2, 3))
+        self.assertEqual(later.days()[-1][1:], (2, 0, 2, None))  # Caught up on a day since past
+
+    def test_saved_aggregates_catch_up(self):
+        self.ledger.rent('1', 'c1')
+        analytics = self.open_analytics()
+        analytics.save()
+        app.PERSISTENCE.flush()
+        self.ledger.rent('2', 'c2')
+        self.ledger.return_video('1')
+
+        reloaded = app.RentalAnalytics(self.ledger, self.video_data, self.path)
+        self.assertTrue(reloaded.load())
+        self.assertEqual(reloaded.rentals_seen, 1)
+        reloaded.catch_up()
+        self.assertEqual(self.totals(reloaded), self.rebuilt())
+
+    def test_saved_for_another_ledger_is_rebuilt(self):
+        self.ledger.rent('1', 'c1')
+        self.open_analytics().save()
+        app.PERSISTENCE.flush()
+        self.ledger.close()
+        os.remove(self.ledger.path)
+        self.ledger = self.open_ledger()
+        self.assertFalse(app.RentalAnalytics(self.ledger, self.video_data, self.path).load())
+        self.assertEqual(self.open_analytics().rentals_seen, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
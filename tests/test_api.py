@@ -0,0 +1,132 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from tests.support import app
+
+
+class ApiServerTest(unittest.TestCase):
+    # The real server on a free localhost port, driven over one keep-alive connection
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory.name)
+        with open(app.DATA_FILE, 'w', newline='') as file:
+            file.write('1,Heat,1995,Michael Mann,8.3,Crime,Available\n'
+                       '2,Alien,1979,Ridley Scott,8.5,Horror,Available\n'
+                       '3,Night Moves,1975,Arthur Penn,7.0,Crime,Available\n')
+        with open(app.CUSTOMER_DATA_FILE, 'w', newline='') as file:
+            file.write('c1,Ada,Lovelace,1 Main St,5550000001,ada@example.com\n')
+        self.repository = app.Repository()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for storage in (self.repository.video_storage, self.repository.customer_storage):
+                app.load_all(storage)
+
+    def tearDown(self):
+        self.repository.close()
+        self.repository.ledger.close()
+        os.chdir(self.previous_directory)
+        self.directory.cleanup()
+
+    def serve(self, client):
+        # Run client(reader, writer) against a started server, then stop it
+        async def main():
+            server = app.ApiServer(self.repository)
+            port = await server.start('127.0.0.1', 0)
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            try:
+                return await client(reader, writer)
+            finally:
+                writer.close()
+                await server.stop()
+
+        return asyncio.run(main())
+
+    async def request(self, reader, writer, method, path, body=None, length=None):
+        # length: a Content-Length to claim instead of the body's
+        data = b'' if body is None else body if isinstance(body, bytes) else json.dumps(body).encode()
+        length = len(data) if length is None else length
+        head = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {length}"]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + data)
+        await writer.drain()
+        status_line, *header_lines = (await reader.readuntil(b'\r\n\r\n')).decode().split('\r\n')
+        response_headers = dict(line.split(': ', 1) for line in header_lines if line)
+        payload = json.loads(await reader.readexactly(int(response_headers['Content-Length'])))
+        return int(status_line.split(' ')[1]), payload, response_headers
+
+    def test_search_and_rentals_on_one_connection(self):
+        async def client(reader, writer):
+            responses = []
+            for method, path, body in (('GET', '/videos?q=night', None),
+                                       ('GET', '/videos?filter=genre:Crime&sort=-Year', None),
+                                       ('POST', '/rentals', {'customer_id': 'c1', 'video_id': '2'}),
+                                       ('GET', '/rentals?customer_id=c1', None),
+                                       ('POST', '/returns', {'video_id': '2'}),
+                                       ('GET', '/videos/2', None)):
+                responses.append(await self.request(reader, writer, method, path, body))
+            return responses
+
+        search, listing, rental, rentals, returned, video = self.serve(client)
+        self.assertEqual(search[0], 200)
+        self.assertEqual([row['ID'] for row in search[1]['rows']], ['3'])
+        self.assertEqual([row['ID'] for row in listing[1]['rows']], ['1', '3'])
+        self.assertEqual(rental[:2], (201, {'rental': 0, 'customer_id': 'c1', 'video_id': '2'}))
+        self.assertEqual([entry['video_id'] for entry in rentals[1]['rentals']], ['2'])
+        self.assertEqual(returned[:2], (200, {'rental': 0, 'video_id': '2'}))
+        self.assertEqual(video[1]['record']['Status'], 'Available')
+        self.assertTrue(all(response[2]['Connection'] == 'keep-alive' for response in (search, video)))
+        self.assertFalse(self.repository.ledger.is_rented('2'))
+
+    def test_batch_rentals(self):
+        async def client(reader, writer):
+            return [await self.request(reader, writer, 'POST', '/rentals',
+                                       {'customer_id': 'c1', 'video_ids': ['1', '2', '99']}),
+                    await self.request(reader, writer, 'POST', '/returns', {'video_ids': ['2', '3']}),
+                    await self.request(reader, writer, 'POST', '/returns', {'video_ids': '1'})]
+
+        rented, returned, wrong = self.serve(client)
+        self.assertEqual(rented[1]['rented'], ['1', '2'])
+        self.assertEqual([entry['video_id'] for entry in rented[1]['failed']], ['99'])
+        self.assertEqual(returned[1], {'returned': ['2'],
+                                       'failed': [{'video_id': '3', 'error': "This movie is not rented."}]})
+        self.assertEqual(wrong[0], 400)
+        self.assertTrue(self.repository.ledger.is_rented('1'))
+
+    def test_errors(self):
+        rental = {'customer_id': 'c1', 'video_id': '1'}
+
+        async def client(reader, writer):
+            responses = [await self.request(reader, writer, 'POST', '/returns', {'video_id': '1'}),
+                         await self.request(reader, writer, 'POST', '/rentals', rental),
+                         await self.request(reader, writer, 'POST', '/rentals', rental),
+                         await self.request(reader, writer, 'POST', '/rentals', [1]),
+                         await self.request(reader, writer, 'POST', '/videos', b'{not json'),
+                         await self.request(reader, writer, 'GET', '/videos/99'),
+                         await self.request(reader, writer, 'POST', '/videos', length=app.API_MAX_BODY + 1)]
+            responses.append(await reader.read())  # The server closes the connection after a 413
+            return responses
+
+        *responses, rest = self.serve(client)
+        self.assertEqual([status for status, _, _ in responses], [409, 201, 409, 400, 400, 404, 413])
+        self.assertEqual(responses[0][1], {'error': "This movie is not rented."})
+        self.assertEqual(responses[-1][2]['Connection'], 'close')
+        self.assertEqual(rest, b'')
+        self.assertEqual(self.repository.video_data.value('1', 'Status'), 'Rented')
+
+    def test_negative_content_length(self):
+        async def client(reader, writer):
+            response = await self.request(reader, writer, 'POST', '/rentals', length=-1)
+            return response, await reader.read()
+
+        (status, payload, headers), rest = self.serve(client)
+        self.assertEqual((status, payload), (400, {'error': "Malformed request."}))
+        self.assertEqual(headers['Connection'], 'close')
+        self.assertEqual(rest, b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import contextlib
+import io
+import unittest
+
+from tests.support import app
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_data_layer_run(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = app.run_benchmarks([200])
+        results = report['results']
+        for name in ('load', 'search/night', 'sort/Year/first', 'sort/Year/desc', 'rent', 'return', 'save'):
+            self.assertGreaterEqual(results[f'data/200/{name}'], 0)
+        self.assertEqual(report['environment']['storage'], app.STORAGE_BACKEND)
+
+    def test_compare_against_baseline(self):
+        baseline = {'results': {'load': 0.100, 'search': 0.0001, 'sort': 0.050, 'gone': 1.0}}
+        report = {'results': {'load': 0.200, 'search': 0.0009, 'sort': 0.051, 'new': 1.0}}
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            regressions = app.compare_benchmarks(report, baseline, tolerance=0.25)
+        # The search change is large in percent but below the millisecond noise floor
+        self.assertEqual(regressions, ['load'])
+        self.assertIn('REGRESSION', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import operator
+import unittest
+
+from tests.support import app
+
+
+class FilterEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.store = app.RecordStore(app.VIDEO_COLUMNS, unique_keys=('Name',), types=app.VIDEO_COLUMN_TYPES,
+                                     categorical=app.VIDEO_CATEGORICAL_COLUMNS)
+        for row_data in (['1', 'Heat', '1995', 'Michael Mann', '8.3', 'Crime', 'Available'],
+                         ['2', 'Alien', '1979', 'Ridley Scott', '8.5', 'Horror', 'Rented'],
+                         ['3', 'Up', '2009', 'Pete Docter', '8.3', 'Family', 'Available'],
+                         ['4', 'Ran', '1985', 'Akira Kurosawa', '8.2', 'Drama', 'Available'],
+                         ['5', 'Gone', '1999', 'Nobody', '6.0', 'Drama', 'Available'],
+                         ['6', 'Lolita', '1962', 'Stanley Kubrick', '7.6', 'Drama', 'Rented']):
+            self.store.add(row_data)
+        self.store.delete('5')  # Leaves a hole the masks must skip
+
+    def query(self, condition):
+        # Pure Python masks, NumPy ones where it is installed, and the conditions tested one
+        # record at a time must agree
+        results = [app.FilterEngine(self.store, use_numpy=use_numpy).query(condition)
+                   for use_numpy in (False, True)]
+        results.append([record_id for record_id in self.store.ids()
+                        if condition.matches_record(self.store.get(record_id))])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+        return results[0]
+
+    def test_conditions(self):
+        self.assertEqual(self.query(app.OneOf('Genre', ['drama', 'Crime'])), ['1', '4', '6'])
+        self.assertEqual(self.query(app.Between('Year', 1979, 1995)), ['1', '2', '4'])
+        self.assertEqual(self.query(app.Between('Year', high=1970)), ['6'])
+        self.assertEqual(self.query(app.Compare('Rating', operator.ge, 8.3)), ['1', '2', '3'])
+        self.assertEqual(self.query(app.StartsWith('Director', 'ST')), ['6'])
+        self.assertEqual(self.query(app.Equals('ID', '3')), ['3'])
+
+    def test_combinations(self):
+        drama = app.Equals('Genre', 'Drama')
+        self.assertEqual(self.query(drama & app.Equals('Status', 'Available')), ['4'])
+        self.assertEqual(self.query(drama | app.Compare('Rating', operator.gt, 8.4)), ['2', '4', '6'])
+        self.assertEqual(self.query(~drama), ['1', '2', '3'])
+
+    def test_follows_the_store(self):
+        self.store.update('3', {'Genre': 'Drama', 'Year': 1950})
+        self.store.add(['7', 'Dune', '2021', 'Denis Villeneuve', '8.0', 'Science Fiction', 'Available'])
+        self.assertEqual(self.query(app.OneOf('Genre', ['Drama', 'Science Fiction'])), ['3', '4', '6', '7'])
+        self.assertEqual(self.query(app.Compare('Year', operator.lt, 1960)), ['3'])
+
+    def test_a_value_condition_needs_matches(self):
+        class Incomplete(app.ValueCondition):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete('Genre')
+        with self.assertRaises(TypeError):
+            app.ValueCondition('Genre')
+
+    def test_unknown_column(self):
+        with self.assertRaises(ValueError):
+            app.FilterEngine(self.store).query(app.Equals('Studio', 'Pixar'))
+
+
+class ParseFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.store = app.RecordStore(app.VIDEO_COLUMNS, types=app.VIDEO_COLUMN_TYPES,
+                                     categorical=app.VIDEO_CATEGORICAL_COLUMNS)
+        for row_data in (['1', 'Heat', '1995', 'Michael Mann', '8.3', 'Crime', 'Available'],
+                         ['2', 'Lolita', '1962', 'Stanley Kubrick', '7.6', 'Drama', 'Rented'],
+                         ['3', 'Ran', '1985', 'Akira Kurosawa', '8.2', 'Drama', 'Available']):
+            self.store.add(row_data)
+        self.engine = app.FilterEngine(self.store, use_numpy=False)
+
+    def ids(self, text):
+        return self.engine.query(app.parse_filter(text, self.store))
+
+    def test_syntax(self):
+        self.assertEqual(self.ids('genre:drama,crime year:1980..'), ['1', '3'])
+        self.assertEqual(self.ids('director:"Stanley K*"'), ['2'])
+        self.assertEqual(self.ids('rating>=8.3 OR status=Rented'), ['1', '2'])
+        self.assertEqual(self.ids('genre:drama and -status:rented'), ['3'])
+        self.assertEqual(self.ids('year:..1970'), ['2'])
+
+    def test_errors(self):
+        for text in ('genre', 'studio:Pixar', 'year>=soon', 'director:"Stanley', 'OR genre:Drama'):
+            with self.assertRaises(ValueError, msg=text):
+                app.parse_filter(text, self.store)
+
+
+class FacetCountsTest(unittest.TestCase):
+    def setUp(self):
+        self.store = app.RecordStore(app.VIDEO_COLUMNS, types=app.VIDEO_COLUMN_TYPES,
+                                     categorical=app.VIDEO_CATEGORICAL_COLUMNS)
+        for row_data in (['1', 'Heat', '1995', 'Michael Mann', '8.3', 'Crime', 'Available'],
+                         ['2', 'Lolita', '1962', 'Stanley Kubrick', '7.6', 'Drama', 'Rented'],
+                         ['3', 'Ran', '1985', 'Akira Kurosawa', '8.2', 'Drama', 'Available'],
+                         ['4', 'Gone', '1999', 'Nobody', '6.0', 'Drama', 'Available']):
+            self.store.add(row_data)
+        self.store.delete('4')
+        self.facets = app.FacetCounts(self.store, app.VIDEO_FACETS)
+        self.store.subscribe(self.facets.on_change)
+
+    def recount(self, record_ids=None):
+        # What reset() counts from scratch, to compare the incremental counts against
+        fresh = app.FacetCounts(self.store, app.VIDEO_FACETS)
+        fresh.reset(record_ids)
+        return fresh.counts
+
+    def test_whole_catalog(self):
+        self.facets.reset()
+        self.assertEqual(self.facets.top('Genre'), [('Drama', 2), ('Crime', 1)])
+        self.assertEqual(self.facets.counts['Year'], {1990: 1, 1960: 1, 1980: 1})
+        self.store.add(['5', 'Alien', '1979', 'Ridley Scott', '8.5', 'Horror', 'Available'])
+        self.store.update('2', {'Status': 'Available', 'Year': 1997})
+        self.store.delete('1')
+        self.assertEqual(self.facets.counts, self.recount())
+        self.assertEqual(self.facets.top('Status'), [('Available', 3)])
+        self.assertEqual(self.facets.top('Genre', limit=1), [('Drama', 2)])
+
+    def test_rows_shown(self):
+        self.facets.reset(['2', '3'])
+        self.assertEqual(self.facets.counts['Status'], {'Rented': 1, 'Available': 1})
+        self.store.update('2', {'ID': '20', 'Status': 'Available'})
+        self.store.update('1', {'Status': 'Rented'})  # Not shown
+        self.store.delete('3')
+        self.assertEqual(self.facets.members, {'20'})
+        self.assertEqual(self.facets.counts, self.recount(['20']))
+
+    def test_rows_shown_follow_the_filter(self):
+        # As VideoInfoApp passes it on: whether each changed record matches the filter now
+        drama = app.Equals('Genre', 'Drama')
+        engine = app.FilterEngine(self.store, use_numpy=False)
+        facets = app.FacetCounts(self.store, app.VIDEO_FACETS)
+        facets.reset(engine.query(drama))
+        self.store.subscribe(lambda event, record_id, old_record, new_record: facets.on_change(
+            event, record_id, old_record, new_record,
+            shown=None if new_record is None else drama.matches_record(new_record)))
+        self.store.add(['5', 'Alien', '1979', 'Ridley Scott', '8.5', 'Horror', 'Available'])
+        self.store.add(['6', 'Ikiru', '1952', 'Akira Kurosawa', '8.3', 'Drama', 'Available'])
+        self.store.update('1', {'Genre': 'Drama'})
+        self.store.update('2', {'ID': '20', 'Genre': 'Comedy'})
+        self.store.update('3', {'Status': 'Rented'})
+        self.assertEqual(facets.members, set(engine.query(drama)))
+        self.assertEqual(facets.counts, self.recount(engine.query(drama)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from tests.support import app
+
+
+class BulkImportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = app.RecordStore(app.VIDEO_COLUMNS, unique_keys=('Name',), types=app.VIDEO_COLUMN_TYPES,
+                                     categorical=app.VIDEO_CATEGORICAL_COLUMNS)
+        self.storage = app.TextStorage(os.path.join(self.directory.name, 'video.txt'), self.store)
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.load_all(self.storage)
+        self.store.add(['1', 'Heat', '1995', 'Michael Mann', '8.3', 'Crime', 'Available'])
+
+    def tearDown(self):
+        self.storage.close()
+        self.directory.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            file.write(text)
+        return path
+
+    def parse(self, path):
+        return app.parse_import_file(path, self.store.keys(), self.store.primary_key, self.store.unique_keys[1:],
+                                     self.store.types, app.VIDEO_STATUSES)
+
+    def test_parse_csv_checks_every_row(self):
+        path = self.write('import.csv', ','.join(app.VIDEO_COLUMNS) + '\n'
+                          '2,Alien,1979,Ridley Scott,8.5,Horror,Available\n'
+                          '3,Up,2009,Pete Docter\n'
+                          '4,Ran,soon,Akira Kurosawa,8.2,Drama,Available\n'
+                          '5,Alien,1986,James Cameron,8.4,Action,Available\n'
+                          '6,Jaws,1975,Steven Spielberg,8.1,Thriller,Lost\n'
+                          '7,"Crouching Tiger, Hidden Dragon",2000,Ang Lee,7.9,Action,Rented\n')
+        rows, errors = self.parse(path)
+        self.assertEqual([row_data[0] for row_data in rows], ['2', '7'])
+        self.assertEqual(rows[0][2], 1979)
+        self.assertEqual([error.split(':')[0] for error in errors], ['Line 3', 'Line 4', 'Line 5', 'Line 6'])
+
+    def test_parse_json_lines(self):
+        path = self.write('import.jsonl', json.dumps({'ID': '2', 'Name': 'Alien', 'Year': 1979, 'Director': 'Ridley Scott',
+                                                      'Rating': 8.5, 'Genre': 'Horror', 'Status': 'Available'})
+                          + '\n\n[1, 2]\n{"ID": \n')
+        rows, errors = self.parse(path)
+        self.assertEqual(rows, [['2', 'Alien', 1979, 'Ridley Scott', 8.5, 'Horror', 'Available']])
+        self.assertEqual(errors, ['Line 3: expected an object', 'Line 4: not valid JSON'])
+
+    def test_merge_reports_clashes_with_the_catalog(self):
+        importer = app.BulkImport(None, self.storage, on_done=None)
+        errors = []
+        added = importer.merge([['2', 'Alien', 1979, 'Ridley Scott', 8.5, 'Horror', 'Available'],
+                                ['1', 'Heat 2', 2025, 'Michael Mann', 7.0, 'Crime', 'Available']], errors)
+        self.assertEqual(added, ['2'])
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith('ID 1:'))
+        app.PERSISTENCE.flush()
+        self.storage.journal.compactor.join()
+        with open(self.storage.path) as file:
+            self.assertEqual([line.split(',')[0] for line in file], ['1', '2'])
+
+    def test_export_round_trip(self):
+        self.store.add(['2', 'Crouching Tiger, Hidden Dragon', '2000', 'Ang Lee', '7.9', 'Action', 'Rented'])
+        for name in ('export.csv', 'export.jsonl'):
+            path = os.path.join(self.directory.name, name)
+            app.export_records(path, self.store, ['2', '1'])
+            app.PERSISTENCE.flush()
+            rows, errors = self.parse(path)
+            self.assertEqual(errors, [])
+            self.assertEqual(rows, [self.store.values('2'), self.store.values('1')])
+
+
+if __name__ == '__main__':
+    unittest.main()
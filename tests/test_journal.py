@@ -0,0 +1,180 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from tests.support import app
+
+
+class JournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'customer.txt')
+        with open(self.path, 'w', newline='') as file:
+            file.write('1,Ann,Smith,1 Main Street,5550000001,ann@example.com\n'
+                       '2,Ben,Chen,2 Main Street,5550000002,ben@example.com\n')
+        self.storages = []
+
+    def tearDown(self):
+        for storage in self.storages:
+            storage.close()
+        self.directory.cleanup()
+
+    def open_storage(self, path=None, columns=app.CUSTOMER_COLUMNS, **options):
+        # A freshly loaded store and its journaled text storage, as the next start would see them
+        store = app.RecordStore(columns, **options)
+        storage = app.TextStorage(path or self.path, store)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            app.load_all(storage)
+        self.storages.append(storage)
+        self.output = output.getvalue()
+        return store, storage
+
+    def records(self, store):
+        return {record_id: store.get(record_id) for record_id in store}
+
+    def finish_compaction(self, storage):
+        app.PERSISTENCE.flush()
+        if storage.journal.compactor is not None:
+            storage.journal.compactor.join()
+
+
+class JournalReplayTest(JournalTestCase):
+    def test_replay(self):
+        store, storage = self.open_storage()
+        store.add(['3', 'Carla', 'Okafor', '3 Main Street', '5550000003', 'carla@example.com'])
+        store.update('1', {'Last Name': 'Smith-Jones'})
+        store.update('2', {'ID': '20'})
+        store.delete('3')
+        store.add(['4', 'Dev', 'Novak', '4 Main Street, Apt 2', '5550000004', 'dev@example.com'])
+        app.PERSISTENCE.flush()
+        with open(self.path) as file:
+            self.assertEqual(len(file.readlines()), 2)  # Only the journal has the changes
+
+        replayed, _ = self.open_storage()
+        self.assertEqual(self.records(replayed), self.records(store))
+        self.assertEqual(replayed.value('4', 'Address'), '4 Main Street, Apt 2')
+
+    def test_torn_journal_line_is_ignored(self):
+        store, storage = self.open_storage()
+        store.update('1', {'First Name': 'Anna'})
+        app.PERSISTENCE.flush()
+        with open(storage.journal.path, 'a') as file:
+            file.write('{"op": "put", "id": "2", "v"')  # A crash in the middle of the append
+
+        replayed, _ = self.open_storage()
+        self.assertIn('incomplete journal record', self.output)
+        self.assertEqual(self.records(replayed), self.records(store))
+
+    def test_compaction(self):
+        store, storage = self.open_storage()
+        store.add(['3', 'Carla', 'Okafor', '3 Main Street', '5550000003', 'carla@example.com'])
+        store.delete('2')
+        storage.journal.compact()
+        self.finish_compaction(storage)
+        self.assertFalse(os.path.exists(storage.journal.path))
+        store.update('3', {'Phone Number': '5550000033'})
+        app.PERSISTENCE.flush()
+
+        replayed, _ = self.open_storage()
+        self.assertEqual(self.records(replayed), self.records(store))
+        with open(self.path) as file:
+            self.assertEqual([line.split(',')[0] for line in file], ['1', '3'])
+
+    def test_rows_that_fail_to_load_are_kept(self):
+        with open(self.path, 'a', newline='') as file:
+            file.write('5,only two fields\n'
+                       '1,Dup,Licate,9 Main Street,5550000009,dup@example.com\n')
+        store, storage = self.open_storage()
+        self.assertEqual(sorted(store), ['1', '2'])
+        self.assertEqual(len(storage.rejected), 2)
+        self.assertIn('2 rows', self.output)
+        store.add(['3', 'Carla', 'Okafor', '3 Main Street', '5550000003', 'carla@example.com'])
+        storage.journal.compact()
+        self.finish_compaction(storage)
+
+        with open(self.path) as file:
+            lines = file.read().splitlines()
+        self.assertEqual(lines[3:], ['5,only two fields', '1,Dup,Licate,9 Main Street,5550000009,dup@example.com'])
+        replayed, reloaded = self.open_storage()
+        self.assertEqual(self.records(replayed), self.records(store))
+        self.assertEqual(len(reloaded.rejected), 2)
+
+    def test_old_video_column_order(self):
+        path = os.path.join(self.directory.name, 'video.txt')
+        with open(path, 'w', newline='') as file:
+            file.write('1,The Shawshank Redemption,1994,Frank Darabont,Drama,9.3,Available\n'
+                       '2,New Film,2001,Someone,7.5,Comedy,Available\n')
+        options = {'unique_keys': ('Name',), 'types': app.VIDEO_COLUMN_TYPES}
+        store, storage = self.open_storage(path, app.VIDEO_COLUMNS, **options)
+        self.assertIn('older column order', self.output)
+        self.assertEqual((store.value('1', 'Rating'), store.value('1', 'Genre')), (9.3, 'Drama'))
+        self.assertEqual(store.value('2', 'Rating'), 7.5)
+        self.finish_compaction(storage)
+
+        with open(path) as file:
+            self.assertEqual(file.readline(), '1,The Shawshank Redemption,1994,Frank Darabont,9.3,Drama,Available\n')
+        replayed, _ = self.open_storage(path, app.VIDEO_COLUMNS, **options)
+        self.assertEqual(self.output, '')
+        self.assertEqual(self.records(replayed), self.records(store))
+
+
+class SharedJournalTest(JournalTestCase):
+    # Two clerks on the same files. Both journals live in this process and share the worker's
+    # queue key, so each clerk's writes are flushed before the other one writes.
+    def catch_up(self, storage):
+        storage.journal.check_for_changes()
+        app.PERSISTENCE.flush()
+        storage.journal.apply_changes()
+
+    def test_other_clerks_changes_are_applied(self):
+        first, first_storage = self.open_storage()
+        second, second_storage = self.open_storage()
+        first.update('1', {'Last Name': 'Smith-Jones'})
+        first.add(['3', 'Carla', 'Okafor', '3 Main Street', '5550000003', 'carla@example.com'])
+        app.PERSISTENCE.flush()
+        self.catch_up(second_storage)
+        self.assertEqual(self.records(second), self.records(first))
+
+        second.delete('2')
+        app.PERSISTENCE.flush()
+        self.catch_up(first_storage)
+        self.assertEqual(sorted(first), ['1', '3'])
+
+    def test_conflicting_change_is_undone(self):
+        first, first_storage = self.open_storage()
+        second, second_storage = self.open_storage()
+        conflicts = []
+        second_storage.journal.on_conflict = conflicts.append
+        first.update('1', {'Last Name': 'Smith-Jones'})
+        app.PERSISTENCE.flush()
+        second.update('1', {'First Name': 'Anna'})  # Based on the version before the first clerk's
+        app.PERSISTENCE.flush()
+        second_storage.journal.apply_changes()
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(second.get('1'), first.get('1'))
+
+        replayed, _ = self.open_storage()
+        self.assertEqual(replayed.value('1', 'First Name'), 'Ann')
+        self.assertEqual(replayed.value('1', 'Last Name'), 'Smith-Jones')
+
+    def test_compact_now_does_not_wait_for_another_clerk(self):
+        store, storage = self.open_storage()
+        _, other_storage = self.open_storage()
+        other_storage.journal.compaction_lock.acquire()  # The other clerk is writing a snapshot
+        store.add(['3', 'Carla', 'Okafor', '3 Main Street', '5550000003', 'carla@example.com'])
+        storage.journal.compact_now()
+        self.finish_compaction(storage)
+        self.assertTrue(storage.journal.snapshot_owed)
+
+        other_storage.journal.compaction_lock.release()
+        storage.journal.apply_changes()  # The next ChangeWatcher poll
+        self.finish_compaction(storage)
+        self.assertFalse(storage.journal.snapshot_owed)
+        with open(self.path) as file:
+            self.assertEqual([line.split(',')[0] for line in file], ['1', '2', '3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
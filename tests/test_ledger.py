@@ -0,0 +1,176 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from tests.support import app
+
+
+class RentalLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'rentals.ledger')
+        self.ledgers = []
+
+    def tearDown(self):
+        for ledger in self.ledgers:
+            ledger.close()
+        self.directory.cleanup()
+
+    def open_ledger(self):
+        # A freshly loaded ledger on the shared file, as another start (or clerk) would see it
+        ledger = app.RentalLedger(self.path)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            ledger.load()
+        self.ledgers.append(ledger)
+        self.output = output.getvalue()
+        return ledger
+
+    def write(self, data):
+        with open(self.path, 'wb') as file:
+            file.write(data)
+
+    def state(self, ledger):
+        return [(ledger.video_ids[rental], ledger.customer_ids[rental], ledger.rented_at[rental],
+                 ledger.returned_at[rental]) for rental in range(len(ledger.video_ids))]
+
+    def test_round_trip(self):
+        ledger = self.open_ledger()
+        ledger.rent('1', 'c1')
+        ledger.rent('2', 'c1')
+        ledger.rent('3', 'c2')
+        ledger.return_video('1')
+        ledger.on_video_change('update', '2', None, {'ID': '2b'})
+        ledger.rent('1', 'c2')
+        app.PERSISTENCE.flush()
+
+        reloaded = self.open_ledger()
+        self.assertEqual(self.state(reloaded), self.state(ledger))
+        self.assertEqual(reloaded.active_by_video, {'2b': 1, '3': 2, '1': 3})
+        self.assertEqual(reloaded.active_by_customer, {'c1': {1}, 'c2': {2, 3}})
+        self.assertEqual(reloaded.history_by_video['1'], [0, 3])
+        self.assertEqual(list(reloaded.due_at), list(ledger.due_at))
+        self.assertEqual(self.output, '')
+
+    def test_torn_tail_is_cut_off(self):
+        ledger = self.open_ledger()
+        ledger.rent('1', 'c1')
+        ledger.rent('2', 'c1')
+        app.PERSISTENCE.flush()
+        size = os.path.getsize(self.path)
+        record = ledger.CHECKIN + ledger.WHEN.pack(5) + ledger.pack_id('1')
+        with open(self.path, 'ab') as file:
+            file.write(record[:-1])  # A crash in the middle of the append
+
+        reloaded = self.open_ledger()
+        self.assertIn('incomplete record', self.output)
+        self.assertEqual(os.path.getsize(self.path), size)
+        self.assertEqual(reloaded.active_by_video, {'1': 0, '2': 1})
+        reloaded.return_video('2')
+        app.PERSISTENCE.flush()
+        self.assertEqual(self.open_ledger().active_by_video, {'1': 0})
+
+    def test_contradictory_record_keeps_the_rest(self):
+        ledger = app.RentalLedger(self.path)
+        data = (ledger.MAGIC
+                + ledger.CHECKOUT + ledger.BOOKING.pack(10, 110) + ledger.pack_ids('1', 'c1')
+                + ledger.CHECKIN + ledger.WHEN.pack(11) + ledger.pack_id('9')  # Never rented
+                + ledger.CHECKOUT + ledger.BOOKING.pack(12, 112) + ledger.pack_ids('1', 'c2')  # Still out
+                + ledger.CHECKOUT + ledger.BOOKING.pack(13, 113) + ledger.pack_ids('2', 'c2')
+                + ledger.CHECKIN + ledger.WHEN.pack(14) + ledger.pack_id('1'))
+        self.write(data)
+
+        reloaded = self.open_ledger()
+        self.assertIn('video 9 is not rented', self.output)
+        self.assertIn('video 1 is already rented', self.output)
+        self.assertEqual(os.path.getsize(self.path), len(data))
+        self.assertEqual(reloaded.video_ids, ['1', '2'])
+        self.assertEqual(reloaded.active_by_video, {'2': 1})
+
+    def test_unreadable_record_is_kept(self):
+        ledger = app.RentalLedger(self.path)
+        data = (ledger.MAGIC + ledger.CHECKOUT + ledger.BOOKING.pack(10, 110) + ledger.pack_ids('1', 'c1')
+                + b'?' + ledger.WHEN.pack(11))
+        self.write(data)
+
+        reloaded = self.open_ledger()
+        self.assertIn('unknown record type', self.output)
+        self.assertEqual(os.path.getsize(self.path), len(data))
+        self.assertEqual(reloaded.active_by_video, {'1': 0})
+
+    def test_version_1_ledger(self):
+        ledger = app.RentalLedger(self.path)
+        times, pack_ids = ledger.TIMES, ledger.pack_ids
+        self.write(b'RLG1'
+                   + ledger.RENT + times.pack(0, 10) + pack_ids('1', 'c1')
+                   + ledger.RENT + times.pack(1, 20) + pack_ids('2', 'c1')
+                   + ledger.RETURN + times.pack(0, 30))
+
+        reloaded = self.open_ledger()
+        self.assertEqual(self.state(reloaded), [('1', 'c1', 10, 30), ('2', 'c1', 20, 0)])
+        self.assertEqual(reloaded.due_at[1], 20 + app.RENTAL_PERIOD_DAYS * 86400)
+        reloaded.return_video('2')
+        app.PERSISTENCE.flush()
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(4), ledger.MAGIC)
+        self.assertEqual(self.open_ledger().active_by_video, {})
+
+    def test_version_2_ledger(self):
+        # Checkouts without a due time, by video like the current ones
+        ledger = app.RentalLedger(self.path)
+        self.write(b'RLG2'
+                   + ledger.UNDATED_CHECKOUT + ledger.WHEN.pack(10) + ledger.pack_ids('1', 'c1')
+                   + ledger.UNDATED_CHECKOUT + ledger.WHEN.pack(20) + ledger.pack_ids('2', 'c1')
+                   + ledger.CHECKIN + ledger.WHEN.pack(30) + ledger.pack_id('1'))
+
+        reloaded = self.open_ledger()
+        self.assertEqual(self.output, '')
+        self.assertEqual(self.state(reloaded), [('1', 'c1', 10, 30), ('2', 'c1', 20, 0)])
+        self.assertEqual(reloaded.due_at[1], 20 + app.RENTAL_PERIOD_DAYS * 86400)
+        reloaded.rent('3', 'c2', due=12345)
+        app.PERSISTENCE.flush()
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(4), ledger.MAGIC)
+        again = self.open_ledger()
+        self.assertEqual(again.active_by_video, {'2': 1, '3': 2})
+        self.assertEqual(again.due_at[2], 12345)
+
+    def test_clerks_sharing_the_ledger(self):
+        # Two clerks rent and return different videos on the same file. Both ledgers live in
+        # this process and share the worker's queue key, so each write is flushed on its own.
+        first, second = self.open_ledger(), self.open_ledger()
+        first.rent('1', 'c1')
+        app.PERSISTENCE.flush()
+        second.rent('2', 'c2')
+        app.PERSISTENCE.flush()
+        first.return_video('1')
+        app.PERSISTENCE.flush()
+        second.return_video('2')
+        app.PERSISTENCE.flush()
+        first.sync()
+        second.sync()
+        for ledger in (first, second):
+            self.assertEqual(sorted(ledger.history_by_video), ['1', '2'])
+            self.assertEqual(ledger.active_by_video, {})
+
+        size = os.path.getsize(self.path)
+        reloaded = self.open_ledger()
+        self.assertEqual(self.output, '')
+        self.assertEqual(os.path.getsize(self.path), size)
+        self.assertEqual(reloaded.video_ids, ['1', '2'])
+        self.assertEqual(reloaded.active_by_video, {})
+
+    def test_rented_between_with_interleaved_times(self):
+        ledger = app.RentalLedger(self.path)
+        for video_id, when in (('a', 100), ('b', 50), ('c', 75), ('d', 100)):
+            ledger.apply_rent(video_id, 'c1', when)
+        ledger.apply_return(2, 90)
+        ledger.apply_return(0, 80)
+        self.assertEqual([rental['Video ID'] for rental in ledger.rented_between(0, 200)], ['b', 'c', 'a', 'd'])
+        self.assertEqual([rental['Video ID'] for rental in ledger.rented_between(60, 100)], ['c'])
+        self.assertEqual([rental['Video ID'] for rental in ledger.returned_between(0, 85)], ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from tests.support import app
+
+
+class MappedStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'video.dat')
+        self.text_path = os.path.join(self.directory.name, 'video.txt')
+        with open(self.text_path, 'w', newline='') as file:
+            file.write('1,Heat,1995,Michael Mann,8.3,Crime,Available\n'
+                       '2,Alien,1979,Ridley Scott,8.5,Horror,Rented\n'
+                       '3,Up,2009,Pete Docter,8.3,Family,Available\n')
+        self.storages = []
+
+    def tearDown(self):
+        for storage in self.storages:
+            storage.close()
+        self.directory.cleanup()
+
+    def open_storage(self):
+        store = app.RecordStore(app.VIDEO_COLUMNS, unique_keys=('Name',), types=app.VIDEO_COLUMN_TYPES)
+        storage = app.MappedStorage(self.path, store, app.MAPPED_VIDEO_WIDTHS, migrate_from=self.text_path)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            storage.load()
+        self.storages.append(storage)
+        self.output = output.getvalue()
+        return store, storage
+
+    def records(self, store):
+        return {record_id: store.get(record_id) for record_id in store}
+
+    def test_migrates_the_text_file(self):
+        store, storage = self.open_storage()
+        self.assertIn('Migrated 3 rows', self.output)
+        self.assertEqual(store.get('2')['Year'], 1979)
+        self.assertEqual(store.get('2')['Rating'], 8.5)
+
+        reopened, _ = self.open_storage()
+        self.assertEqual(self.output, '')
+        self.assertEqual(self.records(reopened), self.records(store))
+
+    def test_a_status_change_patches_only_its_field(self):
+        store, storage = self.open_storage()
+        storage.close()
+        with open(self.path, 'rb') as file:
+            before = file.read()
+        store.update('1', {'Status': 'Rented'})
+        storage.close()
+        with open(self.path, 'rb') as file:
+            after = file.read()
+        changed = [offset for offset in range(min(len(before), len(after))) if before[offset] != after[offset]]
+        field = dict((name, offset) for name, offset, _, _ in storage.fields)['Status']
+        start = storage.slot_offset(storage.slots['1']) + field
+        self.assertTrue(changed)
+        self.assertTrue(all(start <= offset < start + app.MAPPED_VIDEO_WIDTHS['Status'] for offset in changed))
+
+    def test_deleted_slots_are_reused(self):
+        store, storage = self.open_storage()
+        slot = storage.slots['2']
+        store.delete('2')
+        store.update('3', {'ID': '30', 'Name': 'Up!'})
+        store.add(['4', 'Jaws', '1975', 'Steven Spielberg', '8.1', 'Thriller', 'Available'])
+        self.assertEqual(storage.slots['4'], slot)
+        self.assertEqual(storage.slot_count, 3)
+        storage.save()
+
+        reopened, reopened_storage = self.open_storage()
+        self.assertEqual(self.records(reopened), self.records(store))
+        self.assertEqual(reopened.ids(), ['1', '4', '30'])  # The reused slot keeps its place
+        self.assertEqual(reopened_storage.free, [])
+
+    def test_text_too_long_for_its_field_is_refused(self):
+        store, storage = self.open_storage()
+        with self.assertRaises(ValueError):
+            store.add(['4', 'x' * 201, '1975', 'Steven Spielberg', '8.1', 'Thriller', 'Available'])
+        with self.assertRaises(ValueError):
+            store.update('1', {'Status': 'Lost somewhere in the back'})
+        self.assertEqual(len(store), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from tests.support import app
+
+
+class MetricsTest(unittest.TestCase):
+    def test_histogram_percentiles(self):
+        histogram = app.Histogram()
+        for milliseconds in [0.2] * 90 + [15] * 9 + [30000]:
+            histogram.record(milliseconds)
+        self.assertEqual(histogram.percentile(0.5), 0.5)
+        self.assertEqual(histogram.percentile(0.95), 20)
+        self.assertEqual(histogram.percentile(1.0), 30000)
+        summary = histogram.summary()
+        self.assertEqual((summary['count'], summary['max_ms'], summary['last_ms']), (100, 30000, 30000))
+        self.assertEqual(summary['buckets'], {'<=0.5': 90, '<=20': 9})
+        self.assertEqual(summary['over_max_bound'], 1)
+
+    def test_counters_timings_and_export(self):
+        metrics = app.Metrics(enabled=True)
+        metrics.count('search')
+        metrics.count('search', 2)
+        with metrics.timed('sort'):
+            pass
+        with self.assertRaises(KeyError):
+            with metrics.timed('sort'):
+                raise KeyError('the timing is still recorded')
+        self.assertEqual(metrics.histogram('sort').count, 2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.json')
+            metrics.export(path)
+            with open(path) as file:
+                exported = json.load(file)
+        self.assertEqual(exported['counters'], {'search': 3})
+        self.assertEqual(exported['timings']['sort']['count'], 2)
+
+    def test_disabled_metrics_record_nothing(self):
+        metrics = app.Metrics(enabled=False)
+        metrics.count('search')
+        with metrics.timed('sort'):
+            pass
+        self.assertEqual(metrics.snapshot()['counters'], {})
+        self.assertEqual(metrics.histogram('sort').count, 0)
+
+
+class StartupTimerTest(unittest.TestCase):
+    def test_each_milestone_is_recorded_once(self):
+        timer = app.StartupTimer(started=app.time.perf_counter())
+        timer.print_at = 'tab built: Videos'
+        timer.mark('window')
+        first = timer.marks['window']
+        timer.mark('window')
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            timer.mark('tab built: Videos')
+        self.assertEqual(list(timer.marks), ['window', 'tab built: Videos'])
+        self.assertEqual(timer.marks['window'], first)
+        self.assertLessEqual(first, timer.marks['tab built: Videos'])
+        self.assertEqual(output.getvalue(), timer.report() + '\n')
+        self.assertTrue(output.getvalue().startswith('window '))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from tests.support import app
+
+
+class OverdueSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ledger = app.RentalLedger(os.path.join(self.directory.name, 'rentals.ledger'))
+        self.now = 1000
+
+    def tearDown(self):
+        self.ledger.close()
+        self.directory.cleanup()
+
+    def open_scheduler(self):
+        # Without a root the scheduler is polled, as in --headless mode
+        scheduler = app.OverdueScheduler(self.ledger, clock=lambda: self.now)
+        self.changes = []
+        scheduler.listeners.append(lambda found, returned: self.changes.append((found, returned)))
+        scheduler.start()
+        return scheduler
+
+    def test_start_splits_off_the_overdue(self):
+        for video_id, due in (('1', 900), ('2', 2000), ('3', 500), ('4', 1500)):
+            self.ledger.rent(video_id, 'c1', due=due)
+        scheduler = self.open_scheduler()
+        self.assertEqual(scheduler.overdue, {2: 500, 0: 900})
+        self.assertEqual(self.changes, [([2, 0], [])])
+        self.assertEqual(sorted(scheduler.heap), [(1500, 3), (2000, 1)])
+
+    def test_rentals_come_due_in_order(self):
+        scheduler = self.open_scheduler()
+        self.ledger.rent('1', 'c1', due=3000)
+        self.ledger.rent('2', 'c1', due=2000)
+        self.ledger.rent('3', 'c2', due=2500)
+        self.assertEqual(scheduler.poll(), [])
+        self.now = 2600
+        self.assertEqual(scheduler.poll(), [1, 2])
+        self.now = 5000
+        self.assertEqual(scheduler.poll(), [0])
+        self.assertEqual(self.changes, [([1, 2], []), ([0], [])])
+
+    def test_returns(self):
+        scheduler = self.open_scheduler()
+        self.ledger.rent('1', 'c1', due=2000)
+        self.ledger.rent('2', 'c1', due=500)
+        scheduler.poll()
+        self.ledger.return_video('2')  # Was overdue
+        self.ledger.return_video('1')  # Not due yet; skipped when it reaches the top
+        self.now = 3000
+        self.assertEqual(scheduler.poll(), [])
+        self.assertEqual(scheduler.overdue, {})
+        self.assertEqual(self.changes, [([1], []), ([], [1])])
+
+    def test_rented_again_before_due(self):
+        # The returned rental's entry is stale; the new rental of the video has its own
+        scheduler = self.open_scheduler()
+        self.ledger.rent('1', 'c1', due=2000)
+        self.ledger.return_video('1')
+        self.ledger.rent('1', 'c2', due=2000)
+        self.now = 2000
+        self.assertEqual(scheduler.poll(), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import threading
+import unittest
+
+from tests.support import app
+
+
+class PersistenceWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.worker = app.PersistenceWorker()
+        self.calls = []
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.worker.close()
+
+    def writer(self, name):
+        def write(payloads):
+            self.calls.append((name, payloads))
+        return write
+
+    def hold(self):
+        # Keep the worker busy so that the next submissions pile up behind this one
+        started = threading.Event()
+
+        def wait(payloads):
+            started.set()
+            self.release.wait()
+        self.worker.submit('hold', None, wait)
+        started.wait()
+
+    def test_consecutive_items_with_one_key_are_coalesced(self):
+        self.hold()
+        for line in ('a', 'b', 'c'):
+            self.worker.submit('journal', line, self.writer('journal'))
+        self.worker.submit('file', 'rows', self.writer('file'))
+        self.worker.submit('journal', 'd', self.writer('journal'))
+        self.release.set()
+        self.worker.flush()
+        self.assertEqual(self.calls, [('journal', ['a', 'b', 'c']), ('file', ['rows']), ('journal', ['d'])])
+
+    def test_completions_and_errors_are_delivered_by_poll(self):
+        done, errors = [], []
+        self.worker.on_error = errors.append
+
+        def fail(payloads):
+            raise OSError('disk full')
+        self.worker.submit('ok', 1, self.writer('ok'), on_done=done.append)
+        self.worker.submit('bad', 2, fail, on_done=done.append)
+        self.worker.flush()
+        self.assertEqual(done, [])  # Nothing runs on the caller's thread until poll()
+        self.worker.poll()
+        self.assertEqual(done[0], None)
+        self.assertIsInstance(done[1], OSError)
+        self.assertEqual([str(error) for error in errors], ['disk full'])
+
+
+if __name__ == '__main__':
+    unittest.main()
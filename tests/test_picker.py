@@ -0,0 +1,49 @@
+import unittest
+
+from tests.support import app
+
+
+class PrefixIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.store = app.RecordStore(app.CUSTOMER_COLUMNS)
+        for row_data in (['c1', 'Ada', 'Lovelace', '1 Main St', '555-0100', 'ada@example.com'],
+                         ['c2', 'Alan', 'Turing', '2 Main St', '555-0199', 'alan@example.com'],
+                         ['c3', 'Grace', 'Hopper', '3 Main St', '(555) 0200', 'grace@example.com']):
+            self.store.add(row_data)
+        self.index = app.PrefixIndex(self.store, app.CUSTOMER_SEARCH_COLUMNS, app.customer_search_terms)
+
+    def test_names_email_and_phone(self):
+        self.assertEqual(self.index.search('a'), ['c1', 'c2'])
+        self.assertEqual(self.index.search('Hopper G'), ['c3'])
+        self.assertEqual(self.index.search('grace h'), ['c3'])
+        self.assertEqual(self.index.search('alan@'), ['c2'])
+        self.assertEqual(self.index.search('555-01'), ['c1', 'c2'])
+        self.assertEqual(self.index.search('5550200'), ['c3'])
+        self.assertEqual(self.index.search('zz'), [])
+
+    def test_limit_counts_records_not_terms(self):
+        # "ada lovelace" and "ada@example.com" are two terms of the same customer
+        self.assertEqual(self.index.search('a', limit=1), ['c1'])
+        self.assertEqual(self.index.search('ada'), ['c1'])
+
+    def test_follows_store_changes(self):
+        self.index.search('a')
+        self.store.add(['c4', 'Alonzo', 'Church', '4 Main St', '555-0300', 'alonzo@example.com'])
+        self.store.update('c1', {'ID': 'c10', 'First Name': 'Augusta'})
+        self.store.delete('c2')
+        self.assertEqual(self.index.search('a'), ['c10', 'c4'])  # By term: ada@example.com first
+        self.assertEqual(self.index.search('ada'), ['c10'])  # The e-mail is unchanged
+        self.assertEqual(self.index.search('turing'), [])
+
+    def test_bulk_additions_are_merged(self):
+        self.index.search('a')
+        for number in range(app.PREFIX_MERGE_THRESHOLD + 1):
+            self.store.add([f'b{number}', 'Bulk', f'Customer {number:05}', '', '', ''])
+        self.assertEqual(len(self.index.pending), 3 * (app.PREFIX_MERGE_THRESHOLD + 1))
+        self.assertEqual(self.index.search('customer 0000'), [f'b{number}' for number in range(10)])
+        self.assertEqual(self.index.pending, [])
+        self.assertEqual(self.index.keys, sorted(self.index.keys))
+
+
+if __name__ == '__main__':
+    unittest.main()
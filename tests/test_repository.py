@@ -0,0 +1,81 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from tests.support import app
+
+
+class RepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory.name)
+        with open(app.DATA_FILE, 'w', newline='') as file:
+            file.write('1,Heat,1995,Michael Mann,8.3,Crime,Available\n'
+                       '2,Alien,1979,Ridley Scott,8.5,Horror,Available\n')
+        with open(app.CUSTOMER_DATA_FILE, 'w', newline='') as file:
+            file.write('c1,Ada,Lovelace,1 Main St,555-0100,ada@example.com\n')
+        self.repository = app.Repository()
+
+    def tearDown(self):
+        self.repository.close()
+        self.repository.ledger.close()
+        os.chdir(self.previous_directory)
+        self.directory.cleanup()
+
+    def test_every_watcher_gets_the_load(self):
+        seen = {'first': [], 'second': [], 'done': []}
+        loader = self.repository.video_loader
+        loader.watch(seen['first'].extend, lambda: seen['done'].append('first'))
+        loader.watch(seen['second'].extend, lambda: seen['done'].append('second'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.repository.start_loading()
+        self.assertEqual(seen['first'], ['1', '2'])
+        self.assertEqual(seen['second'], ['1', '2'])
+        self.assertEqual(seen['done'], ['first', 'second'])
+        self.assertEqual(self.repository.customer_data.value('c1', 'First Name'), 'Ada')
+
+    def test_one_store_for_every_subscriber(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.repository.start_loading()
+        events = []
+        self.repository.video_data.subscribe(lambda event, video_id, old, new: events.append((event, video_id)))
+        self.repository.ledger.rent('2', 'c1')
+        self.repository.video_data.update('2', {'ID': '20'})
+        self.assertEqual(events, [('update', '2')])
+        self.assertTrue(self.repository.ledger.is_rented_by('c1', '20'))
+        self.assertEqual(self.repository.video_search_index.search('alien'), ['20'])
+
+    def test_rent_and_return_many(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.repository.start_loading()
+        self.repository.video_data.set_value('1', 'Status', 'Rented')  # Rented before the ledger
+        rented, failures = self.repository.rent_many('c1', ['2', '1', '2', '9'])
+        self.assertEqual(rented, ['2'])
+        self.assertEqual(failures, [('1', "This movie is already rented."),
+                                    ('9', "The selected movie no longer exists.")])
+        with self.assertRaises(ValueError):
+            self.repository.rent_many('c9', ['2'])
+
+        returned, failures = self.repository.return_many(['1', '2', '2', '9'])
+        self.assertEqual(returned, ['1', '2'])
+        self.assertEqual(failures, [('9', "No video has this ID.")])
+        self.assertFalse(self.repository.ledger.is_rented('2'))
+        self.assertEqual(self.repository.video_data.value('1', 'Status'), 'Available')
+
+    def test_single_rental_and_return(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.repository.start_loading()
+        rental = self.repository.rent('c1', '2')
+        with self.assertRaises(ValueError):
+            self.repository.rent('c1', '2')
+        self.assertEqual(self.repository.return_video('2'), rental)
+        with self.assertRaisesRegex(ValueError, "not rented"):
+            self.repository.return_video('2')
+        self.assertEqual(self.repository.video_data.value('2', 'Status'), 'Available')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from tests.support import app
+
+
+class NgramIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.store = app.RecordStore(['ID', 'Name', 'Director'])
+        self.index = app.NgramIndex(('Name', 'Director'))
+        self.store.subscribe(self.index.on_change)
+        self.store.add(['1', 'The Godfather', 'Francis Ford Coppola'])
+        self.store.add(['2', 'Godzilla', 'Ishiro Honda'])
+        self.store.add(['3', 'Up', 'Pete Docter'])
+
+    def test_substring_search(self):
+        self.assertEqual(self.index.search('GOD'), ['1', '2'])
+        self.assertEqual(self.index.search('father'), ['1'])
+        self.assertEqual(self.index.search('dfa'), ['1'])  # Spans a word boundary
+        self.assertEqual(self.index.search('coppola', fields=('Name',)), [])
+        self.assertEqual(self.index.search('xyz'), [])
+
+    def test_short_queries_scan_the_texts(self):
+        self.assertEqual(self.index.search('up'), ['3'])
+        self.assertEqual(self.index.search('o'), ['1', '2', '3'])
+
+    def test_follows_store_changes(self):
+        self.store.update('2', {'ID': '20', 'Name': 'Mothra'})
+        self.assertEqual(self.index.search('god'), ['1'])
+        self.assertEqual(self.index.search('moth'), ['20'])
+        self.assertEqual(self.index.search('honda'), ['20'])
+        self.store.delete('1')
+        self.assertEqual(self.index.search('coppola'), [])
+        self.store.add(['4', 'God Told Me To', 'Larry Cohen'])
+        self.assertEqual(self.index.search('god'), ['4'])
+
+    def test_one_record_matches_as_search_would(self):
+        self.store.update('2', {'ID': '20'})
+        for query in ('GOD', 'father', 'o', 'honda', 'xyz'):
+            self.assertEqual([record_id for record_id in ('1', '20', '3') if self.index.matches(record_id, query)],
+                             self.index.search(query), query)
+        self.assertFalse(self.index.matches('2', 'god'))  # Renamed
+        self.assertFalse(self.index.matches('1', 'coppola', fields=('Name',)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from tests.support import app
+
+
+class SortIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.store = app.RecordStore(app.VIDEO_COLUMNS, types=app.VIDEO_COLUMN_TYPES)
+        for row_data in (['10', 'Heat', '1995', 'Michael Mann', '8.3', 'Crime', 'Available'],
+                         ['9', 'Alien', '1979', 'Ridley Scott', '8.5', 'Horror', 'Rented'],
+                         ['100', 'Up', '2009', 'Pete Docter', '8.3', 'Family', 'Available'],
+                         ['2', 'Ran', '1985', 'Akira Kurosawa', '8.2', 'Drama', 'Available']):
+            self.store.add(row_data)
+        self.index = app.SortIndex(self.store, {'ID': app.natural_key})
+
+    def check(self, sort_keys, subset=None):
+        # The cached permutation must give the same order as sorting from scratch
+        ids = subset if subset is not None else self.store.ids()
+        expected = sorted(ids, key=self.store.ids().index)
+        for column, ascending in reversed(sort_keys):
+            expected.sort(key=lambda record_id: self.index.sort_key(column, self.store.value(record_id, column)),
+                          reverse=not ascending)
+        self.assertEqual(self.index.sorted_ids(sort_keys, subset), expected)
+        return expected
+
+    def test_typed_and_natural_order(self):
+        self.assertEqual(self.check([('ID', True)]), ['2', '9', '10', '100'])
+        self.assertEqual(self.check([('Year', False)]), ['100', '10', '2', '9'])
+
+    def test_ties_keep_catalog_order_in_both_directions(self):
+        self.assertEqual(self.index.ordered_ids('Rating', False), ['9', '10', '100', '2'])
+        self.assertEqual(self.check([('Status', True), ('Rating', False)]), ['10', '100', '2', '9'])
+
+    def test_follows_store_changes(self):
+        self.index.sorted_ids([('Year', True)])
+        self.store.add(['3', 'Jaws', '1975', 'Steven Spielberg', '8.1', 'Thriller', 'Available'])
+        self.store.update('10', {'ID': '1', 'Year': 1960})
+        self.store.delete('9')
+        self.assertEqual(self.check([('Year', True)]), ['1', '3', '2', '100'])
+        self.assertEqual(self.check([('ID', False)]), ['100', '3', '2', '1'])
+
+    def test_subset(self):
+        self.assertEqual(self.check([('Name', True)], ['100', '2']), ['2', '100'])
+        self.assertEqual(self.check([('Year', True)], ['100', '9', '2']), ['9', '2', '100'])
+
+
+if __name__ == '__main__':
+    unittest.main()
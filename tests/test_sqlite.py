@@ -0,0 +1,86 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from tests.support import app
+
+
+class SQLiteStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, 'store.db')
+        self.text_path = os.path.join(self.directory.name, 'video.txt')
+        with open(self.text_path, 'w', newline='') as file:
+            file.write('1,Heat,1995,Michael Mann,8.3,Crime,Available\n'
+                       '2,"Crouching Tiger, Hidden Dragon",2000,Ang Lee,7.9,Action,Rented\n')
+        self.storages = []
+
+    def tearDown(self):
+        for storage in self.storages:
+            storage.close()
+        self.directory.cleanup()
+
+    def open_storage(self, migrate_from=None):
+        store = app.RecordStore(app.VIDEO_COLUMNS, unique_keys=('Name',))
+        storage = app.SQLiteStorage(self.database, 'videos', store, indexed=('Genre',), migrate_from=migrate_from)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            storage.load()
+        self.storages.append(storage)
+        self.output = output.getvalue()
+        return store, storage
+
+    def records(self, store):
+        return {record_id: store.get(record_id) for record_id in store}
+
+    def test_migrates_the_text_file_once(self):
+        store, storage = self.open_storage(self.text_path)
+        self.assertIn('Migrated 2 rows', self.output)
+        self.assertEqual(store.value('2', 'Name'), 'Crouching Tiger, Hidden Dragon')
+        store.delete('1')
+
+        reopened, _ = self.open_storage(self.text_path)
+        self.assertEqual(self.output, '')
+        self.assertEqual(reopened.ids(), ['2'])
+
+    def test_changes_are_written_through(self):
+        store, storage = self.open_storage(self.text_path)
+        store.add(['3', 'Up', '2009', 'Pete Docter', '8.2', 'Family', 'Available'])
+        store.update('2', {'ID': '20', 'Status': 'Available'})
+        store.delete('1')
+        storage.save()
+
+        reopened, _ = self.open_storage()
+        self.assertEqual(self.records(reopened), self.records(store))
+        self.assertEqual(reopened.ids(), ['20', '3'])
+
+    def test_transaction_is_rolled_back_on_error(self):
+        store, storage = self.open_storage(self.text_path)
+        with self.assertRaises(app.DuplicateKeyError):
+            with storage.transaction():
+                store.update('1', {'Status': 'Rented'})
+                store.update('2', {'ID': '20'})
+                store.delete('20')
+                store.add(['3', 'Up', '2009', 'Pete Docter', '8.2', 'Family', 'Available'])
+                store.add(['4', 'Heat', '1995', 'Michael Mann', '8.3', 'Crime', 'Available'])
+
+        # The store is put back as it was, and matches the database
+        self.assertEqual(store.value('1', 'Status'), 'Available')
+        self.assertEqual(store.ids(), ['1', '2'])
+        reopened, _ = self.open_storage()
+        self.assertEqual(self.records(reopened), self.records(store))
+        store.update('1', {'Status': 'Rented'})  # Later changes are written as usual
+        storage.save()
+        self.assertEqual(self.open_storage()[0].value('1', 'Status'), 'Rented')
+
+    def test_query_ids(self):
+        store, storage = self.open_storage(self.text_path)
+        store.add(['3', 'Collateral', '2004', 'Michael Mann', '7.5', 'Crime', 'Available'])
+        self.assertEqual(storage.query_ids('"Genre" = ?', ('Crime',)), ['1', '3'])
+        self.assertEqual(storage.query_ids(order_by='Name'), ['3', '2', '1'])
+        self.assertEqual(storage.query_ids(order_by='Year', ascending=False), ['3', '2', '1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
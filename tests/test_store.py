@@ -0,0 +1,86 @@
+import unittest
+
+from tests.support import app
+
+
+class RecordStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = app.RecordStore(['ID', 'Name', 'Genre'], unique_keys=('Name',))
+        self.store.add(['1', 'Heat', 'Crime'])
+        self.store.add({'ID': '2', 'Name': 'Alien', 'Genre': 'Horror'})
+        self.store.add(['3', 'Up', 'Family'])
+
+    def test_lookups(self):
+        self.assertEqual(self.store.ids(), ['1', '2', '3'])
+        self.assertEqual(self.store.get('2'), {'ID': '2', 'Name': 'Alien', 'Genre': 'Horror'})
+        self.assertEqual(self.store.value('3', 'Genre'), 'Family')
+        self.assertEqual(self.store.find('Name', 'Heat'), '1')
+        self.assertIsNone(self.store.find('Name', 'Jaws'))
+        self.assertIsNone(self.store.get('4'))
+
+    def test_unique_keys(self):
+        with self.assertRaises(app.DuplicateKeyError):
+            self.store.add(['1', 'Jaws', 'Thriller'])
+        with self.assertRaises(app.DuplicateKeyError):
+            self.store.update('3', {'Name': 'Heat'})
+        with self.assertRaises(ValueError):
+            self.store.add(['', 'Jaws', 'Thriller'])
+        self.assertEqual(len(self.store), 3)
+
+    def test_update_moves_the_indexes(self):
+        self.assertEqual(self.store.update('2', {'ID': '20', 'Name': 'Aliens'}), '20')
+        self.assertNotIn('2', self.store)
+        self.assertEqual(self.store.find('Name', 'Aliens'), '20')
+        self.assertIsNone(self.store.find('Name', 'Alien'))
+        self.assertEqual(self.store.ids(), ['1', '20', '3'])
+
+    def test_delete_and_compact(self):
+        self.store.delete('2')
+        self.assertEqual(self.store.ids(), ['1', '3'])
+        self.assertEqual(len(self.store), 2)
+        self.assertIsNone(self.store.find('Name', 'Alien'))
+        self.store.compact()
+        self.assertEqual(list(self.store.rows()), [['1', 'Heat', 'Crime'], ['3', 'Up', 'Family']])
+        self.assertEqual(self.store.find('Name', 'Up'), '3')
+
+
+class ColumnTest(unittest.TestCase):
+    def test_dictionary_column_widens_its_codes(self):
+        column = app.DictionaryColumn(['Drama', 'Crime', 'Drama'])
+        self.assertEqual(column.dictionary, [None, 'Drama', 'Crime'])
+        self.assertEqual(column.codes.typecode, 'B')
+        for number in range(300):
+            column.append(f'Director {number}')
+        self.assertEqual(column.codes.typecode, 'H')
+        self.assertEqual(column[0], 'Drama')
+        self.assertEqual(column[302], 'Director 299')
+        column[1] = None
+        self.assertEqual(list(column.take([0, 1, 2]).codes), [1, 0, 1])
+
+    def test_snapshot_is_not_changed_by_later_writes(self):
+        column = app.DictionaryColumn(['Available', 'Rented'])
+        numbers = app.NumberColumn(float, [8.3, 7.9])
+        copies = column.snapshot(), numbers.snapshot()
+        column[0] = 'Rented'
+        column.append('Lost')
+        numbers[1] = 1.0
+        self.assertEqual(list(copies[0]), ['Available', 'Rented'])
+        self.assertEqual(list(copies[1]), [8.3, 7.9])
+
+    def test_typed_store(self):
+        store = app.RecordStore(app.VIDEO_COLUMNS, unique_keys=('Name',), types=app.VIDEO_COLUMN_TYPES,
+                                categorical=app.VIDEO_CATEGORICAL_COLUMNS)
+        store.add(['1', 'Heat', '1995', 'Michael Mann', '8.3', 'Crime', 'Available'])
+        self.assertEqual(store.get('1')['Year'], 1995)
+        self.assertIsInstance(store.columns['Year'], app.NumberColumn)
+        self.assertIsInstance(store.columns['Genre'], app.DictionaryColumn)
+        with self.assertRaises(ValueError):
+            store.add(['2', 'Alien', 'nineteen', 'Ridley Scott', '8.5', 'Horror', 'Available'])
+        with self.assertRaises(ValueError):
+            store.update('1', {'Rating': 'good'})
+        self.assertEqual(store.value('1', 'Rating'), 8.3)
+        self.assertEqual(len(store), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
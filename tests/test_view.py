@@ -0,0 +1,170 @@
+import itertools
+import unittest
+
+from tests.support import app
+
+
+class FakeTreeview:
+    # The few ttk.Treeview calls VirtualTreeview makes, without a display
+    def __init__(self, height=3):
+        self.height = height
+        self.children = []  # Attached items, in order
+        self.values = {}
+        self.selected = []
+        self.ids = itertools.count()
+        self.idle = {}  # Pending after_idle callbacks
+
+    def after_idle(self, callback):
+        timer = f"after#{next(self.ids)}"
+        self.idle[timer] = callback
+        return timer
+
+    def after_cancel(self, timer):
+        self.idle.pop(timer, None)
+
+    def run_idle(self):
+        idle, self.idle = self.idle, {}
+        for callback in idle.values():
+            callback()
+
+    def cget(self, option):
+        return self.height
+
+    def bind(self, *args, **kwargs):
+        pass
+
+    def configure(self, **options):
+        pass
+
+    def insert(self, parent, index, values=()):
+        iid = f"I{next(self.ids)}"
+        self.children.insert(index, iid)
+        self.values[iid] = list(values)
+        return iid
+
+    def delete(self, *iids):
+        for iid in iids:
+            self.detach(iid)
+            del self.values[iid]
+
+    def detach(self, *iids):
+        for iid in iids:
+            self.children.remove(iid)
+        self.selected = [iid for iid in self.selected if iid not in iids]
+
+    def move(self, iid, parent, index):
+        if iid in self.children:
+            self.children.remove(iid)
+        self.children.insert(index, iid)
+
+    def get_children(self, parent=''):
+        return tuple(self.children)
+
+    def item(self, iid, values=()):
+        self.values[iid] = list(values)
+
+    def selection(self):
+        return tuple(self.selected)
+
+    def selection_set(self, iids):
+        self.selected = list(iids)
+
+    def selection_add(self, iids):
+        self.selected += [iid for iid in iids if iid not in self.selected]
+
+    def yview_moveto(self, fraction):
+        pass
+
+    def yview_scroll(self, number, what):
+        pass
+
+
+class FakeScrollbar:
+    def configure(self, **options):
+        pass
+
+    def set(self, first, last):
+        pass
+
+
+class VirtualTreeviewTest(unittest.TestCase):
+    def setUp(self):
+        self.store = app.RecordStore(['ID', 'Name', 'Status'])
+        for row_data in (['1', 'Heat', 'Available'], ['2', 'Alien', 'Rented'], ['3', 'Ran', 'Available'],
+                         ['4', 'Up', 'Rented'], ['5', 'Jaws', 'Available']):
+            self.store.add(row_data)
+        self.tree = FakeTreeview()
+        self.view = app.VirtualTreeview(self.tree, FakeScrollbar(), self.store.values, virtual=True, overscan=1)
+
+    def shown(self):
+        # The names on the materialized items, in order
+        return [self.tree.values[iid][1] for iid in self.tree.children]
+
+    def follow(self, shows=None):
+        # Like VideoInfoApp.on_video_changed, for a view narrowed by `shows` (or not at all)
+        def on_change(event, record_id, old_record, new_record):
+            shown = None if shows is None or new_record is None else shows(new_record)
+            self.view.apply_change(event, record_id, old_record, new_record, shown=shown)
+        self.store.subscribe(on_change)
+
+    def test_follows_the_whole_catalog(self):
+        self.follow()
+        self.view.set_rows(self.store.ids())
+        self.store.update('1', {'Name': 'Heat!'})
+        self.store.update('2', {'ID': '20'})
+        self.store.delete('3')
+        self.store.add(['6', 'Dune', 'Available'])
+        self.tree.run_idle()
+        self.assertEqual(self.view.rows, ['1', '20', '4', '5', '6'])
+        self.assertEqual(self.shown(), ['Heat!', 'Alien', 'Up', 'Jaws'])  # One page plus the overscan
+
+    def test_rows_start_and_stop_matching_the_filter(self):
+        rented = app.Equals('Status', 'Rented')
+        self.follow(rented.matches_record)
+        self.view.set_rows(app.FilterEngine(self.store, use_numpy=False).query(rented))
+        self.store.update('1', {'Status': 'Rented'})  # Now matches
+        self.store.update('2', {'Status': 'Available'})  # No longer matches
+        self.store.update('4', {'ID': '40'})  # Still matches, under a new ID
+        self.store.update('3', {'Name': 'Ran!'})  # Still does not match
+        self.store.add(['6', 'Dune', 'Available'])
+        self.store.add(['7', 'Big', 'Rented'])
+        self.tree.run_idle()
+        self.assertEqual(self.view.rows, ['40', '1', '7'])
+        self.assertEqual(self.shown(), ['Up', 'Heat', 'Big'])
+
+    def test_removals_are_dropped_in_one_pass(self):
+        self.follow()
+        self.view.set_rows(self.store.ids())
+        for record_id in ('1', '3', '5'):
+            self.store.delete(record_id)
+        self.assertEqual(len(self.tree.idle), 1)  # One render for the burst
+        self.assertFalse(self.view.contains('3'))
+        self.store.update('4', {'ID': '40'})
+        self.store.add(['3', 'Ran again', 'Available'])  # Back before the old row was dropped
+        self.tree.run_idle()
+        self.assertEqual(self.view.rows, ['2', '40', '3'])
+        self.assertEqual(self.shown(), ['Alien', 'Up', 'Ran again'])
+        self.assertEqual([self.view.position(key) for key in self.view.rows], [0, 1, 2])
+
+    def test_rows_appended_directly_are_found(self):
+        # As on_rows_loaded does while the catalog streams in
+        self.view.set_rows(['1', '2'])
+        self.view.rows.extend(['3', '4'])
+        self.assertEqual(self.view.position('4'), 3)
+        self.view.rename_row('3', '30')
+        self.assertEqual(self.view.rows, ['1', '2', '30', '4'])
+        self.assertEqual(self.view.position('30'), 2)
+        self.assertIsNone(self.view.position('3'))
+
+    def test_selection_follows_renames_and_removals(self):
+        self.follow()
+        self.view.set_rows(self.store.ids())
+        self.view.set_selection(['2', '5', '3'])
+        self.store.update('2', {'ID': '20'})
+        self.store.delete('3')
+        self.tree.run_idle()
+        self.assertEqual(self.view.selected_keys(), ['20', '5'])
+
+
+if __name__ == '__main__':
+    unittest.main()